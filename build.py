@@ -0,0 +1,104 @@
+"""Build the offline exception index shipped with wtpython.
+
+The index combines the builtin exception hierarchy and docstrings with the
+common causes in `wtpython/data/exception_notes.toml`. Message templates
+are compiled to regular expressions here so looking up an error at runtime
+is a dictionary access and a few regex matches.
+
+The index is committed and shipped as package data. Run this after
+editing the notes, with the newest supported Python so the hierarchy
+includes every builtin exception:
+    $ python build.py
+
+Older interpreters never raise the newer exceptions, so they don't look
+them up.
+"""
+from __future__ import annotations
+
+import builtins
+import importlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Iterator
+
+import toml
+
+DATA_DIR = Path(__file__).resolve().parent / "wtpython" / "data"
+NOTES_LOCATION = DATA_DIR / "exception_notes.toml"
+INDEX_LOCATION = DATA_DIR / "exception_index.json"
+INDEX_VERSION = 1
+DOCS_URL = "https://docs.python.org/3/library/exceptions.html#{name}"
+
+# Exceptions outside of builtins that are common enough to document.
+EXTRA_EXCEPTIONS = {
+    "JSONDecodeError": ("json", "https://docs.python.org/3/library/json.html#json.JSONDecodeError"),
+}
+
+
+def exception_classes() -> Iterator[tuple[type, str]]:
+    """Yield exception classes and the url of their documentation."""
+    for name in dir(builtins):
+        obj = getattr(builtins, name)
+        if isinstance(obj, type) and issubclass(obj, BaseException):
+            yield obj, DOCS_URL.format(name=name)
+
+    for name, (module, url) in EXTRA_EXCEPTIONS.items():
+        yield getattr(importlib.import_module(module), name), url
+
+
+def template_to_pattern(template: str) -> str:
+    """Convert a message template to a regular expression.
+
+    `{name}` becomes a named group and `{}` matches anything.
+
+    Args:
+        template: The message template.
+
+    Returns:
+        The regular expression matching the whole message.
+    """
+    pattern = ""
+    for literal, field in re.findall(r"([^{]*)(\{\w*\})?", template):
+        pattern += re.escape(literal)
+        if field == "{}":
+            pattern += ".*?"
+        elif field:
+            pattern += f"(?P<{field[1:-1]}>.+?)"
+    return pattern + r"\Z"
+
+
+def build_index() -> dict[str, Any]:
+    """Build the exception index."""
+    notes = toml.loads(NOTES_LOCATION.read_text(encoding="utf-8"))
+    exceptions = {}
+    for cls, url in exception_classes():
+        name = cls.__name__
+        entry = notes.get(name, {})
+        exceptions[name] = {
+            "bases": [base.__name__ for base in cls.__mro__[1:] if base is not object],
+            "doc": (cls.__doc__ or "").strip(),
+            "url": url,
+            "causes": entry.get("causes", "").strip(),
+            "notes": [
+                {
+                    "template": note["template"],
+                    "pattern": template_to_pattern(note["template"]),
+                    "causes": note["causes"].strip(),
+                }
+                for note in entry.get("notes", [])
+            ],
+        }
+
+    return {"version": INDEX_VERSION, "exceptions": exceptions}
+
+
+def write_index() -> None:
+    """Write the compact exception index."""
+    index = build_index()
+    INDEX_LOCATION.write_text(json.dumps(index, separators=(",", ":"), sort_keys=True), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    write_index()
+    print(f"Wrote {INDEX_LOCATION}")
@@ -0,0 +1,137 @@
+"""Tests for saving results to bundles and opening them again."""
+import time
+import zlib
+from pathlib import Path
+
+import pytest
+
+from wtpython import formatters
+from wtpython.backends import Results, Trace
+from wtpython.backends.bundle import (
+    HEADER, MAGIC, VERSION, load_bundle, save_bundle
+)
+from wtpython.backends.exception_docs import (
+    ExceptionDocs, ExceptionDocsQuestion
+)
+from wtpython.backends.stackoverflow import (
+    StackOverflowAnswer, StackOverflowQuestion
+)
+from wtpython.backends.store import JSON_ZLIB
+
+
+def raise_error() -> Trace:
+    """Raise and catch an error to get a trace with frames."""
+    try:
+        raise KeyError("missing")
+    except KeyError as e:
+        return Trace(e)
+
+
+def make_results(count: int) -> Results:
+    """Create results with a question and an answer per item."""
+    results = Results("KeyError")
+    for ix in range(count):
+        question = StackOverflowQuestion(ix, {
+            "question_id": ix,
+            "score": ix,
+            "title": f"Question {ix}",
+            "link": f"https://example.com/q/{ix}",
+            "answer_count": 1,
+            "is_answered": True,
+            "body": "<p>Why does <code>d['x']</code> fail?</p><pre><code>d = {}\nd['x']</code></pre>" * 5,
+        })
+        question.answers = [StackOverflowAnswer({
+            "score": 1,
+            "is_accepted": True,
+            "body": "<p>Use <code>d.get('x')</code>.</p>" * 5,
+        })]
+        results.questions.append(question)
+    return results
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    """The trace and the rendered posts are restored."""
+    trace = raise_error()
+    results = make_results(3)
+    results.fallbacks = ["stackoverflow"]
+    path = tmp_path / "error.wtpb"
+
+    assert save_bundle(path, trace, results) == path.stat().st_size
+
+    bundle = load_bundle(path)
+    assert bundle.trace.error == "KeyError: 'missing'"
+    assert bundle.trace.traceback == trace.traceback
+    assert bundle.trace.rich_traceback.trace == trace.rich_traceback.trace
+    assert bundle.results.fallbacks == ["stackoverflow"]
+    assert [q.posts() for q in bundle.results.questions] == [q.posts() for q in results.questions]
+    assert bundle.search_engine.query == trace.error
+
+
+def test_docs_and_pinned_solution_are_kept(tmp_path: Path) -> None:
+    """The documentation entry and the pinned solution are restored."""
+    trace = raise_error()
+    results = make_results(2)
+    docs = ExceptionDocs.lookup(trace.etype_hierarchy, trace.message)
+    assert docs is not None
+    results.questions.append(ExceptionDocsQuestion(2, docs))
+    results.pin(results.questions[1])
+    path = tmp_path / "error.wtpb"
+    save_bundle(path, trace, results)
+
+    bundle = load_bundle(path)
+    docs_question = bundle.results.questions[2]
+    assert isinstance(docs_question, ExceptionDocsQuestion)
+    assert docs_question.source_label == ""
+    assert docs_question.no_display() == results.questions[2].no_display()
+    assert bundle.pinned is bundle.results.questions[0]
+    assert bundle.pinned.title == "Question 1"
+    assert [q.pinned for q in bundle.results.questions] == [True, False, False]
+
+
+def test_open_does_not_convert(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Opening a large bundle needs no Markdown conversion."""
+    path = tmp_path / "error.wtpb"
+    save_bundle(path, raise_error(), make_results(500))
+
+    def convert(*args: object) -> str:
+        raise AssertionError("posts were converted again")
+
+    monkeypatch.setattr(formatters.PythonCodeConverter, "convert", convert)
+    monkeypatch.setattr(formatters.StreamingMarkdownConverter, "convert", convert)
+    bundle = load_bundle(path)
+    assert sum(len(q.posts()) for q in bundle.results.questions) == 1000
+
+
+@pytest.mark.slow
+def test_open_is_fast(tmp_path: Path) -> None:
+    """A large bundle opens in well under a second."""
+    path = tmp_path / "error.wtpb"
+    save_bundle(path, raise_error(), make_results(500))
+
+    start = time.perf_counter()
+    bundle = load_bundle(path)
+    assert sum(len(q.posts()) for q in bundle.results.questions) == 1000
+    assert time.perf_counter() - start < 0.5
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "not a wtpython bundle"),
+    (b"PK\x03\x04" + bytes(20), "not a wtpython bundle"),
+    (b"WTPB\x63\x01\x00\x00", "another version"),
+    (b"WTPB\x01\x00\x00\x00garbage", "damaged"),
+])
+def test_invalid_bundles(tmp_path: Path, data: bytes, message: str) -> None:
+    """Files that are not bundles are rejected with a message."""
+    path = tmp_path / "error.wtpb"
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match=message):
+        load_bundle(path)
+
+
+@pytest.mark.parametrize("contents", [b"{}", b'{"trace": null}', b"[1, 2]"])
+def test_malformed_contents(tmp_path: Path, contents: bytes) -> None:
+    """Valid headers followed by unexpected contents are rejected with a message."""
+    path = tmp_path / "error.wtpb"
+    path.write_bytes(HEADER.pack(MAGIC, VERSION, JSON_ZLIB) + zlib.compress(contents))
+    with pytest.raises(ValueError, match="damaged"):
+        load_bundle(path)
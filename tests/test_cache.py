@@ -0,0 +1,396 @@
+"""Tests for the request cache."""
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Type
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+from requests import Response
+
+from wtpython.backends import StackOverflow, Trace, cache
+from wtpython.backends.cache import (
+    CachedResponse, LatencyTracker, RateLimiter, atomic_write, hedged
+)
+from wtpython.backends.knowledge import StackExchangeBackend
+from wtpython.backends.warm import WarmReport, load_signatures
+
+
+def test_rate_limiter_spaces_requests() -> None:
+    """Requests are spaced by the limiter's interval."""
+    limiter = RateLimiter(rate=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    assert time.monotonic() - start >= 4 / 20
+
+
+def test_rate_limiter_pause() -> None:
+    """A backoff delays the next request."""
+    limiter = RateLimiter(rate=1000)
+    limiter.pause(0.2)
+    start = time.monotonic()
+    limiter.wait()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_backoff_is_read_from_the_decoded_payload(
+    server: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A response asking for a backoff delays the next request, and is decoded once."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    monkeypatch.setattr(SlowHandler, "body", {"items": [], "backoff": 0.2})
+    decoded: list = []
+    decode = Response.json
+
+    def counted_decode(response: Response) -> dict:
+        decoded.append(response)
+        return decode(response)
+
+    monkeypatch.setattr(Response, "json", counted_decode)
+    limiter = RateLimiter(rate=1000)
+    response = CachedResponse()
+    response.api_session.limiter = limiter
+
+    assert response.fetch_items(server, {"q": "x"}) == []
+    assert len(decoded) == 1
+    start = time.monotonic()
+    limiter.wait()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_load_signatures(tmp_path: Path) -> None:
+    """Comments, blank lines and duplicates are skipped."""
+    path = tmp_path / "errors.txt"
+    path.write_text("# comment\nKeyError: 0\n\nKeyError: 0\nStopIteration\n")
+    assert load_signatures(path) == ["KeyError: 0", "StopIteration"]
+    assert len(load_signatures()) > 50
+
+
+def test_warm_report() -> None:
+    """Coverage counts signatures with results; failures are listed."""
+    report = WarmReport({"a": 3, "b": 0, "c": None, "d": 1}, bytes_stored=10)
+    assert report.covered == ["a", "d"]
+    assert report.failed == ["c"]
+    assert report.coverage == 0.5
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Answer every request slowly and count the requests."""
+
+    requests = 0
+    body: dict = {"items": []}
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Answer with a small JSON document."""
+        SlowHandler.requests += 1
+        time.sleep(0.3)
+        body = json.dumps(self.body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Keep the test output clean."""
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    """Run a local HTTP server and return its url."""
+    SlowHandler.requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/search"
+    httpd.shutdown()
+
+
+def test_concurrent_identical_requests_are_coalesced(
+    server: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Concurrent misses for the same key produce one request."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+
+    def fetch(_: int) -> bool:
+        return CachedResponse().session.get(server, params={"q": "x"}).json() == {"items": []}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(pool.map(fetch, range(8)))
+    assert SlowHandler.requests == 1
+
+
+def test_atomic_write_replaces_file(tmp_path: Path) -> None:
+    """The file is replaced and no temporary files are left behind."""
+    path = tmp_path / "entry.pkl"
+    atomic_write(path, b"old")
+    atomic_write(path, b"new")
+    assert path.read_bytes() == b"new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_get_items_uses_the_item_store(
+    server: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Items are read from the item store instead of the response cache."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    response = CachedResponse()
+    assert response.get_items(server, {"q": "x"}) == []
+    assert response.get_items(server, {"q": "x"}) == []
+    assert SlowHandler.requests == 1
+    assert len(list(response.store.directory.glob("*.bin"))) == 1
+    assert not list(response.session.cache.responses.keys())
+
+
+def test_hedged_call_uses_the_first_result() -> None:
+    """A slow call is raced by a second call after the delay."""
+    delays = [5, 0]
+
+    def call() -> float:
+        delay = delays.pop(0)
+        time.sleep(delay)
+        return delay
+
+    start = time.monotonic()
+    assert hedged(call, delay=0.1) == 0
+    assert time.monotonic() - start < 1
+
+
+def test_hedged_call_raises_when_all_calls_fail() -> None:
+    """The error is raised once every call has failed."""
+    def call() -> None:
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        hedged(call, delay=0.01)
+
+
+def test_latency_percentile(tmp_path: Path) -> None:
+    """The default is used until enough response times are recorded."""
+    latency = LatencyTracker(tmp_path / "latency.json", size=20, default=1.5)
+    assert latency.percentile(95) == 1.5
+    for seconds in range(1, 21):
+        latency.record(seconds / 10)
+    assert latency.percentile(95) == 2.0
+    assert latency.percentile(50) == 1.1
+
+
+def test_concurrent_response_times_are_all_recorded(tmp_path: Path) -> None:
+    """Requests finishing at the same time don't overwrite each other's response times."""
+    latency = LatencyTracker(tmp_path / "latency.json")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(latency.record, [0.1] * 50))
+    assert latency.load() == [0.1] * 50
+
+
+def test_cached_only_never_sends_requests(
+    server: str, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Cached-only lookups return nothing instead of sending a request."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    response = CachedResponse()
+    assert response.get_items(server, {"q": "x"}, cached_only=True) == []
+    assert SlowHandler.requests == 0
+
+
+class ActivityHandler(BaseHTTPRequestHandler):
+    """Answer with the posts that had activity since the `min` parameter."""
+
+    posts: list = []
+    queries: list = []
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Answer with the posts newer than `min`, newest first."""
+        query = dict(parse_qsl(urlsplit(self.path).query))
+        ActivityHandler.queries.append(query)
+        since = int(query.get("min", 0))
+        items = sorted(
+            [post for post in self.posts if post["last_activity_date"] >= since],
+            key=lambda post: post["last_activity_date"],
+            reverse=True,
+        )
+        body = json.dumps({"items": items[:int(query.get("pagesize", 30))]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Keep the test output clean."""
+
+
+def test_expired_items_are_refreshed_incrementally(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Only posts with activity since the newest stored post are requested."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    monkeypatch.setattr(cache, "REQUEST_CACHE_DURATION", -1)
+    monkeypatch.setattr(cache, "REQUEST_CACHE_STALE_DURATION", 0)
+    ActivityHandler.posts = [{"answer_id": ix, "body": f"v1 {ix}", "last_activity_date": 100 + ix} for ix in range(3)]
+    ActivityHandler.queries = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ActivityHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_port}/answers"
+    response = CachedResponse()
+
+    try:
+        assert [item["answer_id"] for item in response.get_items(url, {}, incremental="answer_id")] == [2, 1, 0]
+
+        ActivityHandler.posts[0] = {"answer_id": 0, "body": "v2 0", "last_activity_date": 200}
+        items = response.get_items(url, {}, incremental="answer_id")
+        assert [item["body"] for item in items] == ["v2 0", "v1 2", "v1 1"]
+        assert ActivityHandler.queries[-1] == {"sort": "activity", "min": "102"}
+
+        assert response.get_items(url, {}, incremental="answer_id", activity=150) == items
+        assert len(ActivityHandler.queries) == 2
+    finally:
+        httpd.shutdown()
+
+
+def test_merge_changed() -> None:
+    """Changed posts replace stored ones and the newest are kept."""
+    items = [{"id": 1, "last_activity_date": 5}, {"id": 2, "last_activity_date": 3}]
+    changed = [{"id": 2, "last_activity_date": 9}, {"id": 3, "last_activity_date": 7}]
+    assert cache.merge_changed(items, changed, "id", limit=2) == [changed[0], changed[1]]
+    assert cache.latest_activity(items) == 5
+    assert cache.latest_activity([{"id": 1}]) is None
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    """Stack Exchange API answering searches from a fixed list of questions."""
+
+    questions: dict = {}
+    searches: dict = {}
+    paths: list = []
+    answers: dict = {}  # Number of answers of a question, 1 if not set
+    answers_per_page = 100
+    paged = True  # Whether `page` is honoured and `has_more` is sent
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Answer a search or a request for the answers of questions."""
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        SiteHandler.paths.append(url.path)
+        has_more = False
+        if url.path.endswith("/search/advanced"):
+            items = [self.questions[question_id] for question_id in self.searches[query["q"]]]
+        else:
+            ids = url.path.split("/")[-2].split(";")
+            answers = [
+                {"answer_id": int(question_id) * 10 + ix, "question_id": int(question_id), "score": 1,
+                 "is_accepted": True, "body": f"Answer to {question_id}", "last_activity_date": 1}
+                for question_id in ids
+                for ix in range(self.answers.get(int(question_id), 1))
+            ]
+            start = (int(query.get("page", 1)) - 1) * self.answers_per_page if self.paged else 0
+            items = answers[start:start + self.answers_per_page]
+            has_more = self.paged and start + self.answers_per_page < len(answers)
+        body = json.dumps({"items": items, "has_more": has_more}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        """Keep the test output clean."""
+
+
+def test_posts_are_shared_across_queries(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A question returned by several queries is downloaded and stored once."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    SiteHandler.questions = {
+        question_id: {
+            "question_id": question_id, "title": f"Question {question_id}", "link": f"https://so/q/{question_id}",
+            "score": 1, "answer_count": 1, "is_answered": True, "body": "<p>x</p>" * 100, "last_activity_date": 1,
+        }
+        for question_id in (1, 2, 3)
+    }
+    SiteHandler.searches = {"KeyError": [1, 2], "KeyError dict": [1, 3]}
+    SiteHandler.paths = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(StackOverflow, "api", f"http://127.0.0.1:{httpd.server_port}")
+
+    try:
+        first = StackOverflow("KeyError")
+        second = StackOverflow("KeyError dict")
+        assert [q.title for q in second.questions] == ["Question 1", "Question 3"]
+        assert [q.answers[0].data["body"] for q in second.questions] == ["Answer to 1", "Answer to 3"]
+        assert [path for path in SiteHandler.paths if path.endswith("/answers")] == [
+            "/questions/1;2/answers", "/questions/3/answers"
+        ]
+        assert len(list(first.posts.directory.glob("stackoverflow-questions-*.bin"))) == 3
+        for path in first.store.directory.glob("*.bin"):
+            entry = first.store.read(path.stem)
+            assert entry is not None
+            assert all(list(item) == ["question_id", "last_activity_date"] for item in entry.items)
+
+        first.posts.clear()
+        assert StackOverflow("KeyError", cached_only=True).questions == []
+        refreshed = StackOverflow("KeyError")
+        assert [q.title for q in refreshed.questions] == ["Question 1", "Question 2"]
+        assert SiteHandler.paths[-2:] == ["/search/advanced", "/questions/1;2/answers"]
+    finally:
+        httpd.shutdown()
+
+
+@pytest.fixture
+def site(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Type[SiteHandler]]:
+    """Serve two questions, the first with three answers, two answers per page."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    monkeypatch.setattr(SiteHandler, "questions", {
+        question_id: {
+            "question_id": question_id, "title": f"Question {question_id}", "link": f"https://so/q/{question_id}",
+            "score": 1, "answer_count": answers, "is_answered": True, "body": "<p>x</p>", "last_activity_date": 1,
+        }
+        for question_id, answers in ((1, 3), (2, 1))
+    })
+    monkeypatch.setattr(SiteHandler, "searches", {"KeyError": [1, 2]})
+    monkeypatch.setattr(SiteHandler, "answers", {1: 3})
+    monkeypatch.setattr(SiteHandler, "answers_per_page", 2)
+    monkeypatch.setattr(SiteHandler, "paths", [])
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SiteHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(StackOverflow, "api", f"http://127.0.0.1:{httpd.server_port}")
+    yield SiteHandler
+    httpd.shutdown()
+
+
+def test_all_pages_of_answers_are_requested(site: Type[SiteHandler]) -> None:
+    """Answers spread over several pages are all received and stored."""
+    so = StackOverflow("KeyError")
+    assert [len(q.answers) for q in so.questions] == [3, 1]
+    assert [path for path in site.paths if path.endswith("/answers")] == ["/questions/1;2/answers"] * 2
+
+    cached = StackOverflow("KeyError", cached_only=True)
+    assert [len(q.answers) for q in cached.questions] == [3, 1]
+
+
+def test_incomplete_answers_are_not_stored(site: Type[SiteHandler], monkeypatch: pytest.MonkeyPatch) -> None:
+    """Answers of a question are requested again if some were missing."""
+    monkeypatch.setattr(SiteHandler, "paged", False)
+    so = StackOverflow("KeyError")
+    assert [len(q.answers) for q in so.questions] == [2, 0]
+
+    StackOverflow("KeyError")
+    assert [path for path in site.paths if path.endswith("/answers")][-1] == "/questions/1;2/answers"
+    assert len([path for path in site.paths if path.endswith("/answers")]) == 2
+
+
+def test_caches_are_cleared_once(site: Type[SiteHandler], monkeypatch: pytest.MonkeyPatch) -> None:
+    """Concurrent searches don't clear what the others stored, the backend clears the caches up front."""
+    StackOverflow("KeyError")
+    StackOverflow.clear_caches()
+    assert StackOverflow("KeyError", cached_only=True).questions == []
+
+    cleared: list = []
+    monkeypatch.setattr(StackOverflow, "clear_caches", classmethod(cleared.append))
+    monkeypatch.setattr(SiteHandler, "searches", defaultdict(list))
+    backend = StackExchangeBackend(clear_cache=True)
+    backend.search_many([Trace(KeyError("a")), Trace(ValueError("b"))])
+    backend.search(Trace(KeyError("a")))
+    assert cleared == [StackOverflow]
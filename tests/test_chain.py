@@ -0,0 +1,142 @@
+"""Tests for looking up every error of an exception chain."""
+import sys
+from pathlib import Path
+
+import pytest
+
+from wtpython.backends import Results, StackOverflow, Trace, cache
+from wtpython.backends.knowledge import KnowledgeBackend, questions_from_items
+
+if sys.version_info >= (3, 11):
+    from builtins import ExceptionGroup
+
+
+def chained_error() -> Exception:
+    """Raise a wrapper error from a KeyError raised while handling a ValueError."""
+    try:
+        try:
+            int("x")
+        except ValueError:
+            raise KeyError("user_id")
+    except KeyError as e:
+        try:
+            raise RuntimeError("task failed") from e
+        except RuntimeError as wrapper:
+            return wrapper
+    raise AssertionError("not reached")
+
+
+class EchoBackend(KnowledgeBackend):
+    """Backend finding one question titled after each error."""
+
+    name = "echo"
+
+    def search(self, trace: Trace) -> list:
+        """Return a question for the error."""
+        return questions_from_items([{
+            "question_id": abs(hash(trace.error)),
+            "score": 1,
+            "title": trace.error,
+            "link": f"https://example.com/{trace.etype}",
+            "answer_count": 0,
+            "is_answered": False,
+            "body": "",
+        }], self.name)
+
+
+def test_chain_follows_causes_and_contexts() -> None:
+    """Causes and handled errors are listed outermost first."""
+    trace = Trace(chained_error())
+    assert [(link.relation, link.trace.error) for link in trace.chain] == [
+        ("raised", "RuntimeError: task failed"),
+        ("cause", "KeyError: 'user_id'"),
+        ("context", "ValueError: invalid literal for int() with base 10: 'x'"),
+    ]
+    assert trace.chain[1].label == "Caused by KeyError: 'user_id'"
+
+
+def test_chain_skips_suppressed_and_repeated_errors() -> None:
+    """`from None` hides the context and repeated signatures are dropped."""
+    try:
+        try:
+            raise KeyError("a")
+        except KeyError:
+            raise KeyError("b")
+    except KeyError as e:
+        assert len(Trace(e).chain) == 1
+
+    try:
+        try:
+            raise KeyError("a")
+        except KeyError:
+            raise ValueError("bad") from None
+    except ValueError as e:
+        assert len(Trace(e).chain) == 1
+
+
+def test_chain_includes_exception_group_members() -> None:
+    """The members of an exception group are searched for too."""
+    if sys.version_info < (3, 11):
+        pytest.skip("ExceptionGroup is new in Python 3.11")
+    else:
+        group = ExceptionGroup("tasks failed", [KeyError("a"), ZeroDivisionError("b")])
+        assert [link.relation for link in Trace(group).chain] == ["raised", "group", "group"]
+
+
+def test_results_are_grouped_per_error() -> None:
+    """Every error is searched in one pass and results are grouped in chain order."""
+    results = Results.gather(Trace(chained_error()), [EchoBackend()])
+
+    assert [q.title for q in results.questions] == [
+        "RuntimeError: task failed",
+        "KeyError: 'user_id'",
+        "ValueError: invalid literal for int() with base 10: 'x'",
+    ]
+    assert [q.group for q in results.questions] == results.groups
+    sidebar = results.sidebar()
+    assert all(text.plain.startswith(f"{group}\n") for text, group in zip(sidebar, results.groups))
+    assert "Caused by KeyError" in results.no_display()
+
+
+def test_single_errors_are_not_grouped() -> None:
+    """Errors without a chain are shown as before."""
+    results = Results.gather(Trace(KeyError("x")), [EchoBackend()])
+    assert results.groups == []
+    assert results.sidebar()[0].plain.startswith("#1 ")
+
+
+def test_stack_overflow_fetches_answers_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The answers of the questions of all errors are fetched with one request."""
+    monkeypatch.setattr(cache, "REQUEST_CACHE_LOCATION", tmp_path)
+    requests = []
+
+    def get_items(self: StackOverflow, url: str, params: dict, **kwargs: object) -> list:
+        requests.append(url)
+        if url.endswith("/search/advanced"):
+            base = 10 * len([r for r in requests if r.endswith("/search/advanced")])
+            return [{
+                "question_id": base + ix,
+                "score": 1,
+                "title": params["q"],
+                "link": f"https://stackoverflow.com/q/{base + ix}",
+                "answer_count": 1,
+                "is_answered": True,
+                "body": "",
+            } for ix in range(2)]
+        raise AssertionError(f"unexpected request {url}")
+
+    def fetch_items(self: StackOverflow, url: str, params: dict, **kwargs: object) -> list:
+        requests.append(url)
+        return [
+            {"question_id": int(qid), "score": 1, "is_accepted": False, "body": ""}
+            for qid in url.split("/")[-2].split(";")
+        ]
+
+    monkeypatch.setattr(StackOverflow, "get_items", get_items)
+    monkeypatch.setattr(StackOverflow, "fetch_items", fetch_items)
+    traces = [link.trace for link in Trace(chained_error()).chain]
+    instances = StackOverflow.search_many(traces)
+
+    assert len([url for url in requests if url.endswith("/answers")]) == 1
+    assert len(requests) == len(traces) + 1
+    assert all(len(q.answers) == 1 for so in instances for q in so.questions)
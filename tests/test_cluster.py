@@ -0,0 +1,107 @@
+"""Tests for grouping near-duplicate tracebacks from logs."""
+import random
+import time
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from wtpython.cluster import (
+    LoggedError, cluster_tracebacks, count_tracebacks, read_tracebacks
+)
+
+LOG = """\
+2024-05-01 12:00:00 ERROR request failed
+Traceback (most recent call last):
+  File "/srv/app/api.py", line 10, in handle
+    return view(request)
+  File "/usr/lib/python3.9/site-packages/requests/api.py", line 75, in get
+    return request("get", url)
+ConnectionError: host 'db1' unreachable
+2024-05-01 12:00:01 INFO ok
+web_1  | Traceback (most recent call last):
+web_1  |   File "/srv/app/users.py", line 3, in get_user
+web_1  |     return USERS[user_id]
+web_1  | KeyError: 'u1'
+web_1  |
+web_1  | During handling of the above exception, another exception occurred:
+web_1  |
+web_1  | Traceback (most recent call last):
+web_1  |   File "/srv/app/users.py", line 5, in get_user
+web_1  |     raise LookupError(user_id)
+web_1  | LookupError: u1
+"""
+
+BUGS = [
+    ("KeyError: 'user_{}'", ["web/app.py:dispatch", "app/api.py:handle", "app/users.py:get_user"]),
+    ("ZeroDivisionError: division by zero", ["web/app.py:dispatch", "app/api.py:handle", "app/stats.py:average"]),
+    ("KeyError: 'sku_{}'", ["web/app.py:dispatch", "app/api.py:handle", "app/cart.py:add_item"]),
+    ("ValueError: invalid literal for int() with base 10: '{}'", ["worker/run.py:main", "app/forms.py:parse_age"]),
+]
+
+
+def generate(count: int, seed: int = 0) -> Counter:
+    """Log tracebacks of a few bugs with varying values and extra frames."""
+    rng = random.Random(seed)
+    counts: Counter = Counter()
+    for _ in range(count):
+        ix = rng.randrange(len(BUGS))
+        message, frames = BUGS[ix]
+        frames = list(frames)
+        if rng.random() < 0.3:
+            frames.insert(1, "app/middleware.py:wrap")
+        counts[LoggedError(message.format(rng.randrange(10 ** 6)), tuple(frames))] += 1
+    return counts
+
+
+def test_read_tracebacks() -> None:
+    """Frames and errors are read, log prefixes removed and chains collapsed."""
+    assert list(read_tracebacks(LOG.splitlines(keepends=True))) == [
+        LoggedError("ConnectionError: host 'db1' unreachable", ("app/api.py:handle", "requests/api.py:get")),
+        LoggedError("LookupError: u1", ("app/users.py:get_user",)),
+    ]
+
+
+def test_count_tracebacks(tmp_path: Path) -> None:
+    """Tracebacks of several files are counted together."""
+    for name in ("a.log", "b.log"):
+        (tmp_path / name).write_text(LOG)
+    counts = count_tracebacks([tmp_path / "a.log", tmp_path / "b.log"])
+    assert sorted(counts.values()) == [2, 2]
+
+
+def test_near_duplicates_are_grouped() -> None:
+    """Tracebacks of the same bug form one group; different bugs don't."""
+    pytest.importorskip("numpy")
+    counts = generate(5000)
+    clusters = cluster_tracebacks(counts)
+
+    assert len(clusters) == len(BUGS)
+    assert sum(cluster.size for cluster in clusters) == 5000
+    assert [cluster.size for cluster in clusters] == sorted((cluster.size for cluster in clusters), reverse=True)
+    groups = {(cluster.error.split(":")[0], cluster.frames[-1]) for cluster in clusters}
+    assert groups == {(message.split(":")[0], frames[-1]) for message, frames in BUGS}
+
+
+def test_sharded_sketches_match() -> None:
+    """Sketching in several processes gives the same groups."""
+    pytest.importorskip("numpy")
+    counts = Counter({
+        LoggedError(f"KeyError: 'k{ix}'", (f"app/m{ix % 5000}.py:f", f"app/n{ix % 5000}.py:g")): 1
+        for ix in range(10000)
+    })
+    assert cluster_tracebacks(counts, workers=2) == cluster_tracebacks(counts)
+
+
+@pytest.mark.slow
+def test_clustering_is_vectorized() -> None:
+    """Many distinct tracebacks are grouped in seconds."""
+    pytest.importorskip("numpy")
+    counts = Counter({
+        LoggedError(f"Error{ix % 97}: key {ix} missing", (f"app/m{ix % 20000}.py:f", f"lib/x{ix % 13}.py:g")): 1
+        for ix in range(50000)
+    })
+    start = time.perf_counter()
+    clusters = cluster_tracebacks(counts)
+    assert time.perf_counter() - start < 10
+    assert sum(cluster.size for cluster in clusters) == 50000
@@ -0,0 +1,59 @@
+"""Tests for the bundled exception documentation."""
+import importlib.util
+import timeit
+from pathlib import Path
+
+import pytest
+
+from wtpython.backends import Trace
+from wtpython.backends.exception_docs import (
+    ExceptionDocs, ExceptionDocsBackend, ExceptionDocsQuestion
+)
+
+
+class CustomLookupError(KeyError):
+    """Exception defined outside of the standard library."""
+
+
+def test_message_template_note() -> None:
+    """Notes for a matching message template fill in the variable parts."""
+    docs = ExceptionDocs.lookup(["NameError"], "name 'foo' is not defined")
+
+    assert docs is not None
+    assert docs["name"] == "NameError"
+    assert "`foo` has not been assigned" in docs["causes"]
+
+
+def test_falls_back_on_base_class() -> None:
+    """Library exceptions use the docs of the builtin they inherit from."""
+    questions = ExceptionDocsBackend().search(Trace(CustomLookupError("x")))
+
+    assert len(questions) == 1
+    assert isinstance(questions[0], ExceptionDocsQuestion)
+    assert questions[0].docs["name"] == "KeyError"
+    assert "KeyError" in questions[0].display()
+
+
+@pytest.mark.slow
+def test_lookup_is_fast() -> None:
+    """A lookup takes microseconds once the index is loaded."""
+    etypes = ["TypeError", "Exception", "BaseException"]
+    message = "'int' object is not subscriptable"
+    ExceptionDocs.lookup(etypes, message)
+
+    seconds = timeit.timeit(lambda: ExceptionDocs.lookup(etypes, message), number=1000) / 1000
+
+    assert seconds < 0.001
+
+
+def test_index_is_up_to_date() -> None:
+    """The committed index has the current notes, run `python build.py` after editing them."""
+    spec = importlib.util.spec_from_file_location("build", Path(__file__).parents[1] / "build.py")
+    assert spec is not None and spec.loader is not None
+    build = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(build)
+
+    index = ExceptionDocs.index()["exceptions"]
+    for name, entry in build.build_index()["exceptions"].items():
+        assert name in index
+        assert (index[name]["causes"], index[name]["notes"]) == (entry["causes"], entry["notes"]), name
@@ -0,0 +1,100 @@
+"""Tests for converting Stack Overflow bodies to Markdown."""
+import json
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+from wtpython.formatters import (
+    PythonCodeConverter, StreamingMarkdownConverter, UnsupportedMarkup
+)
+
+BODIES = json.loads((Path(__file__).parent / "data" / "stackoverflow_bodies.json").read_text())
+
+TAGS = [
+    "p", "code", "pre", "a", "em", "strong", "b", "i", "ul", "ol", "li", "blockquote",
+    "h1", "h2", "h3", "br", "hr", "img", "del", "s", "sub", "sup", "kbd", "span", "div",
+]
+TEXTS = [
+    "hello", " ", "\n", "  \n  ", "a_b", "x  y", "\t", "*star*", " end ", "http://x.y",
+    "&amp;", "&lt;tag&gt;", "&#39;", "&#150;", "&nbsp;", "&bogus;", "&#x27;", "def f():\n    pass\n",
+]
+ATTRIBUTES = {
+    "a": ['', ' href="http://x.y"', ' href="http://a" title="T &quot;q&quot;"', " href=''"],
+    "img": ['', ' src="s.png" alt="alt"', " src=s title='t'"],
+    "ol": ['', ' start="4"'],
+}
+
+
+def generate(rng: random.Random, depth: int = 0) -> str:
+    """Nest random elements and texts, sometimes leaving elements open."""
+    html = []
+    for _ in range(rng.randint(0, 4)):
+        if rng.random() < 0.4 or depth > 4:
+            html.append(rng.choice(TEXTS))
+            continue
+        tag = rng.choice(TAGS)
+        attrs = rng.choice(ATTRIBUTES.get(tag, ['']))
+        if tag in ("br", "hr", "img"):
+            html.append(f"<{tag}{attrs}>" if rng.random() < 0.7 else f"<{tag}{attrs}/>")
+        else:
+            end = f"</{tag}>" if rng.random() < 0.9 else ""
+            html.append(f"<{tag}{attrs}>{generate(rng, depth + 1)}{end}")
+        if rng.random() < 0.05:
+            html.append(f"</{rng.choice(TAGS)}>")
+    return "".join(html)
+
+
+@pytest.mark.parametrize("html", BODIES)
+def test_bodies_convert_like_markdownify(html: str) -> None:
+    """Questions and answers are converted to the same Markdown as before."""
+    assert StreamingMarkdownConverter().convert(html) == PythonCodeConverter().convert(html)
+
+
+@pytest.mark.filterwarnings("ignore::bs4.MarkupResemblesLocatorWarning")  # For texts like "http://x.y"
+def test_generated_html_converts_like_markdownify() -> None:
+    """Nesting, whitespace and unclosed elements are handled like BeautifulSoup."""
+    rng = random.Random(0)
+    for _ in range(2000):
+        html = generate(rng)
+        assert StreamingMarkdownConverter().convert(html) == PythonCodeConverter().convert(html), html
+
+
+@pytest.mark.parametrize("html, markdown", [
+    ("<p>a<br>b</p>", "a  \nb\n\n"),
+    ("<p>one<hr>two</p>", "one\n\n---\n\ntwo\n\n"),
+    ("<ul><li>x<br/>y</li></ul>", "* x  \ny\n"),
+    ('<p>a<img src="s.png" alt="alt">b</p>', "a![alt](s.png)b\n\n"),
+    ("<p>a<wbr>b</br></p>", "ab\n\n"),
+])
+def test_void_elements_are_closed(html: str, markdown: str) -> None:
+    """Void elements hold no content, whichever version of BeautifulSoup is installed."""
+    assert StreamingMarkdownConverter().build(html) == markdown
+
+
+@pytest.mark.parametrize("html", [
+    "<table><tr><td>x</td></tr></table>",
+    "<p>a</p><!-- comment -->",
+    "<p>if a < b</p>",
+    "<p>AT&T</p>",
+])
+def test_unsupported_markup_falls_back(html: str) -> None:
+    """Markup outside the subset is converted by markdownify."""
+    with pytest.raises(UnsupportedMarkup):
+        StreamingMarkdownConverter().build(html)
+    assert StreamingMarkdownConverter().convert(html) == PythonCodeConverter().convert(html)
+
+
+@pytest.mark.slow
+def test_conversion_is_faster() -> None:
+    """Converting in a single pass is several times faster than building a tree."""
+    def timing(converter: type) -> float:
+        start = time.perf_counter()
+        for _ in range(20):
+            for html in BODIES[:-1]:
+                converter().convert(html)
+        return time.perf_counter() - start
+
+    timing(StreamingMarkdownConverter)
+    assert timing(PythonCodeConverter) > 2 * timing(StreamingMarkdownConverter)
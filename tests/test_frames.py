@@ -0,0 +1,71 @@
+"""Tests for coalescing TUI updates into frames."""
+import asyncio
+import time
+
+from wtpython.displays.frames import FrameScheduler, FrameStats, UpdateCallback
+
+
+def test_requests_are_coalesced_per_frame() -> None:
+    """Only the last request per name runs, once per frame."""
+    calls = []
+    frames = FrameScheduler()
+
+    def update(value: int) -> UpdateCallback:
+        async def run() -> None:
+            calls.append(value)
+        return run
+
+    assert frames.request("question", update(1)) == 0
+    for value in range(2, 30):
+        assert frames.request("question", update(value)) is None
+    frames.request("sidebar", update(100))
+
+    asyncio.run(frames.flush())
+    assert calls == [29, 100]
+
+    asyncio.run(frames.flush())
+    assert calls == [29, 100]
+    assert frames.stats.requests == 30
+    assert frames.stats.frames == 1
+
+
+def test_idle_requests_are_not_delayed() -> None:
+    """Only requests following a frame within the interval wait for the next frame."""
+    async def update() -> None:
+        pass
+
+    frames = FrameScheduler(interval=0.1)
+    assert frames.request("question", update) == 0
+    asyncio.run(frames.flush())
+
+    delay = frames.request("question", update)
+    assert delay is not None and 0.05 < delay <= 0.1
+    asyncio.run(frames.flush())
+
+    time.sleep(0.1)
+    assert frames.request("question", update) == 0
+
+
+def test_input_to_paint_latency() -> None:
+    """Latency is measured from the first input of a frame to the next paint."""
+    async def update() -> None:
+        await asyncio.sleep(0.05)
+
+    frames = FrameScheduler()
+    frames.painted()
+    assert frames.stats.latencies == []
+
+    frames.request("question", update)
+    asyncio.run(frames.flush())
+    frames.painted()
+    frames.painted()
+
+    assert len(frames.stats.latencies) == 1
+    assert frames.stats.latencies[0] >= 0.05
+    assert "1 updates in 1 frames" in frames.stats.summary()
+
+
+def test_percentile() -> None:
+    """Percentiles of an empty list are zero."""
+    assert FrameStats.percentile([], 95) == 0.0
+    assert FrameStats.percentile([0.3, 0.1, 0.2], 50) == 0.2
@@ -0,0 +1,93 @@
+"""Tests for the cache of highlighted code blocks."""
+import io
+import os
+import time
+from pathlib import Path
+
+import pytest
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.syntax import Syntax
+
+from wtpython.displays import highlight
+from wtpython.displays.highlight import HighlightCache, HighlightedMarkdown
+
+POST = """\
+Use `dict.get`:
+
+```py
+port = config.get('port', 8080)
+```
+
+* Or catch the error:
+
+  ```py
+  try:
+      port = config['port']
+  except KeyError:
+      port = 8080
+  ```
+"""
+
+
+def render(markdown: Markdown, width: int = 60) -> list:
+    """Render Markdown to lines."""
+    console = Console(width=width, file=io.StringIO())
+    return console.render_lines(markdown, console.options)
+
+
+def test_code_blocks_render_like_markdown(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Cached code blocks look the same, whether rendered, in memory or stored."""
+    monkeypatch.setattr(highlight, "HIGHLIGHT_CACHE", HighlightCache(directory=tmp_path))
+    expected = render(Markdown(POST, inline_code_lexer="python"))
+
+    assert render(HighlightedMarkdown(POST, inline_code_lexer="python")) == expected
+    assert render(HighlightedMarkdown(POST, inline_code_lexer="python")) == expected
+    monkeypatch.setattr(highlight, "HIGHLIGHT_CACHE", HighlightCache(directory=tmp_path))
+    assert render(HighlightedMarkdown(POST, inline_code_lexer="python")) == expected
+
+
+def test_cached_code_is_not_lexed_again(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Code blocks are highlighted once per width, in this session or a later one."""
+    monkeypatch.setattr(highlight, "HIGHLIGHT_CACHE", HighlightCache(directory=tmp_path))
+    render(HighlightedMarkdown(POST))
+
+    def lex(*args: object) -> None:
+        raise AssertionError("code was lexed again")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(Syntax, "highlight", lex)
+        render(HighlightedMarkdown(POST))
+        patched.setattr(highlight, "HIGHLIGHT_CACHE", HighlightCache(directory=tmp_path))
+        render(HighlightedMarkdown(POST))
+        with pytest.raises(AssertionError, match="lexed again"):
+            render(HighlightedMarkdown(POST), width=40)
+
+
+def test_memory_cache_is_bounded() -> None:
+    """Only the most recently shown code blocks are kept in memory."""
+    cache = HighlightCache(max_cached=2, directory=None)
+    for ix in range(5):
+        cache.get_or_render(f"x = {ix}", "py", "monokai", 60, lambda: [])
+
+    assert len(cache._cache) == 2
+    assert cache.key("x = 4", "py", "monokai", 60) in cache._cache
+    assert cache.key("x = 4", "py", "monokai", 60) != cache.key("x = 4", "py", "monokai", 61)
+
+
+def test_store_is_pruned_and_cleared(tmp_path: Path) -> None:
+    """The oldest stored code blocks are removed, and clearing removes them all."""
+    first = HighlightCache(directory=tmp_path, max_stored=2)
+    assert first.store is not None
+    for ix in range(4):
+        first.get_or_render(f"x = {ix}", "py", "monokai", 60, lambda: [])
+        written = time.time() - 10 + ix
+        os.utime(first.store.path(first.key(f"x = {ix}", "py", "monokai", 60)), (written, written))
+
+    second = HighlightCache(directory=tmp_path, max_stored=2)
+    second.get_or_render("x = 4", "py", "monokai", 60, lambda: [])
+    stored = {path.stem for path in tmp_path.glob("*.bin")}
+    assert stored == {second.key(f"x = {ix}", "py", "monokai", 60) for ix in (2, 3, 4)}
+
+    second.clear()
+    assert not list(tmp_path.glob("*.bin")) and not second._cache
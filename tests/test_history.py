@@ -0,0 +1,164 @@
+"""Tests for the history of errors and their pinned solutions."""
+import json
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+import wtpython.__main__
+from wtpython.__main__ import history_command
+from wtpython.backends import ErrorSession, Trace
+from wtpython.backends.knowledge import KnowledgeBackend, questions_from_items
+from wtpython.history import ErrorRecord, History
+
+
+def make_trace(error: Exception) -> Trace:
+    """Raise and catch an error."""
+    try:
+        raise error
+    except Exception as e:
+        return Trace(e)
+
+
+def make_question(ix: int) -> dict:
+    """Item of a question found by a backend."""
+    return {
+        "question_id": ix,
+        "score": ix,
+        "title": f"Question {ix}",
+        "link": f"https://example.com/q/{ix}",
+        "answer_count": 0,
+        "is_answered": False,
+        "body": f"<p>Answer {ix}</p>",
+    }
+
+
+class SlowBackend(KnowledgeBackend):
+    """Backend finding two questions after a while."""
+
+    name = "slow"
+
+    def __init__(self) -> None:
+        self.release = threading.Event()
+
+    def search(self, trace: Trace) -> list:
+        """Return the questions once released."""
+        self.release.wait(5)
+        return questions_from_items([make_question(1), make_question(2)], self.name)
+
+
+def test_errors_are_counted_by_signature(tmp_path: Path) -> None:
+    """Errors differing only in their values are one record, shared by all users of the store."""
+    for error in [KeyError("user_1"), KeyError("user_2"), ZeroDivisionError("division by zero"), KeyError("user_3")]:
+        History(tmp_path).record_error(make_trace(error))
+
+    records = History(tmp_path).records()
+    assert [(record.signature, record.occurrences) for record in records] == [
+        ("KeyError: {}", 3),
+        ("ZeroDivisionError: division by zero", 1),
+    ]
+    assert records[0].first_seen <= records[0].last_seen
+
+
+def test_concurrent_updates_are_not_lost(tmp_path: Path) -> None:
+    """Updates from several writers are serialized by the lock of the entry."""
+    trace = make_trace(KeyError("k"))
+
+    def record() -> None:
+        for _ in range(10):
+            History(tmp_path).record_error(trace)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert History(tmp_path).records()[0].occurrences == 40
+
+
+def test_opened_and_pinned_solutions(tmp_path: Path) -> None:
+    """The pinned question is the solution, otherwise the one opened most often."""
+    history = History(tmp_path)
+    signature = make_trace(KeyError("k")).signature
+    first, second = questions_from_items([make_question(1), make_question(2)], "stackoverflow")
+
+    history.record_opened(signature, first)
+    history.record_opened(signature, second)
+    history.record_opened(signature, second)
+    record = history.get(signature)
+    assert record is not None
+    assert record.solution == ("Question 2", "https://example.com/q/2")
+
+    history.pin(signature, first)
+    record, pinned = history.get(signature), history.pinned(signature)
+    assert record is not None and pinned is not None
+    assert record.solution == ("Question 1", "https://example.com/q/1")
+    assert pinned.posts() == first.posts()
+
+    history.pin(signature, None)
+    assert history.pinned(signature) is None
+
+
+def test_pinned_solution_is_shown_before_the_lookup(tmp_path: Path) -> None:
+    """The pinned question is shown right away and stays first once results arrive."""
+    history = History(tmp_path)
+    trace = make_trace(KeyError("k"))
+    history.pin(trace.signature, questions_from_items([make_question(1)], "stackoverflow")[0])
+    backend = SlowBackend()
+    session = ErrorSession(trace, [backend], pinned=history.pinned(trace.signature))
+
+    session.prefetch()
+    preview = session.preview
+    assert not session.loaded
+    assert [q.title for q in preview.questions] == ["Question 1"]
+    assert preview.sidebar()[0].plain.endswith("(pinned) Question 1")
+
+    backend.release.set()
+    assert [q.title for q in session.results.questions] == ["Question 1", "Question 2"]
+
+
+def test_history_command(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    """The report lists the errors seen most often with their solutions."""
+    history = History(tmp_path)
+    trace = make_trace(KeyError("k"))
+    for _ in range(3):
+        history.record_error(trace)
+    history.record_opened(trace.signature, questions_from_items([make_question(1)], "stackoverflow")[0])
+    history.record_error(make_trace(ZeroDivisionError("division by zero")))
+
+    history_command(["--store", str(tmp_path), "--top", "1"])
+    out = capsys.readouterr().out
+    assert "2 errors seen 4 times" in out
+    assert "KeyError: {}" in out
+    assert "Opened: Question 1 https://example.com/q/1" in out
+    assert "ZeroDivisionError" not in out
+
+
+def test_records_do_not_share_opened_questions(tmp_path: Path) -> None:
+    """Every new record counts the questions opened for it on its own."""
+    history = History(tmp_path)
+    question, = questions_from_items([make_question(1)], "stackoverflow")
+    history.record_opened("KeyError: 'a'", question)
+
+    assert ErrorRecord("KeyError: 'b'").opened is None
+    assert history.record_error(make_trace(KeyError("b"))).opened == {}
+
+
+def test_unwritable_history_is_skipped(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+) -> None:
+    """Errors are still looked up when the history can't be written, e.g. on a read-only share."""
+    (tmp_path / "history").write_text("")  # A file where the directory should be
+    monkeypatch.setattr(wtpython.__main__, "HISTORY_LOCATION", tmp_path / "history" / "errors")
+    script = tmp_path / "script.py"
+    script.write_text("{}['missing']\n")
+    index = tmp_path / "index.json"
+    index.write_text(json.dumps([{**make_question(1), "title": "KeyError missing", "tags": []}]))
+    monkeypatch.setattr(sys, "argv", ["wtpython", "-n", "--source", f"offline:{index}", str(script)])
+
+    wtpython.__main__.main()
+
+    out, err = capsys.readouterr()
+    assert "KeyError missing" in out
+    assert "Not using the history" in err
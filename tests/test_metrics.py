@@ -0,0 +1,88 @@
+"""Tests for the metrics registry and its exports."""
+import socket
+from pathlib import Path
+
+import pytest
+
+from wtpython.backends.store import ItemStore
+from wtpython.metrics import (
+    CACHE_LOOKUPS, SIZE_BUCKETS, Registry, StatsdClient
+)
+
+
+def test_openmetrics_exposition() -> None:
+    """Counters, gauges and cumulative histogram buckets are exposed."""
+    registry = Registry()
+    registry.counter("hits", "Cache hits", ["store"]).inc(store="so")
+    registry.counter("hits", "Cache hits", ["store"]).inc(2, store="so")
+    registry.gauge("quota", "Quota left").set(9000)
+    latency = registry.histogram("request_seconds", "Request time", buckets=[0.1, 1])
+    for seconds in (0.05, 0.5, 3):
+        latency.observe(seconds)
+
+    assert registry.openmetrics().splitlines() == [
+        "# TYPE hits counter",
+        "# HELP hits Cache hits",
+        'hits_total{store="so"} 3',
+        "# TYPE quota gauge",
+        "# HELP quota Quota left",
+        "quota 9000",
+        "# TYPE request_seconds histogram",
+        "# HELP request_seconds Request time",
+        'request_seconds_bucket{le="0.1"} 1',
+        'request_seconds_bucket{le="1"} 2',
+        'request_seconds_bucket{le="+Inf"} 3',
+        "request_seconds_count 3",
+        "request_seconds_sum 3.55",
+        "# EOF",
+    ]
+
+
+def test_labels_are_checked() -> None:
+    """Recording with the wrong labels or redefining a metric fails."""
+    registry = Registry()
+    counter = registry.counter("hits", "Cache hits", ["store"])
+    with pytest.raises(ValueError):
+        counter.inc(site="so")
+    with pytest.raises(ValueError):
+        registry.gauge("hits", "Cache hits", ["store"])
+
+
+def test_write_file(tmp_path: Path) -> None:
+    """The exposition is written to a file."""
+    registry = Registry()
+    registry.counter("hits", "Cache hits").inc()
+    registry.write(tmp_path / "metrics" / "wtpython.prom")
+    assert (tmp_path / "metrics" / "wtpython.prom").read_text().endswith("hits_total 1\n# EOF\n")
+
+
+def test_statsd_push() -> None:
+    """Every value is sent to statsd with the labels in its name."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as daemon:
+        daemon.bind(("127.0.0.1", 0))
+        daemon.settimeout(2)
+        registry = Registry()
+        registry.statsd = StatsdClient(f"127.0.0.1:{daemon.getsockname()[1]}")
+        registry.counter("hits", "Cache hits", ["store"]).inc(store="so")
+        registry.histogram("request_seconds", "Request time").observe(0.25)
+        registry.histogram("response_bytes", "Response size", buckets=SIZE_BUCKETS).observe(2048)
+        assert daemon.recv(1024) == b"hits.so:1|c"
+        assert daemon.recv(1024) == b"request_seconds:250|ms"
+        assert daemon.recv(1024) == b"response_bytes:2048|h"
+
+
+def test_statsd_address_is_validated() -> None:
+    """A missing port is rejected."""
+    with pytest.raises(ValueError):
+        StatsdClient("localhost")
+
+
+def test_item_store_counts_lookups(tmp_path: Path) -> None:
+    """Cache hits and misses of the item store are counted."""
+    store = ItemStore(tmp_path / "metrics-test", expire_after=60)
+    before = {result: CACHE_LOOKUPS.values.get(("metrics-test", result), 0) for result in ("hit", "miss")}
+    store.get_or_fetch("key", lambda: [{"a": 1}])
+    store.get_or_fetch("key", lambda: [{"a": 1}])
+    store.get_or_fetch("key", lambda: [{"a": 1}])
+    assert CACHE_LOOKUPS.values[("metrics-test", "miss")] == before["miss"] + 1
+    assert CACHE_LOOKUPS.values[("metrics-test", "hit")] == before["hit"] + 2
@@ -0,0 +1,47 @@
+"""Tests for the NDJSON output."""
+import io
+import json
+import time
+
+from wtpython.backends import SearchEngine, Trace
+from wtpython.backends.knowledge import KnowledgeBackend, questions_from_items
+from wtpython.displays import stream_events
+
+
+class SlowBackend(KnowledgeBackend):
+    """Backend returning one question with an answer after a delay."""
+
+    def __init__(self, name: str, delay: float) -> None:
+        self.name = name
+        self.delay = delay
+
+    def search(self, trace: Trace) -> list:
+        """Return the question."""
+        time.sleep(self.delay)
+        return questions_from_items([{
+            "title": f"From {self.name}",
+            "link": f"https://example.com/{self.name}",
+            "score": 1,
+            "answer_count": 1,
+            "is_answered": True,
+            "body": "<p>question</p>",
+            "answers": [{"score": 2, "is_accepted": True, "body": "<p>answer</p>"}],
+        }], self.name)
+
+
+def test_events_are_streamed_in_order() -> None:
+    """Each event is one JSON line; results arrive in the order backends answer."""
+    trace = Trace.from_error("KeyError: 'x'")
+    stream = io.StringIO()
+    backends = [SlowBackend("slow", 0.2), SlowBackend("fast", 0), SlowBackend("late", 5)]
+    stream_events(trace, backends, SearchEngine(trace), deadline=0.5, stream=stream)
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["event"] for record in records] == [
+        "trace", "search_url", "question", "answers", "question", "answers", "timing",
+    ]
+    assert records[0]["error"] == "KeyError: 'x'"
+    assert [records[2]["source"], records[4]["source"]] == ["fast", "slow"]
+    assert records[3]["answers"][0]["is_accepted"] is True
+    assert records[-1]["timed_out"] == ["late"]
+    assert set(records[-1]["sources"]) == {"fast", "slow"}
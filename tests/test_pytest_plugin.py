@@ -0,0 +1,84 @@
+"""Tests for the pytest plugin."""
+import json
+from pathlib import Path
+
+import pytest
+
+from wtpython.backends import Trace
+
+pytest_plugins = ["pytester"]
+
+TESTS = """
+def test_first():
+    {}["first"]
+
+def test_second():
+    {}["second"]
+
+def test_name():
+    undefined_name
+
+def test_passes():
+    pass
+"""
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Path:
+    """Offline index with a question about KeyError."""
+    path = tmp_path / "index.json"
+    path.write_text(json.dumps([{
+        "question_id": 1,
+        "title": "How to fix KeyError in dict",
+        "link": "https://example.com/q/1",
+        "score": 3,
+        "answer_count": 0,
+        "is_answered": False,
+        "body": "",
+    }]))
+    return path
+
+
+def test_signature_groups_similar_errors() -> None:
+    """Quoted values and numbers don't change the signature."""
+    first = Trace.from_error("KeyError: 'first'")
+    second = Trace.from_error("KeyError: 'second'")
+    assert first.signature == second.signature == "KeyError: {}"
+    assert Trace.from_error("IndexError: list index 3").signature == "IndexError: list index {}"
+
+
+def test_snapshot_round_trip() -> None:
+    """A recreated trace falls back on the builtin base of the original error."""
+    class CustomError(LookupError):
+        pass
+
+    trace = Trace.from_snapshot(Trace(CustomError("missing")).snapshot())
+    assert trace.error == "CustomError: missing"
+    assert trace.etype_hierarchy[:2] == ["CustomError", "LookupError"]
+
+
+def test_failures_are_grouped_and_looked_up(pytester: pytest.Pytester, index: Path) -> None:
+    """Failures with the same signature are looked up once and listed together."""
+    pytester.makepyfile(TESTS)
+    result = pytester.runpytest(
+        "-p", "wtpython.pytest_plugin", "-p", "no:randomly", "--wtpython", "--wtpython-source", f"offline:{index}",
+    )
+    result.assert_outcomes(passed=1, failed=3)
+    result.stdout.fnmatch_lines([
+        "*= wtpython =*",
+        "KeyError: 'first' (2 tests)",
+        "*test_first",
+        "*test_second",
+        "*#1 (offline) How to fix KeyError in dict",
+        "*https://example.com/q/1",
+        "NameError: name 'undefined_name' is not defined (1 test)",
+        "*No results, search: *",
+    ])
+
+
+def test_disabled_by_default(pytester: pytest.Pytester) -> None:
+    """Without --wtpython the plugin does nothing."""
+    pytester.makepyfile(TESTS)
+    result = pytester.runpytest("-p", "wtpython.pytest_plugin")
+    result.assert_outcomes(passed=1, failed=3)
+    assert "wtpython" not in result.stdout.str()
@@ -0,0 +1,87 @@
+"""Tests for building Stack Exchange searches from tracebacks."""
+from __future__ import annotations
+
+import json
+import re
+import runpy
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from wtpython.backends import Trace
+from wtpython.backends.query import build_query, message_template
+
+CORPUS = Path(__file__).parent / "data" / "query_corpus.json"
+
+
+@pytest.mark.parametrize("message, template", [
+    ("'NoneType' object has no attribute 'get'", "NoneType object has no attribute"),
+    ("name 'total_price' is not defined", "name is not defined"),
+    ("No module named 'yaml'", "No module named yaml"),
+    ("[Errno 2] No such file or directory: 'data/orders.csv'", "Errno No such file or directory"),
+    ("'user_id'", ""),
+    ("(sqlite3.OperationalError) no such table: invoices", "no such table"),
+])
+def test_message_template(message: str, template: str) -> None:
+    """The program's own names and values are removed."""
+    assert message_template(message) == template
+
+
+def test_library_is_used_as_tag() -> None:
+    """The package the error came from replaces the python tag."""
+    trace = Trace.from_error("KeyError: 'customer_name'")
+    assert build_query(trace).params == {"q": "KeyError", "tagged": "python"}
+    trace.library = "sklearn"
+    assert build_query(trace).tagged == "scikit-learn"
+
+
+def test_library_of_installed_frames(tmp_path: Path) -> None:
+    """The first installed package called by the user's code is found."""
+    def load(path: Path, source: str, namespace: dict) -> dict:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+        return runpy.run_path(str(path), init_globals=namespace)
+
+    dependency = load(tmp_path / "site-packages" / "numbers_lib" / "core.py", "def fail():\n    1 / 0\n", {})
+    library = load(tmp_path / "site-packages" / "fancylib" / "__init__.py", "def run():\n    fail()\n", dependency)
+    script = load(tmp_path / "script.py", "def main():\n    run()\n", library)
+    with pytest.raises(ZeroDivisionError) as excinfo:
+        script["main"]()
+
+    trace = Trace(excinfo.value)
+    assert trace.library == "fancylib"
+    assert Trace.from_snapshot(trace.snapshot()).library == "fancylib"
+
+
+def search(questions: list[dict], q: str, tagged: Optional[str]) -> list[dict]:
+    """Advanced search over the recorded questions: every word of `q` must appear."""
+    words = set(re.findall(r"\w+", q.lower()))
+    matches = []
+    for question in questions:
+        text = " ".join([question["title"], question["body"], *question["tags"]]).lower()
+        if words <= set(re.findall(r"\w+", text)) and tagged in (None, *question["tags"]):
+            matches.append(question)
+    return matches
+
+
+def test_empty_result_rate_on_recorded_corpus() -> None:
+    """A single search finds as much as the old search and its fallback."""
+    corpus = json.loads(CORPUS.read_text())
+    old_first_empty = old_empty = new_empty = 0
+    for record in corpus["errors"]:
+        trace = Trace.from_error(record["error"])
+        trace.library = record["library"]
+
+        # Previously: the full error, then the error type if nothing was found
+        if not search(corpus["questions"], f"python {trace.error}", None):
+            old_first_empty += 1
+            old_empty += not search(corpus["questions"], f"python {trace.etype}", None)
+
+        query = build_query(trace)
+        new_empty += not search(corpus["questions"], query.q, query.tagged)
+
+    errors = len(corpus["errors"])
+    assert new_empty / errors <= 0.05
+    assert new_empty <= old_empty
+    assert old_first_empty / errors >= 0.4  # The fallback round trip was the common case
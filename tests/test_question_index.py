@@ -0,0 +1,106 @@
+"""Tests for filtering questions."""
+import time
+from typing import Optional, Sequence
+
+import pytest
+
+from wtpython.backends import Results
+from wtpython.backends.knowledge import KnowledgeBackend, questions_from_items
+from wtpython.backends.question_index import QuestionIndex
+from wtpython.backends.stackoverflow import StackOverflowAnswer
+
+
+def make_item(question_id: int, title: str, tags: Sequence = (), answers: Sequence = ()) -> dict:
+    """Create a question item with answers."""
+    return {
+        "question_id": question_id,
+        "title": title,
+        "link": f"https://example.com/q/{question_id}",
+        "score": 0,
+        "answer_count": len(answers),
+        "is_answered": False,
+        "body": "<p>question</p>",
+        "tags": list(tags),
+        "answers": [{"score": 0, "is_accepted": False, "body": body} for body in answers],
+    }
+
+
+QUESTIONS = questions_from_items([
+    make_item(1, "KeyError when reading a dict", tags=["dictionary"]),
+    make_item(2, "Missing column", tags=["pandas"], answers=["<p>Use <code>df.loc</code></p>"]),
+    make_item(3, "Unpacking &amp; tuples", answers=["<p>Use the walrus operator</p>"]),
+], "test")
+
+
+def ids(questions: Optional[set]) -> list:
+    """Sorted question ids."""
+    assert questions is not None
+    return sorted(q.data["question_id"] for q in questions)
+
+
+def test_titles_tags_and_answers_match() -> None:
+    """Every word must appear in the title, tags, body or answers."""
+    index = QuestionIndex(QUESTIONS)
+    assert index.search("") is None
+    assert ids(index.search("dict")) == [1]
+    assert ids(index.search("pandas")) == [2]
+    assert ids(index.search("df.loc")) == [2]
+    assert ids(index.search("use walrus")) == [3]
+    assert ids(index.search("& tuples")) == [3]
+    assert ids(index.search("walrus pandas")) == []
+
+
+def test_long_words_tolerate_typos() -> None:
+    """Words of five or more characters may contain a typo."""
+    index = QuestionIndex(QUESTIONS)
+    assert ids(index.search("walrsu")) == [3]
+    assert ids(index.search("wallrus")) == [3]
+    assert ids(index.search("dictionery")) == [1]
+    assert ids(index.search("dictonar")) == [1]
+    assert ids(index.search("dcit")) == []
+    assert ids(index.search("zzzzzz")) == []
+
+
+def test_index_is_updated_incrementally() -> None:
+    """Questions are indexed again when their answers arrive."""
+    index = QuestionIndex(QUESTIONS)
+    question = QUESTIONS[0]
+    question.answers = [StackOverflowAnswer({"score": 0, "is_accepted": False, "body": "<p>setdefault</p>"})]
+    assert ids(index.search("setdefault")) == []
+    index.update(question)
+    assert ids(index.search("setdefault")) == [1]
+    question.answers = []
+    index.update(question)
+    assert ids(index.search("setdefault")) == []
+
+
+def test_results_keep_the_index_up_to_date() -> None:
+    """Questions added to results after the index is built can be filtered."""
+    class Backend(KnowledgeBackend):
+        def search(self, trace: object) -> list:
+            return []
+
+    results = Results()
+    results.add(Backend(), QUESTIONS[:1])
+    assert results.filter("pandas") == []
+    results.add(Backend(), QUESTIONS[1:])
+    assert results.filter("pandas") == [1]
+    assert results.filter("") is None
+
+
+@pytest.mark.slow
+def test_search_is_faster_than_a_frame() -> None:
+    """Filtering hundreds of posts takes less than a frame per keystroke."""
+    answer = "<p>" + " ".join(f"word{i} lorem ipsum dolor sit amet" for i in range(60)) + "</p>"
+    questions = questions_from_items([
+        make_item(i, f"Question {i} about error {i % 37}", tags=["python", f"tag{i % 11}"], answers=[answer] * 3)
+        for i in range(300)
+    ], "test")
+    index = QuestionIndex(questions)
+
+    query = "error 12 word42"
+    start = time.perf_counter()
+    for end in range(1, len(query) + 1):
+        index.search(query[:end])
+    per_keystroke = (time.perf_counter() - start) / len(query)
+    assert per_keystroke < 1 / 60
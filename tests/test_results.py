@@ -0,0 +1,189 @@
+"""Tests for merging results from knowledge backends."""
+import json
+import time
+from pathlib import Path
+from typing import Sequence
+
+import pytest
+
+from wtpython.backends import ErrorSession, Results, SearchEngine, Trace
+from wtpython.backends.knowledge import (
+    KnowledgeBackend, OfflineIndexBackend, create_backends,
+    questions_from_items
+)
+from wtpython.displays import dump_info
+
+
+def make_item(question_id: int, score: int, title: str = "title") -> dict:
+    """Create a question item shaped like the API's."""
+    return {
+        "question_id": question_id,
+        "score": score,
+        "title": title,
+        "link": f"https://example.com/q/{question_id}",
+        "answer_count": 0,
+        "is_answered": False,
+        "body": "",
+    }
+
+
+class StaticBackend(KnowledgeBackend):
+    """Backend returning fixed items after a delay."""
+
+    def __init__(self, name: str, items: list, priority: int = 10, delay: float = 0, cached: Sequence = ()) -> None:
+        self.name = name
+        self.items = items
+        self.priority = priority
+        self.delay = delay
+        self.cached = list(cached)
+
+    def search(self, trace: Trace) -> list:
+        """Return the items."""
+        time.sleep(self.delay)
+        return questions_from_items(self.items, self.name)
+
+    def fallback(self, trace: Trace) -> list:
+        """Return the cached items."""
+        return questions_from_items(self.cached, self.name)
+
+
+def test_results_are_merged_and_ranked() -> None:
+    """Priority ranks first, then score; duplicate links are dropped."""
+    so = StaticBackend("so", [make_item(1, 5), make_item(2, 50)])
+    kb = StaticBackend("kb", [make_item(3, 1), make_item(2, 50)], priority=1)
+
+    results = Results.gather(Trace(KeyError("x")), [so, kb])
+
+    assert [q.data["question_id"] for q in results.questions] == [2, 3, 1]
+    assert [q.ix for q in results.questions] == [0, 1, 2]
+
+
+def test_slow_backends_are_dropped_at_deadline() -> None:
+    """A backend missing the deadline does not delay results."""
+    fast = StaticBackend("fast", [make_item(1, 5)])
+    slow = StaticBackend("slow", [make_item(2, 5)], delay=5)
+
+    start = time.monotonic()
+    results = Results.gather(Trace(KeyError("x")), [fast, slow], deadline=0.5)
+
+    assert time.monotonic() - start < 2
+    assert len(results) == 1
+    assert results.timed_out == ["slow"]
+    assert results.fallbacks == []
+
+
+def test_cached_results_replace_slow_backends() -> None:
+    """A backend missing the deadline is shown with its cached results."""
+    slow = StaticBackend("slow", [make_item(1, 5)], delay=5, cached=[make_item(2, 1)])
+
+    results = Results.gather(Trace(KeyError("x")), [slow], deadline=0.2)
+
+    assert [q.data["question_id"] for q in results.questions] == [2]
+    assert results.timed_out == ["slow"]
+    assert results.fallbacks == ["slow"]
+
+
+class FailingBackend(StaticBackend):
+    """Backend failing right away, like one without a network connection."""
+
+    def search(self, trace: Trace) -> list:
+        """Fail to connect."""
+        raise ConnectionError("offline")
+
+
+def test_cached_results_replace_failed_backends() -> None:
+    """A backend that fails is shown with its cached results and its error."""
+    failing = FailingBackend("failing", [], cached=[make_item(2, 1)])
+
+    results = Results.gather(Trace(KeyError("x")), [failing], deadline=5)
+
+    assert [q.data["question_id"] for q in results.questions] == [2]
+    assert results.timed_out == []
+    assert results.fallbacks == ["failing"]
+    assert str(results.errors["failing"]) == "offline"
+
+
+def test_failed_backends_are_reported(capsys: pytest.CaptureFixture) -> None:
+    """Without a display, failed backends are listed below the results."""
+    results = Results.gather(Trace(KeyError("x")), [FailingBackend("failing", [])], deadline=5)
+
+    dump_info(results, SearchEngine(Trace(KeyError("x"))))
+    assert "Sources that failed: failing" in capsys.readouterr().out
+
+
+def test_repeated_sources_are_rejected() -> None:
+    """Sources whose results could not be told apart are rejected."""
+    assert [b.name for b in create_backends(["stackoverflow", "stackexchange:superuser"])] == [
+        "stackoverflow", "superuser",
+    ]
+    with pytest.raises(ValueError, match="repeats the source named 'stackoverflow'"):
+        create_backends(["stackoverflow", "stackexchange"])
+
+
+def test_offline_index(tmp_path: Path) -> None:
+    """The offline index ranks items by words shared with the error."""
+    index = tmp_path / "index.json"
+    index.write_text(json.dumps([
+        make_item(1, 0, "How to fix ValueError"),
+        make_item(2, 0, "KeyError when reading a dict"),
+        make_item(3, 0, "Unrelated"),
+    ]))
+
+    questions = OfflineIndexBackend(index).search(Trace(KeyError("dict")))
+
+    assert [q.data["question_id"] for q in questions] == [2]
+    assert questions[0].source == "offline"
+
+
+class CountingBackend(StaticBackend):
+    """Backend counting its searches."""
+
+    searches = 0
+
+    def search(self, trace: Trace) -> list:
+        """Count the search and return the items."""
+        CountingBackend.searches += 1
+        return super().search(trace)
+
+
+def test_sessions_are_looked_up_on_first_use() -> None:
+    """Creating sessions costs nothing; results are looked up once when needed."""
+    CountingBackend.searches = 0
+    backend = CountingBackend("counting", [make_item(1, 1)], delay=0.2)
+    sessions = [ErrorSession(Trace(KeyError(ix)), [backend]) for ix in range(100)]
+    assert CountingBackend.searches == 0
+    assert not sessions[0].loaded
+
+    sessions[1].prefetch()
+    start = time.monotonic()
+    assert len(sessions[0].results) == 1
+    assert time.monotonic() - start >= 0.2
+    assert len(sessions[0].results) == 1
+    assert len(sessions[1].results) == 1
+    assert CountingBackend.searches == 2
+    assert sessions[0].loaded and not sessions[2].loaded
+
+
+def test_sessions_with_results_are_not_looked_up() -> None:
+    """Results found already are used as they are."""
+    results = Results("KeyError: 1")
+    session = ErrorSession(Trace(KeyError(1)), results=results, title="KeyError (3 tests)")
+    assert session.loaded
+    assert session.results is results
+    assert session.title == "KeyError (3 tests)"
+    assert session.search_engine.query == "KeyError: 1"
+
+
+def test_failed_lookup_is_kept_by_the_session(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The preview of a failed lookup is empty and the error is kept for the interface."""
+    def gather(*args: object) -> Results:
+        raise RuntimeError("lookup failed")
+
+    monkeypatch.setattr(Results, "gather", gather)
+    session = ErrorSession(Trace(KeyError(1)), [StaticBackend("so", [])])
+    with pytest.raises(RuntimeError):
+        session.results
+
+    assert session.loaded
+    assert str(session.error) == "lookup failed"
+    assert len(session.preview) == 0
@@ -0,0 +1,121 @@
+"""Tests for the compact item store."""
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from wtpython.backends import store
+from wtpython.backends.store import (
+    CODECS, JSON_ZLIB, ItemStore, PostStore, trim
+)
+
+ITEMS = [{"question_id": 1, "title": "KeyError", "body": "<p>é</p>", "tags": ["python"]}]
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+def test_round_trip(tmp_path: Path, codec: int) -> None:
+    """Items are read back unchanged with every available codec."""
+    items = ItemStore(tmp_path, expire_after=60, codec=codec)
+    items.put("key", ITEMS)
+    assert items.get("key") == ITEMS
+    assert items.get("other") is None
+
+
+def test_expired_entries_are_missing(tmp_path: Path) -> None:
+    """Entries past their expiry are not returned."""
+    items = ItemStore(tmp_path, expire_after=-1)
+    items.put("key", ITEMS)
+    assert items.get("key") is None
+
+
+def test_unreadable_entries_are_missing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Entries from other versions, unknown codecs or damaged files are not returned."""
+    items = ItemStore(tmp_path, expire_after=60, codec=JSON_ZLIB)
+    items.put("key", ITEMS)
+    data = items.path("key").read_bytes()
+
+    items.path("key").write_bytes(data[:-4])
+    assert items.get("key") is None
+    items.path("key").write_bytes(b"WTP")
+    assert items.get("key") is None
+
+    items.path("key").write_bytes(data)
+    monkeypatch.setattr(ItemStore, "VERSION", ItemStore.VERSION + 1)
+    assert items.get("key") is None
+    monkeypatch.undo()
+    monkeypatch.delitem(store.CODECS, JSON_ZLIB)
+    assert items.get("key") is None
+
+
+def test_get_or_fetch_fetches_once(tmp_path: Path) -> None:
+    """Fetched items are stored and later reads don't fetch."""
+    calls = []
+    items = ItemStore(tmp_path, expire_after=60)
+
+    def fetch() -> list:
+        calls.append(1)
+        return ITEMS
+
+    assert items.get_or_fetch("key", fetch) == ITEMS
+    assert items.get_or_fetch("key", fetch) == ITEMS
+    assert len(calls) == 1
+
+    items.clear()
+    assert items.get("key") is None
+
+
+def test_entries_are_smaller_than_the_response(tmp_path: Path) -> None:
+    """Trimmed, compressed entries take less space than the JSON items."""
+    response = [{**ITEMS[0], "owner": {"reputation": 1, "display_name": "x" * 50}, "view_count": 7}] * 10
+    items = ItemStore(tmp_path, expire_after=60)
+    items.put("key", trim(response, ["question_id", "title", "body", "tags"]))
+    assert items.path("key").stat().st_size < len(repr(response)) / 5
+    assert items.get("key") == ITEMS * 10
+
+
+def test_stale_entries_are_revalidated_in_the_background(tmp_path: Path) -> None:
+    """Expired entries are returned immediately and fetched again."""
+    items = ItemStore(tmp_path, expire_after=-1)
+    items.put("key", ITEMS)
+    items.expire_after = 60
+    release = threading.Event()
+    fresh = [{"question_id": 2}]
+
+    def fetch() -> list:
+        release.wait(5)
+        return fresh
+
+    start = time.monotonic()
+    assert items.get_or_fetch("key", fetch, stale_for=3600) == ITEMS
+    assert time.monotonic() - start < 1
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while items.get("key") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert items.get("key") == fresh
+
+
+def test_entries_past_the_stale_limit_are_fetched(tmp_path: Path) -> None:
+    """Entries expired for too long are fetched before returning."""
+    items = ItemStore(tmp_path, expire_after=-10)
+    items.put("key", ITEMS)
+    items.expire_after = 60
+    assert items.get_or_fetch("key", lambda: [], stale_for=5) == []
+    entry = items.read("key")
+    assert entry is not None and entry.items == []
+
+
+def test_posts_are_stored_once_by_id(tmp_path: Path) -> None:
+    """Posts are read back by ID and kinds don't share IDs."""
+    posts = PostStore(tmp_path)
+    posts.put_posts("site-questions", {1: ITEMS[0], 2: {"question_id": 2}})
+    posts.put_posts("site-questions", {1: {**ITEMS[0], "title": "Edited"}})
+
+    assert posts.get_posts("site-questions", [2, 1, 3]) == {
+        1: {**ITEMS[0], "title": "Edited"},
+        2: {"question_id": 2},
+    }
+    assert posts.get_posts("site-answers", [1]) == {}
+    assert len(list(tmp_path.glob("*.bin"))) == 2
@@ -0,0 +1,94 @@
+"""Tests for the virtualized body view."""
+import asyncio
+import io
+
+from rich.console import Console
+from textual import events
+from textual.geometry import Offset, Size
+
+from wtpython.displays.virtual_body import BlockLayout, VirtualBody
+from wtpython.formatters import split_markdown_blocks
+
+DOCUMENT = """\
+## Title
+
+First paragraph.
+
+```py
+x = 1
+
+y = 2
+```
+
+* item
+
+    continued item
+"""
+
+
+def test_split_markdown_blocks() -> None:
+    """Blank lines split blocks except inside fences and before indented text."""
+    assert split_markdown_blocks(DOCUMENT) == [
+        "## Title",
+        "First paragraph.",
+        "```py\nx = 1\n\ny = 2\n```",
+        "* item\n\n    continued item",
+    ]
+
+
+def test_window_renders_only_visible_blocks() -> None:
+    """Blocks far below the viewport are never rendered."""
+    console = Console(width=40, file=io.StringIO())
+    layout = BlockLayout(max_cached=8)
+    layout.update(["\n\n".join(f"Paragraph {i}" for i in range(100))])
+
+    lines, total, y = layout.window(0, 5, 40, console, overscan=5)
+
+    assert len(lines) == 5
+    assert y == 0
+    assert total == 200
+    assert len(layout._cache) < 10
+
+
+def test_cache_is_bounded() -> None:
+    """Scrolling through the whole document keeps the LRU bounded."""
+    console = Console(width=40, file=io.StringIO())
+    layout = BlockLayout(max_cached=4)
+    layout.update(["\n\n".join(f"Paragraph {i}" for i in range(50))])
+
+    for y in range(0, 100, 5):
+        layout.window(y, 5, 40, console)
+
+    assert len(layout._cache) <= 4
+
+
+def test_heights_are_kept_for_current_blocks_and_width() -> None:
+    """Resizing and switching questions do not keep old heights around."""
+    console = Console(width=40, file=io.StringIO())
+    layout = BlockLayout(max_cached=4)
+    for question in range(10):
+        layout.update(["\n\n".join(f"Question {question} paragraph {i}" for i in range(20))])
+        for width in range(30, 40):
+            layout.window(0, 10, width, console)
+
+    assert len(layout._heights) + len(layout._estimates) == 20
+
+
+def test_scrollbar_pages_and_drags() -> None:
+    """Clicking the scrollbar pages and dragging its thumb scrolls in proportion."""
+    async def drag() -> None:
+        body = VirtualBody()
+        body._size = Size(40, 10)
+        body.virtual_height = 100
+        await body.action_scroll_down()
+        assert body.y == 10
+        await body.action_scroll_up()
+        assert body.y == 0
+        await body.on_mouse_capture(events.MouseCapture(body, Offset(39, 1)))
+        await body.on_mouse_move(events.MouseMove(body, 39, 3, 0, 2, 0, False, False, False, screen_y=3))
+        assert body.y == 20
+        await body.on_mouse_release(events.MouseRelease(body, Offset(39, 3)))
+        await body.on_mouse_move(events.MouseMove(body, 39, 5, 0, 2, 0, False, False, False, screen_y=5))
+        assert body.y == 20
+
+    asyncio.run(drag())
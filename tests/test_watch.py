@@ -0,0 +1,98 @@
+"""Tests for watch mode."""
+import os
+from pathlib import Path
+
+import pytest
+
+from wtpython.watch import FileWatcher, WatchSession, run_in_child
+
+
+def write_project(tmp_path: Path, body: str) -> Path:
+    """Write a script importing a local module whose function has `body`."""
+    (tmp_path / "helper.py").write_text(f"def value():\n    {body}\n")
+    script = tmp_path / "script.py"
+    script.write_text("import helper\nprint('running')\nhelper.value()\n")
+    return script
+
+
+def touch(path: Path) -> None:
+    """Move the modification time of a file forward."""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_run_in_child(tmp_path: Path) -> None:
+    """The error, the imported local modules and the output are reported."""
+    script = write_project(tmp_path, "return {}['missing']")
+    result = run_in_child([str(script)])
+    assert result.snapshot is not None
+    assert result.snapshot["signature"] == "KeyError: {}"
+    assert str(tmp_path / "helper.py") in result.files
+    assert result.output == "running\n"
+    assert "helper.py" in result.traceback
+
+
+def test_file_watcher(tmp_path: Path) -> None:
+    """Changed and deleted files are detected once."""
+    path = tmp_path / "module.py"
+    path.write_text("")
+    watcher = FileWatcher([str(path)])
+    assert not watcher.changed()
+    touch(path)
+    assert watcher.changed()
+    assert not watcher.changed()
+    path.unlink()
+    assert watcher.changed()
+
+
+def test_session_skips_unchanged_errors(tmp_path: Path) -> None:
+    """The same error is not looked up again and a fix is reported."""
+    script = write_project(tmp_path, "return {}['missing']")
+    session = WatchSession([str(script)], backends=[], deadline=1)
+
+    update = session.rerun()
+    assert update is not None and update.trace is not None
+    assert update.trace.error == "KeyError: 'missing'"
+    assert "helper.py" in update.trace.traceback
+
+    write_project(tmp_path, "return {}['other']")
+    touch(tmp_path / "helper.py")
+    assert session.changed()
+    assert session.rerun() is None
+
+    write_project(tmp_path, "return 1")
+    touch(tmp_path / "helper.py")
+    update = session.rerun()
+    assert update is not None and update.fixed
+    assert update.output == "running\n"
+
+
+@pytest.mark.parametrize("body, exit_code, output", [
+    ("raise SystemExit(0)", 0, "running\n"),
+    ("raise SystemExit(2)", 2, "running\n"),
+    ("raise SystemExit('bad input')", 1, "running\nbad input\n"),
+    ("import os; os._exit(3)", 3, ""),
+    ("import os, signal; os.kill(os.getpid(), signal.SIGKILL)", -9, ""),
+])
+def test_exit_status(tmp_path: Path, body: str, exit_code: int, output: str) -> None:
+    """Exits without an error keep their status, also when the interpreter dies."""
+    result = run_in_child([str(write_project(tmp_path, body))])
+    assert result.snapshot is None
+    assert (result.exit_code, result.output) == (exit_code, output)
+
+
+def test_failed_exit_is_not_a_fix(tmp_path: Path) -> None:
+    """A non-zero exit is reported once, and exiting cleanly afterwards is a fix."""
+    script = write_project(tmp_path, "raise SystemExit(1)")
+    session = WatchSession([str(script)], backends=[], deadline=1)
+
+    update = session.rerun()
+    assert update is not None and not update.fixed
+    assert update.exit_status == "exit status 1"
+    touch(script)
+    assert session.rerun() is None
+
+    write_project(tmp_path, "return 1")
+    touch(tmp_path / "helper.py")
+    update = session.rerun()
+    assert update is not None and update.fixed
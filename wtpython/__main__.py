@@ -10,14 +10,34 @@ import os.path
 import runpy
 import sys
 import textwrap
+import time
+from datetime import datetime
+from pathlib import Path
 from typing import Optional
 
 import pyperclip
 from rich import print
+from rich.markup import escape
 
-from wtpython.backends import SearchEngine, StackOverflow, Trace
-from wtpython.displays import TextualDisplay, dump_info
-from wtpython.displays.textual_display import store_results_in_module
+from wtpython.backends import (
+    ErrorSession, Results, SearchEngine, Trace, create_backends
+)
+from wtpython.backends.bundle import load_bundle, save_bundle
+from wtpython.backends.warm import load_signatures, warm_cache
+from wtpython.cluster import (
+    cluster_tracebacks, count_tracebacks, lookup_clusters
+)
+from wtpython.displays import TextualDisplay, dump_info, stream_events
+from wtpython.displays.frames import FrameStats
+from wtpython.displays.highlight import HIGHLIGHT_CACHE
+from wtpython.displays.textual_display import WatchDisplay
+from wtpython.history import History
+from wtpython.metrics import configure as configure_metrics
+from wtpython.settings import (
+    BACKEND_DEADLINE, BACKENDS, HISTORY_LOCATION, METRICS_FILE,
+    REQUEST_CACHE_LOCATION, STATSD_ADDRESS, WATCH_INTERVAL
+)
+from wtpython.watch import WatchSession, WatchUpdate
 
 
 def run(args: list[str]) -> Optional[Trace]:
@@ -60,7 +80,11 @@ def parse_arguments() -> dict:
         Additional information:
           wtpython acts as a substitute for Python. Simply add `wt` to the beginning
           of the line and call your program with all the appropriate arguments:
-                    $ wtpython [OPTIONS] <script.py> <arguments>"""
+                    $ wtpython [OPTIONS] <script.py> <arguments>
+
+          Commands:
+                    $ wtpython cache warm [FILE]    Fill the cache for common errors
+                    $ wtpython history              Show the errors that come back most often"""
         ),
     )
 
@@ -84,6 +108,61 @@ def parse_arguments() -> dict:
         default=False,
         help="Clear StackOverflow cache",
     )
+    parser.add_argument(
+        "--format",
+        choices=["rich", "ndjson"],
+        default="rich",
+        help="Output format without display; ndjson streams one JSON event per line (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        metavar="NAME[:ARG]",
+        help=f"Knowledge source to search, can be repeated (default: {', '.join(BACKENDS)})",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=BACKEND_DEADLINE,
+        help="Seconds to wait for knowledge sources (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        default=False,
+        help="Run the script again when it or its local modules change",
+    )
+    parser.add_argument(
+        "--frame-stats",
+        action="store_true",
+        default=False,
+        help="Print the input-to-paint latency of the interface on exit",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        default=METRICS_FILE,
+        help="Write cache, API and render metrics to this file on exit, in the OpenMetrics format",
+    )
+    parser.add_argument(
+        "--statsd",
+        metavar="HOST:PORT",
+        default=STATSD_ADDRESS,
+        help="Send cache, API and render metrics to a statsd daemon",
+    )
+    parser.add_argument(
+        "--save-bundle",
+        type=Path,
+        metavar="FILE",
+        help="Save the error and its results to a file that can be opened with --open",
+    )
+    parser.add_argument(
+        "--open",
+        type=Path,
+        metavar="FILE",
+        help="Show the results saved with --save-bundle instead of running a script",
+    )
     parser.add_argument(
         "args",
         nargs="*",
@@ -92,6 +171,13 @@ def parse_arguments() -> dict:
 
     opts = vars(parser.parse_args())
 
+    if opts["open"]:
+        try:
+            opts["bundle"] = load_bundle(opts["open"])
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        return opts
+
     if not opts["args"]:
         parser.error("Please specify a script to run")
         sys.exit(1)
@@ -100,44 +186,314 @@ def parse_arguments() -> dict:
         parser.error(f"{opts['args'][0]} is not a file")
         sys.exit(1)
 
+    try:
+        configure_metrics(opts["metrics_file"], opts["statsd"])
+        opts["backends"] = create_backends(opts["source"] or BACKENDS, clear_cache=opts["clear_cache"])
+    except ValueError as e:
+        parser.error(str(e))
+    if opts["clear_cache"]:
+        HIGHLIGHT_CACHE.clear()
+
     return opts
 
 
+def cache_command(argv: list[str]) -> None:
+    """Manage the request cache.
+
+    `wtpython cache warm [FILE]` looks up a list of error signatures so the
+    cache can be built ahead of time, for example in a CI image.
+
+    Args:
+        argv: The arguments after `wtpython cache`.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(prog="wtpython cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    warm = subparsers.add_parser("warm", help="Fetch results for common errors into the cache")
+    warm.add_argument(
+        "signatures",
+        nargs="?",
+        type=Path,
+        help="File with one error per line (default: built-in list of common errors)",
+    )
+    warm.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of lookups to run in parallel (default: %(default)s)",
+    )
+    warm.add_argument(
+        "--site",
+        default="stackoverflow",
+        help="Stack Exchange site to search (default: %(default)s)",
+    )
+    opts = vars(parser.parse_args(argv))
+
+    signatures = load_signatures(opts["signatures"])
+    report = warm_cache(signatures, workers=opts["workers"], site=opts["site"])
+
+    print(
+        f"Warmed [bold]{len(report.covered)}/{len(signatures)}[/] signatures "
+        f"({report.coverage:.0%} coverage), stored {report.bytes_stored / 1024:.1f} KiB "
+        f"in {REQUEST_CACHE_LOCATION}"
+    )
+    for signature in report.failed:
+        print(f"[red]Failed:[/] {escape(signature)}")
+
+
+def cluster_command(argv: list[str]) -> None:
+    """Group near-duplicate tracebacks from logs.
+
+    `wtpython cluster LOG...` prints the groups of tracebacks caused by the
+    same bug, largest first, and looks up each group once with `--lookup`.
+
+    Args:
+        argv: The arguments after `wtpython cluster`.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(prog="wtpython cluster")
+    parser.add_argument("logs", nargs="+", type=Path, help="Log files containing tracebacks")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes reading logs and computing sketches (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=20,
+        help="Number of groups to show (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--lookup",
+        action="store_true",
+        default=False,
+        help="Search Stack Overflow once for each group shown",
+    )
+    parser.add_argument(
+        "--site",
+        default="stackoverflow",
+        help="Stack Exchange site to search (default: %(default)s)",
+    )
+    opts = vars(parser.parse_args(argv))
+
+    try:
+        counts = count_tracebacks(opts["logs"], workers=opts["workers"])
+        clusters = cluster_tracebacks(counts, workers=opts["workers"])
+    except (ImportError, OSError) as e:
+        parser.error(str(e))
+
+    print(
+        f"Found [bold]{sum(counts.values()):,}[/] tracebacks, {len(counts):,} distinct, "
+        f"in [bold]{len(clusters):,}[/] groups"
+    )
+    shown = clusters[:opts["top"]]
+    questions = lookup_clusters(shown, site=opts["site"]) if opts["lookup"] else [None] * len(shown)
+    for cluster, question in zip(shown, questions):
+        print(f"\n[bold]{cluster.size:>10,}[/]  [red]{escape(cluster.error)}[/] ({cluster.variants:,} variants)")
+        if cluster.frames:
+            print(f"{'':>12}{escape(cluster.frames[-1])}")
+        if question is not None:
+            print(f"{'':>12}{escape(question.title)} {question.url}")
+
+
+def history_command(argv: list[str]) -> None:
+    """Report the errors that come back most often.
+
+    `wtpython history` lists the errors of the history, most frequent
+    first, with the solution pinned or opened most often for each.
+
+    Args:
+        argv: The arguments after `wtpython history`.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(prog="wtpython history")
+    parser.add_argument(
+        "-n",
+        "--top",
+        type=int,
+        default=20,
+        help="Number of errors to show (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=HISTORY_LOCATION,
+        help="History to read, e.g. one shared by a team (default: $WTPYTHON_HISTORY or %(default)s)",
+    )
+    opts = vars(parser.parse_args(argv))
+
+    records = History(opts["store"]).records()
+    print(
+        f"[bold]{len(records):,}[/] errors seen [bold]{sum(record.occurrences for record in records):,}[/] times "
+        f"in {escape(str(opts['store']))}"
+    )
+    for record in records[:opts["top"]]:
+        last_seen = datetime.fromtimestamp(record.last_seen).strftime("%Y-%m-%d %H:%M")
+        print(f"\n[bold]{record.occurrences:>10,}[/]  [red]{escape(record.signature)}[/] (last seen {last_seen})")
+        solution = record.solution
+        if solution is not None:
+            title, url = solution
+            label = "Pinned" if record.pinned is not None else "Opened"
+            print(f"{'':>12}{label}: {escape(title)} {url}")
+
+
+def print_update(update: WatchUpdate) -> None:
+    """Print the outcome of a run in watch mode without display.
+
+    Args:
+        update: The outcome of the run.
+
+    Returns:
+        None
+    """
+    print(update.output, end="")
+    if update.fixed:
+        print("[bold green]Fixed![/] [green]The script ran without errors. Watching for changes...[/]")
+        return
+    if update.trace is None:
+        print(f"[bold red]Failed![/] [red]The script exited with {update.exit_status}. Watching for changes...[/]")
+        return
+    print(update.trace.rich_traceback)
+    dump_info(so_results=update.results, search_engine=update.search_engine or SearchEngine(update.trace))
+
+
+def watch(opts: dict) -> None:
+    """Run the script whenever it changes until interrupted.
+
+    Args:
+        opts: The parsed command line arguments.
+
+    Returns:
+        None
+    """
+    session = WatchSession(opts["args"], opts["backends"], deadline=opts["deadline"])
+    update = session.rerun()
+    if not opts["no_display"]:
+        WatchDisplay.run(session=session, update=update)
+        return
+
+    try:
+        while True:
+            if update is not None:
+                print_update(update)
+            elif session.runs > 1:
+                print("[grey]Same result as the previous run.[/]")
+            while not session.changed():
+                time.sleep(WATCH_INTERVAL)
+            update = session.rerun()
+    except KeyboardInterrupt:
+        pass
+
+
+def display(session: ErrorSession, opts: dict, history: Optional[History] = None) -> None:
+    """Show the traceback and the results.
+
+    Args:
+        session: The error and its results, or a pinned solution to show
+            while they are looked up.
+        opts: The parsed command line arguments.
+        history: Where questions opened or pinned in the interface are recorded.
+
+    Returns:
+        None
+    """
+    print(session.trace.rich_traceback)
+
+    if opts["no_display"]:
+        dump_info(
+            so_results=session.results,
+            search_engine=session.search_engine,
+        )
+    else:
+        stats = FrameStats() if opts["frame_stats"] else None
+        try:
+            TextualDisplay.run(sessions=[session], frame_stats=stats, history=history)
+        except Exception as e:
+            print(e)
+        if stats is not None:
+            print(stats.summary())
+
+
+COMMANDS = {
+    "cache": cache_command,
+    "cluster": cluster_command,
+    "history": history_command,
+}
+
+
 def main() -> None:
     """Run the application.
 
+    `wtpython <command> ...` runs one of the COMMANDS unless a file with
+    the same name exists.
+
     Args:
         None
 
     Returns:
         None
     """
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command in COMMANDS and not os.path.isfile(command):
+        configure_metrics(METRICS_FILE, STATSD_ADDRESS)
+        COMMANDS[command](sys.argv[2:])
+        return
+
     opts: dict = parse_arguments()
+    if opts["open"]:
+        bundle = opts["bundle"]
+        display(ErrorSession(
+            bundle.trace, results=bundle.results, search_engine=bundle.search_engine, pinned=bundle.pinned
+        ), opts)
+        return
+
+    if opts["watch"]:
+        watch(opts)
+        return
+
     trace: Optional[Trace] = run(opts["args"])
 
     if trace is None:  # No exceptions were raised by user's program
         return
 
     engine = SearchEngine(trace)
-    so = StackOverflow.from_trace(trace=trace, clear_cache=opts["clear_cache"])
-
-    print(trace.rich_traceback)
+    history: Optional[History] = None
+    pinned = None
+    try:
+        history = History(HISTORY_LOCATION)
+        history.record_error(trace)
+        pinned = history.pinned(trace.signature)
+    except OSError as e:  # The history is optional, e.g. on a read-only share
+        print(f"[grey]Not using the history: {escape(str(e))}[/]", file=sys.stderr)
+        history = None
 
     if opts["copy_error"]:
         pyperclip.copy(trace.error)
 
-    if opts["no_display"]:
-        dump_info(
-            so_results=so,
-            search_engine=engine,
-        )
+    if opts["format"] == "ndjson":
+        so = stream_events(trace, opts["backends"], engine, deadline=opts["deadline"])
+        if opts["save_bundle"]:
+            save_bundle(opts["save_bundle"], trace, so)
+        return
+
+    if pinned is not None:  # Shown right away, the results are looked up meanwhile
+        session = ErrorSession(trace, opts["backends"], opts["deadline"], search_engine=engine, pinned=pinned)
     else:
-        store_results_in_module(
-            trace=trace,
-            so_results=so,
-            search_engine=engine,
-        )
-        try:
-            TextualDisplay().run()
-        except Exception as e:
-            print(e)
+        so = Results.gather(trace, opts["backends"], deadline=opts["deadline"])
+        session = ErrorSession(trace, results=so, search_engine=engine)
+    if opts["save_bundle"]:
+        size = save_bundle(opts["save_bundle"], trace, session.results)
+        print(f"[grey]Saved the results to {escape(str(opts['save_bundle']))} ({size / 1024:.1f} KiB)[/]")
+
+    display(session, opts, history)
@@ -1,4 +1,8 @@
 """Backends for managing data and formatting text."""
+from .knowledge import (  # noqa: F401
+    KnowledgeBackend, create_backend, create_backends
+)
+from .results import ErrorSession, Results  # noqa: F401
 from .search_engine import SearchEngine  # noqa: F401
 from .stackoverflow import StackOverflow  # noqa: F401
 from .trace import Trace  # noqa: F401
@@ -0,0 +1,173 @@
+"""Save results to a file and open them again without the network.
+
+A bundle holds everything the displays need: the trace snapshot with the
+formatted traceback, the questions and answers as returned by the
+knowledge backends and the posts already converted to Markdown. Opening a
+bundle therefore needs neither requests nor Markdown conversion. The entry
+of the exception documentation and the pinned solution are kept as well.
+
+The file is a small header followed by the encoded contents:
+
+    magic (4 bytes) | version (1) | codec (1) | padding (2)
+
+Bundles are written as zlib compressed JSON so they can be opened on any
+machine, including ones without the `fast` extra.
+"""
+from __future__ import annotations
+
+import struct
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional
+
+from rich.traceback import Frame, Stack
+from rich.traceback import Trace as RichTrace
+from rich.traceback import _SyntaxError
+
+from .exception_docs import ExceptionDocsQuestion
+from .results import Results
+from .search_engine import SearchEngine
+from .stackoverflow import StackOverflowAnswer, StackOverflowQuestion
+from .store import CODECS, DECODE_ERRORS, JSON_ZLIB, atomic_write
+from .trace import DetachedTrace, Trace
+
+MAGIC = b"WTPB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxx")
+
+
+class Bundle(NamedTuple):
+    """The contents of a bundle, ready for the displays."""
+
+    trace: Trace
+    results: Results
+    search_engine: SearchEngine
+    pinned: Optional[StackOverflowQuestion] = None
+
+
+def _frame(data: Dict[str, Any]) -> Frame:
+    """Recreate a frame, without the locals that were left out when saving."""
+    return Frame(**{**data, "locals": None})
+
+
+def _rich_trace(data: Optional[dict]) -> Optional[RichTrace]:
+    """Recreate the frames extracted by rich from `dataclasses.asdict`."""
+    if data is None:
+        return None
+    return RichTrace(stacks=[
+        Stack(
+            exc_type=stack["exc_type"],
+            exc_value=stack["exc_value"],
+            syntax_error=_SyntaxError(**stack["syntax_error"]) if stack["syntax_error"] else None,
+            is_cause=stack["is_cause"],
+            frames=[_frame(frame) for frame in stack["frames"]],
+        )
+        for stack in data["stacks"]
+    ])
+
+
+def dump_question(question: StackOverflowQuestion) -> dict:
+    """JSON serializable question with its answers and rendered posts, see `load_question`."""
+    return {
+        "data": question.data,
+        "source": question.source,
+        "answers": [answer.data for answer in question.answers],
+        "markdown": question.posts(),
+        "group": question.group,
+        "pinned": question.pinned,
+        "docs": question.docs if isinstance(question, ExceptionDocsQuestion) else None,
+    }
+
+
+def load_question(ix: int, item: dict) -> StackOverflowQuestion:
+    """Recreate a question saved by `dump_question`.
+
+    Args:
+        ix: The index of the question in its list.
+        item: The saved question.
+
+    Returns:
+        The question, with its posts already converted to Markdown.
+    """
+    if item.get("docs") is not None:
+        question: StackOverflowQuestion = ExceptionDocsQuestion(ix, item["docs"])
+    else:
+        question = StackOverflowQuestion(ix, item["data"], source=item["source"])
+    question.answers = [StackOverflowAnswer(answer) for answer in item["answers"]]
+    question.markdown = item["markdown"]
+    question.group = item.get("group")
+    question.pinned = item.get("pinned", False)
+    return question
+
+
+def save_bundle(path: Path, trace: Trace, results: Results, codec: int = JSON_ZLIB) -> int:
+    """Write a trace and its results to a bundle.
+
+    Args:
+        path: The file to write.
+        trace: The wtpython Trace object.
+        results: The results found for the trace.
+        codec: The codec used to encode the contents.
+
+    Returns:
+        The size of the bundle in bytes.
+    """
+    rich_trace = trace.rich_traceback.trace
+    contents = {
+        "trace": {
+            **trace.snapshot(),
+            "traceback": trace.traceback,
+            "rich_trace": None if rich_trace is None else asdict(rich_trace),
+        },
+        "query": results._query,
+        "timed_out": results.timed_out,
+        "fallbacks": results.fallbacks,
+        "groups": results.groups,
+        "questions": [dump_question(question) for question in results.questions],
+    }
+    data = HEADER.pack(MAGIC, VERSION, codec) + CODECS[codec].dumps(contents)
+    atomic_write(Path(path), data)
+    return len(data)
+
+
+def load_bundle(path: Path) -> Bundle:
+    """Read a bundle written by `save_bundle`.
+
+    Args:
+        path: The bundle.
+
+    Returns:
+        The trace, results, search engine and pinned solution to display.
+
+    Raises:
+        ValueError: If the file is not a bundle or can't be read.
+    """
+    data = Path(path).read_bytes()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a wtpython bundle")
+    magic, version, codec = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a wtpython bundle")
+    if version != VERSION:
+        raise ValueError(f"{path} was saved by another version of wtpython")
+    if codec not in CODECS:
+        raise ValueError(f"{path} needs msgpack and zstandard: pip install wtpython[fast]")
+    try:
+        contents = CODECS[codec].loads(memoryview(data)[HEADER.size:])
+    except DECODE_ERRORS:
+        raise ValueError(f"{path} is damaged")
+
+    try:
+        snapshot = contents["trace"]
+        trace = DetachedTrace.from_parts(snapshot, snapshot["traceback"], _rich_trace(snapshot["rich_trace"]))
+
+        results = Results(contents["query"])
+        results.timed_out = contents["timed_out"]
+        results.fallbacks = contents["fallbacks"]
+        results.groups = contents.get("groups", [])
+        results.questions = [load_question(ix, item) for ix, item in enumerate(contents["questions"])]
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"{path} is damaged: {type(e).__name__}: {e}")
+
+    pinned = next((question for question in results.questions if question.pinned), None)
+    return Bundle(trace, results, SearchEngine(trace), pinned)
@@ -1,11 +1,246 @@
 """Tools for caching requests to external APIs.
 
 Caching is used to reduce the number of requests to external APIs.
+Responses whose items are all that is needed are kept in a compact
+`ItemStore`; other requests are cached by requests-cache.
+Several wtpython processes can share the cache: files are written
+atomically and requests for the same key are serialized with a file lock,
+so concurrent identical lookups produce a single API call.
+
+Expired lists of posts can be refreshed incrementally: instead of all the
+posts, only those with activity since the newest stored post are
+requested, using the `min` filter of the Stack Exchange API on results
+sorted by activity, and merged into the stored posts. Votes are not
+activity, so scores of unchanged posts are those last downloaded, and
+deleted posts stay until the entry is cleared.
+
+Posts returned by many different requests, like popular questions, can be
+kept once by ID in a `PostStore`. The entries of the requests then only
+hold the IDs of their posts, in order.
 """
-from requests_cache import CachedSession
+from __future__ import annotations
+
+import json
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any, Callable, Iterable, Optional, TypeVar
+
+from requests import PreparedRequest, Response, Session
 from requests_cache.backends import FileCache
+from requests_cache.backends.filesystem import FileDict
+from requests_cache.session import CacheMixin
+
+from wtpython.metrics import (
+    API_QUOTA, API_REQUESTS, API_RESPONSE_SIZE, CACHE_LOOKUPS
+)
+from wtpython.settings import (
+    REQUEST_CACHE_DURATION, REQUEST_CACHE_LOCATION,
+    REQUEST_CACHE_STALE_DURATION, REQUEST_HEDGE_DELAY
+)
+
+from .store import ItemStore, PostStore, atomic_write, file_lock, trim
+
+T = TypeVar('T')
+
+
+class AtomicFileDict(FileDict):
+    """FileDict that writes files atomically."""
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        serialized = self.serializer.dumps(value)
+        if isinstance(serialized, str):
+            serialized = serialized.encode()
+        else:
+            self.is_binary = True
+        with self._try_io():
+            atomic_write(self._path(key), serialized)
+
+
+class SharedFileCache(FileCache):
+    """File cache that can be shared by concurrent processes."""
+
+    def __init__(self, cache_name: Path, **kwargs: Any) -> None:
+        super().__init__(cache_name, **kwargs)
+        self.responses = AtomicFileDict(cache_name, **kwargs)
+
+    def lock(self, key: str) -> Any:
+        """Context manager holding the lock for a cache key."""
+        return file_lock(self.cache_dir / 'locks' / f'{key}.lock')
+
+
+class RateLimiter:
+    """Thread safe limit on the number of requests per second.
+
+    Requests are spaced evenly. `pause` delays all following requests,
+    which is used to honour the `backoff` field of the Stack Exchange API.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Block until the next request is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        """Delay all requests by at least `seconds`."""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class _ThrottledSession(Session):
+    """Session that applies a rate limit to requests sent over the network.
+
+    The `backoff` asked for by a response is honoured when its payload is
+    decoded with `json`, so the body is only decoded once.
+    """
+
+    limiter: Optional[RateLimiter] = None
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:
+        """Wait for the rate limiter and send the request."""
+        if self.limiter is not None:
+            self.limiter.wait()
+        return super().send(request, **kwargs)
+
+    def json(self, response: Response) -> Any:
+        """Decode a JSON response and delay the following requests by its `backoff`."""
+        data = response.json()
+        if self.limiter is not None and isinstance(data, dict) and data.get('backoff'):
+            self.limiter.pause(data['backoff'])
+        return data
+
+
+class ThrottledCachedSession(CacheMixin, _ThrottledSession):
+    """Cached session that only rate limits cache misses.
+
+    With a `SharedFileCache`, requests are coalesced ("singleflight"): the
+    first process to miss the cache for a key fetches the response while
+    the others wait on the key's lock and then read it from the cache.
+    """
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:
+        """Send the request while holding the lock for its cache key."""
+        if not isinstance(self.cache, SharedFileCache):
+            return super().send(request, **kwargs)
+
+        with self.cache.lock(self.cache.create_key(request, **kwargs)):
+            return super().send(request, **kwargs)
+
+
+class LatencyTracker:
+    """Response times of recent requests, shared by processes through a file.
+
+    Recording holds a lock on the file, so concurrent requests don't drop
+    each other's response times.
+    """
+
+    def __init__(self, path: Path, size: int = 100, default: float = REQUEST_HEDGE_DELAY) -> None:
+        self.path = path
+        self.size = size
+        self.default = default
+
+    def load(self) -> list[float]:
+        """Read the recorded response times."""
+        try:
+            return json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return []
+
+    def record(self, seconds: float) -> None:
+        """Add a response time, keeping only the most recent ones."""
+        with file_lock(self.path.with_suffix('.lock')):
+            samples = [*self.load(), round(seconds, 3)][-self.size:]
+            atomic_write(self.path, json.dumps(samples).encode())
+
+    def percentile(self, percent: float) -> float:
+        """Response time below which `percent` of the requests finished.
+
+        Falls back on `default` until a few requests have been recorded.
+        """
+        samples = sorted(self.load())
+        if len(samples) < 5:
+            return self.default
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
 
-from wtpython.settings import REQUEST_CACHE_DURATION, REQUEST_CACHE_LOCATION
+def latest_activity(items: list[dict]) -> Optional[int]:
+    """Newest `last_activity_date` of stored posts.
+
+    Returns:
+        The date, or None if there are no items or some have no date,
+        e.g. when they were stored by an older version of wtpython.
+    """
+    if not items or any('last_activity_date' not in item for item in items):
+        return None
+    return max(item['last_activity_date'] for item in items)
+
+
+def merge_changed(items: list[dict], changed: list[dict], id_field: str, limit: int) -> list[dict]:
+    """Replace stored posts with the ones that changed.
+
+    Args:
+        items: The stored posts.
+        changed: Posts with activity since the stored posts were fetched.
+            Posts that are not stored yet are added.
+        id_field: The field identifying a post, e.g. `question_id`.
+        limit: The number of posts a full request would return.
+
+    Returns:
+        The posts sorted by activity, newest first, as the API sorts them.
+    """
+    posts = {item[id_field]: item for item in items}
+    posts.update((item[id_field], item) for item in changed)
+    return sorted(posts.values(), key=lambda item: item['last_activity_date'], reverse=True)[:limit]
+
+
+def hedged(call: Callable[[], T], delay: float, attempts: int = 2) -> T:
+    """Call a function and call it again if it takes longer than `delay`.
+
+    The result of the first call to succeed is returned. Calls run in
+    daemon threads; calls that lose the race are left to finish on their
+    own.
+
+    Args:
+        call: The function to call, e.g. one sending a request.
+        delay: Seconds to wait before starting another call.
+        attempts: Maximum number of calls started.
+
+    Returns:
+        The result of the first successful call.
+    """
+    outcomes: Queue = Queue()
+
+    def attempt() -> None:
+        try:
+            outcomes.put((True, call()))
+        except Exception as e:
+            outcomes.put((False, e))
+
+    threading.Thread(target=attempt, daemon=True).start()
+    started, failed = 1, 0
+    while True:
+        try:
+            succeeded, outcome = outcomes.get(timeout=delay if started < attempts else None)
+        except Empty:
+            threading.Thread(target=attempt, daemon=True).start()
+            started += 1
+            continue
+
+        if succeeded:
+            return outcome
+        failed += 1
+        if failed == started:
+            raise outcome
 
 
 class CachedResponse:
@@ -13,12 +248,16 @@ class CachedResponse:
 
     This class should be extended by any class that makes web queries.
     The `cache_key` should be defined to avoid caching conflicts.
+    `rate_limit` is the maximum number of requests per second sent by
+    all instances sharing a `cache_key`; None disables the limit.
     """
 
     cache_key = 'wtpython'
+    rate_limit: Optional[float] = None
+    _limiters: dict[str, RateLimiter] = {}
 
     def __init__(self, clear_cache: bool = False) -> None:
-        """Initialize the session and cache.
+        """Initialize the session, cache and item store.
 
         Args:
             clear_cache: If True, clear the cache.
@@ -26,14 +265,181 @@ class CachedResponse:
         Returns:
             None
         """
-        self.session = CachedSession(
+        self.session = ThrottledCachedSession(
             self.cache_key,
-            backend=FileCache(REQUEST_CACHE_LOCATION),
+            backend=SharedFileCache(REQUEST_CACHE_LOCATION),
             expire_after=REQUEST_CACHE_DURATION,
         )
+        self.api_session = _ThrottledSession()  # Requests bypassing the response cache, see `fetch_items`
+        if self.rate_limit is not None:
+            self.session.limiter = self._limiters.setdefault(self.cache_key, RateLimiter(self.rate_limit))
+            self.api_session.limiter = self.session.limiter
+        self.store = ItemStore(REQUEST_CACHE_LOCATION / 'items' / self.cache_key, REQUEST_CACHE_DURATION)
+        self.posts = PostStore(REQUEST_CACHE_LOCATION / 'posts' / self.cache_key)
+        self.latency = LatencyTracker(self.store.directory / 'latency.json')
         if clear_cache:
-            self.session.cache.clear()
+            self.clear_caches()
+
+    @classmethod
+    def clear_caches(cls) -> None:
+        """Clear the cached responses, and the items and posts of `cache_key`.
+
+        Instances searching concurrently share these caches, so they are
+        cleared once before the instances are created.
+
+        Returns:
+            None
+        """
+        SharedFileCache(REQUEST_CACHE_LOCATION).clear()
+        ItemStore(REQUEST_CACHE_LOCATION / 'items' / cls.cache_key, REQUEST_CACHE_DURATION).clear()
+        PostStore(REQUEST_CACHE_LOCATION / 'posts' / cls.cache_key).clear()
+
+    def fetch_items(
+        self,
+        url: str,
+        params: dict,
+        fields: Optional[Iterable[str]] = None,
+        all_pages: bool = False,
+        **kwargs: Any,
+    ) -> list[dict]:
+        """Request the `items` of a JSON response, bypassing the caches.
+
+        Requests that take longer than usual are hedged: a second request
+        is sent after the 95th percentile of recent response times and the
+        first response is used.
+
+        Args:
+            url: The url to request.
+            params: The query parameters.
+            fields: The fields of each item to keep. None keeps all fields.
+            all_pages: If True, request the following pages while the
+                response `has_more` items, and return the items of all pages.
+            **kwargs: Passed on to `session.get`.
+
+        Returns:
+            The items of the response.
+        """
+        def request(params: dict) -> dict:
+            response = self.api_session.get(url, params=params, **kwargs)
+            response.raise_for_status()
+            data = self.api_session.json(response)
+            API_RESPONSE_SIZE.observe(len(response.content), api=self.cache_key)
+            if 'quota_remaining' in data:
+                API_QUOTA.set(data['quota_remaining'], api=self.cache_key)
+            return data
+
+        items: list[dict] = []
+        page = int(params.get('page', 1))
+        while True:
+            page_params = {**params, 'page': page} if all_pages else params
+            start = time.monotonic()
+            data = hedged(partial(request, page_params), self.latency.percentile(95))
+            elapsed = time.monotonic() - start
+            self.latency.record(elapsed)
+            API_REQUESTS.observe(elapsed, api=self.cache_key)
+            items.extend(trim(data['items'], fields))
+            if not (all_pages and data.get('has_more') and data['items']):
+                return items
+            page += 1
+
+    def get_items(
+        self,
+        url: str,
+        params: dict,
+        fields: Optional[Iterable[str]] = None,
+        cached_only: bool = False,
+        incremental: Optional[str] = None,
+        activity: Optional[int] = None,
+        posts: Optional[str] = None,
+        **kwargs: Any,
+    ) -> list[dict]:
+        """Get the `items` of a JSON response through the item store.
+
+        The response itself is not cached, only its items trimmed to
+        `fields`, which makes cache hits much cheaper to read. Expired
+        items are returned right away and fetched again in the background.
+        Requests are sent with `fetch_items`.
+
+        Args:
+            url: The url to request.
+            params: The query parameters.
+            fields: The fields of each item to keep. None keeps all fields.
+            cached_only: If True, never send a request. Items of any age are
+                returned and an empty list if nothing is cached.
+            incremental: The field identifying the items, e.g. `answer_id`.
+                When set, expired items are refreshed by requesting only the
+                items with activity since the newest stored one. Requires
+                items sorted by activity, the API's default sort.
+            activity: The newest activity of the posts the items belong to,
+                e.g. of the questions whose answers are requested. If no
+                stored item is older, they are kept without a request.
+            posts: The kind of posts the items are, e.g.
+                `stackoverflow-questions`. Requires `incremental`. Each item
+                is kept once in the post store, shared with other requests
+                returning it, and the entry only keeps the IDs in order.
+            **kwargs: Passed on to `session.get`.
+
+        Returns:
+            The items of the response.
+        """
+        if posts is not None and incremental is None:
+            raise ValueError("Storing posts by ID requires `incremental`")
+
+        key = ItemStore.key(url, params)
+        if cached_only:
+            entry = self.store.read(key)
+            CACHE_LOOKUPS.inc(store=self.cache_key, result="miss" if entry is None else "hit")
+            items = [] if entry is None else entry.items
+            if posts is None or incremental is None:
+                return items
+            return self._stored_posts(posts, incremental, items)
+
+        def fetch(params: dict = params) -> list[dict]:
+            items = self.fetch_items(url, params, fields, **kwargs)
+            if posts is None or incremental is None:
+                return items
+            self.posts.put_posts(posts, {item[incremental]: item for item in items})
+            return trim(items, (incremental, 'last_activity_date'))
+
+        def refresh(id_field: str) -> list[dict]:
+            entry = self.store.read(key)
+            since = None if entry is None else latest_activity(entry.items)
+            if entry is None or since is None:
+                return fetch()
+            if activity is not None and activity <= since:
+                CACHE_LOOKUPS.inc(store=self.cache_key, result="unchanged")
+                return entry.items
+            changed = fetch({**params, 'sort': 'activity', 'min': since})
+            CACHE_LOOKUPS.inc(store=self.cache_key, result="refreshed")
+            return merge_changed(entry.items, changed, id_field, limit=int(params.get('pagesize', 30)))
+
+        if incremental is None:
+            return self.store.get_or_fetch(key, fetch, stale_for=REQUEST_CACHE_STALE_DURATION)
+        items = self.store.get_or_fetch(key, partial(refresh, incremental), stale_for=REQUEST_CACHE_STALE_DURATION)
+        if posts is None:
+            return items
+
+        found = self._stored_posts(posts, incremental, items)
+        if len(found) < len(items):  # Posts removed from the store or an entry of an older version
+            with self.store.lock(key):
+                items = fetch()
+                self.store.put(key, items)
+            found = self._stored_posts(posts, incremental, items)
+        return found
+
+    def _stored_posts(self, kind: str, id_field: str, items: list[dict]) -> list[dict]:
+        """Read the posts of the IDs kept by an entry, in order, skipping missing ones."""
+        found = self.posts.get_posts(kind, [item[id_field] for item in items])
+        return [found[item[id_field]] for item in items if item[id_field] in found]
 
     def __del__(self) -> None:
-        """Close the session on exit."""
+        """Close the sessions on exit."""
         self.session.close()
+        self.api_session.close()
+
+
+def cache_size() -> int:
+    """Total size of the files in the request cache in bytes."""
+    if not REQUEST_CACHE_LOCATION.is_dir():
+        return 0
+    return sum(path.stat().st_size for path in REQUEST_CACHE_LOCATION.rglob('*') if path.is_file())
@@ -0,0 +1,147 @@
+"""Offline documentation for Python exceptions.
+
+The index is compiled by `build.py` from the builtin exception hierarchy and
+common causes. It is loaded once and looking up an error only needs a few
+dictionary accesses and regex matches, so it is available instantly and
+without a network connection.
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import Optional, Pattern
+
+from rich.markup import escape
+from rich.text import Text
+
+from wtpython.settings import EXCEPTION_INDEX_LOCATION
+
+from .knowledge import KnowledgeBackend
+from .stackoverflow import StackOverflowQuestion
+from .trace import Trace
+
+
+class ExceptionDocs:
+    """Lookups in the bundled exception index."""
+
+    _index: Optional[dict] = None
+    _patterns: dict[str, Pattern] = {}
+
+    @classmethod
+    def index(cls) -> dict:
+        """Load the exception index on first use."""
+        if cls._index is None:
+            cls._index = json.loads(EXCEPTION_INDEX_LOCATION.read_text(encoding='utf-8'))
+        return cls._index
+
+    @classmethod
+    def pattern(cls, pattern: str) -> Pattern:
+        """Compile a message pattern on first use."""
+        if pattern not in cls._patterns:
+            cls._patterns[pattern] = re.compile(pattern, re.DOTALL)
+        return cls._patterns[pattern]
+
+    @classmethod
+    def lookup(cls, etypes: list[str], message: str) -> Optional[dict]:
+        """Find documentation for an error.
+
+        The first documented type in `etypes` is used, so exceptions defined
+        by libraries fall back on the builtin exception they inherit from.
+
+        Args:
+            etypes: The error type and its base classes, most specific first.
+            message: The error message without the error type.
+
+        Returns:
+            A dictionary with the exception `name`, its index `entry` and the
+            `causes` for the message, or None if the type is not documented.
+        """
+        exceptions = cls.index()['exceptions']
+        for name in etypes:
+            entry = exceptions.get(name)
+            if entry is not None:
+                break
+        else:
+            return None
+
+        causes = entry['causes']
+        for note in entry['notes']:
+            match = cls.pattern(note['pattern']).match(message)
+            if match:
+                fields = match.groupdict()
+                causes = re.sub(r"\{(\w+)\}", lambda m: fields.get(m[1], m[0]), note['causes'])
+                break
+
+        return {"name": name, "entry": entry, "causes": causes}
+
+
+class ExceptionDocsQuestion(StackOverflowQuestion):
+    """Documentation for the error shown like a question."""
+
+    def __init__(self, ix: int, docs: dict) -> None:
+        """Create the entry from an `ExceptionDocs.lookup` result.
+
+        Args:
+            ix: The index of the question in the list of questions.
+            docs: The lookup result.
+
+        Returns:
+            None
+        """
+        self.docs = docs
+        data = {
+            "title": f"{docs['name']} (Python docs)",
+            "link": docs['entry']['url'],
+            "score": 0,
+            "answer_count": 0,
+            "is_answered": False,
+            "body": "",
+        }
+        super().__init__(ix, data, source=ExceptionDocsBackend.name)
+
+    @property
+    def source_label(self) -> str:
+        """The title already names the source."""
+        return ''
+
+    def sidebar(self, ix: int, highlighted: Optional[int]) -> Text:
+        """Render information for sidebar mode."""
+        color = 'yellow' if ix == self.ix else ('grey' if highlighted == self.ix else 'white')
+        return Text.assemble(
+            (f"#{self.ix + 1} ", color),
+            ("Docs", f"{color} bold"),
+            (f" - {self.title}", color),
+        )
+
+    def posts(self) -> list[str]:
+        """Render the documentation as a single post."""
+        entry = self.docs['entry']
+        hierarchy = ' → '.join(reversed([self.docs['name'], *entry['bases']]))
+        text = '\n'.join([
+            "---",
+            f"## {self.title}",
+            "---",
+            entry['doc'],
+            "",
+            f"**Hierarchy:** {hierarchy}",
+            "",
+        ])
+        if self.docs['causes']:
+            text += '\n'.join(["", "### Common causes", "", self.docs['causes'], ""])
+        return [text + f"\n[Documentation]({self.url})\n"]
+
+    def no_display(self) -> str:
+        """Render information for no-display mode."""
+        return escape(f"{self.title}: {self.docs['entry']['doc']}\n{self.docs['causes']}\n")
+
+
+class ExceptionDocsBackend(KnowledgeBackend):
+    """Knowledge backend for the bundled exception documentation."""
+
+    name = 'docs'
+    priority = 0
+
+    def search(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Look up the error in the exception index."""
+        docs = ExceptionDocs.lookup(trace.etype_hierarchy, trace.message)
+        return [] if docs is None else [ExceptionDocsQuestion(0, docs)]
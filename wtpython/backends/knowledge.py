@@ -0,0 +1,252 @@
+"""Knowledge backends that can be searched for a traceback.
+
+Every backend returns a list of `StackOverflowQuestion` objects so results
+from different sources can be merged and displayed together. Items from
+sources other than the Stack Exchange API are expected to follow the same
+shape as the API's question items with an optional `answers` list.
+"""
+from __future__ import annotations
+
+import json
+import re
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Sequence
+
+from wtpython.settings import (
+    KNOWLEDGE_BASE_URL, OFFLINE_INDEX_LOCATION, SO_MAX_RESULTS
+)
+
+from .cache import CachedResponse
+from .stackoverflow import (
+    StackOverflow, StackOverflowAnswer, StackOverflowQuestion
+)
+from .trace import Trace
+
+
+def questions_from_items(items: list[dict], source: str) -> list[StackOverflowQuestion]:
+    """Create questions with their answers from API shaped items.
+
+    Args:
+        items: Question items, each with an optional list of `answers`.
+        source: The name of the backend the items came from.
+
+    Returns:
+        A list of questions.
+    """
+    questions = []
+    for ix, item in enumerate(items):
+        question = StackOverflowQuestion(ix, item, source=source)
+        question.answers = [StackOverflowAnswer(answer) for answer in item.get('answers', [])]
+        questions.append(question)
+    return questions
+
+
+class KnowledgeBackend(ABC):
+    """Interface for sources of questions and answers.
+
+    `priority` is used to rank results from different backends. Lower
+    priorities are shown first; results with equal priority are ranked
+    by score.
+    """
+
+    name = 'backend'
+    priority = 10
+
+    @abstractmethod
+    def search(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Search the backend for a traceback.
+
+        Args:
+            trace: The wtpython Trace object.
+
+        Returns:
+            A list of questions, possibly empty.
+        """
+
+    def fallback(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Return results to show when the backend misses the deadline.
+
+        This must not use the network. By default there are none.
+
+        Args:
+            trace: The wtpython Trace object.
+
+        Returns:
+            A list of questions, possibly empty.
+        """
+        return []
+
+    def search_many(self, traces: Sequence[Trace]) -> list[list[StackOverflowQuestion]]:
+        """Search the backend for several tracebacks, e.g. of an exception chain.
+
+        By default `search` is called for each traceback concurrently.
+        Backends that can share work between the searches override this.
+
+        Args:
+            traces: The wtpython Trace objects.
+
+        Returns:
+            The questions for each traceback, in the same order.
+        """
+        if len(traces) == 1:
+            return [self.search(traces[0])]
+        with ThreadPoolExecutor(max_workers=len(traces)) as pool:
+            return list(pool.map(self.search, traces))
+
+    def fallback_many(self, traces: Sequence[Trace]) -> list[list[StackOverflowQuestion]]:
+        """Return results for several tracebacks when the backend misses the deadline.
+
+        Args:
+            traces: The wtpython Trace objects.
+
+        Returns:
+            The questions for each traceback, in the same order.
+        """
+        return [self.fallback(trace) for trace in traces]
+
+
+class StackExchangeBackend(KnowledgeBackend):
+    """Search StackOverflow or another Stack Exchange site.
+
+    With `clear_cache`, the caches are cleared once when the backend is
+    created rather than by every search.
+    """
+
+    def __init__(self, site: str = 'stackoverflow', clear_cache: bool = False) -> None:
+        self.name = site
+        self.site = site
+        if clear_cache:
+            StackOverflow.clear_caches()
+
+    def search(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Search the Stack Exchange API."""
+        return StackOverflow.search(trace, site=self.site).questions
+
+    def search_many(self, traces: Sequence[Trace]) -> list[list[StackOverflowQuestion]]:
+        """Search the Stack Exchange API, fetching the answers of all searches at once."""
+        return [so.questions for so in StackOverflow.search_many(traces, site=self.site)]
+
+    def fallback(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Return cached results of any age, otherwise results from the offline index."""
+        questions = StackOverflow.search(trace, site=self.site, cached_only=True).questions
+        return questions or OfflineIndexBackend().search(trace)
+
+
+class OfflineIndexBackend(KnowledgeBackend):
+    """Search a local JSON index of questions and answers.
+
+    The index is a JSON list of question items. Questions are ranked by
+    how many words of the error message appear in their title and tags.
+    """
+
+    name = 'offline'
+    priority = 20
+
+    def __init__(self, path: Path = OFFLINE_INDEX_LOCATION) -> None:
+        self.path = Path(path)
+
+    @staticmethod
+    def tokens(text: str) -> set[str]:
+        """Lowercase words of a text."""
+        return set(re.findall(r"\w+", text.lower()))
+
+    def search(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Search the index for the error message."""
+        if not self.path.is_file():
+            return []
+
+        query = self.tokens(trace.error)
+        scored = []
+        for item in json.loads(self.path.read_text(encoding='utf-8')):
+            words = self.tokens(' '.join([item.get('title', ''), *item.get('tags', [])]))
+            overlap = len(query & words)
+            if overlap:
+                scored.append((overlap, item))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        return questions_from_items([item for _, item in scored[:SO_MAX_RESULTS]], self.name)
+
+
+class HTTPKnowledgeBackend(CachedResponse, KnowledgeBackend):
+    """Search a knowledge base behind a local HTTP endpoint.
+
+    The endpoint receives the error as `q` and the error type as `etype`
+    and should answer with `{"items": [...]}` of question items.
+    """
+
+    name = 'kb'
+    priority = 5
+    cache_key = 'knowledge'
+    timeout = 5
+
+    def __init__(self, url: str = KNOWLEDGE_BASE_URL, clear_cache: bool = False) -> None:
+        super().__init__(clear_cache=clear_cache)
+        self.url = url
+
+    def search(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Query the knowledge base."""
+        params = {"q": trace.error, "etype": trace.etype}
+        items = self.get_items(self.url, params, timeout=self.timeout)
+        return questions_from_items(items, self.name)
+
+    def fallback(self, trace: Trace) -> list[StackOverflowQuestion]:
+        """Return cached results of any age."""
+        params = {"q": trace.error, "etype": trace.etype}
+        return questions_from_items(self.get_items(self.url, params, cached_only=True), self.name)
+
+
+def _exception_docs(arg: str, clear_cache: bool) -> KnowledgeBackend:
+    """Create the exception documentation backend, which imports this module."""
+    from .exception_docs import ExceptionDocsBackend
+    return ExceptionDocsBackend()
+
+
+BACKENDS: dict[str, Callable[..., KnowledgeBackend]] = {
+    'docs': _exception_docs,
+    'stackoverflow': lambda arg, clear_cache: StackExchangeBackend(arg or 'stackoverflow', clear_cache),
+    'stackexchange': lambda arg, clear_cache: StackExchangeBackend(arg or 'stackoverflow', clear_cache),
+    'offline': lambda arg, clear_cache: OfflineIndexBackend(Path(arg) if arg else OFFLINE_INDEX_LOCATION),
+    'kb': lambda arg, clear_cache: HTTPKnowledgeBackend(arg or KNOWLEDGE_BASE_URL, clear_cache),
+}
+
+
+def create_backend(spec: str, clear_cache: bool = False) -> KnowledgeBackend:
+    """Create a backend from a `name[:argument]` specification.
+
+    Examples are `stackoverflow`, `stackexchange:superuser`,
+    `offline:/path/to/index.json` and `kb:http://localhost:8765/search`.
+
+    Args:
+        spec: The backend specification.
+        clear_cache: If True, clear the cache of backends that have one.
+
+    Returns:
+        The backend.
+    """
+    name, _, arg = spec.partition(':')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown source {name!r}, choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](arg, clear_cache)
+
+
+def create_backends(specs: Iterable[str], clear_cache: bool = False) -> list[KnowledgeBackend]:
+    """Create the backends for several specifications.
+
+    Results are told apart by backend name, so two specifications for the
+    same name, like `stackoverflow` and `stackexchange`, are rejected.
+
+    Args:
+        specs: The backend specifications.
+        clear_cache: If True, clear the cache of backends that have one.
+
+    Returns:
+        The backends, in the order of their specifications.
+    """
+    backends: dict[str, KnowledgeBackend] = {}
+    for spec in specs:
+        backend = create_backend(spec, clear_cache)
+        if backend.name in backends:
+            raise ValueError(f"Source {spec!r} repeats the source named {backend.name!r}")
+        backends[backend.name] = backend
+    return list(backends.values())
@@ -0,0 +1,105 @@
+"""Build the Stack Exchange search for a traceback.
+
+Searching for the error message as printed rarely finds anything, because
+messages contain the names and values of the user's program. Instead the
+query is built from:
+
+- the exception type,
+- the message template: the first sentence of the message without quoted
+  values, numbers, addresses, paths, dotted names and a trailing `: value`,
+  except quoted names of builtins and modules, which are shared by
+  everyone who hits the error (`'NoneType' object has no attribute`,
+  `No module named 'yaml'`),
+- the third party package the user's code called into, used as the tag
+  filter instead of `python`.
+
+This makes a single advanced search request good enough, so there is no
+second search for the exception type alone when the first one comes back
+empty.
+"""
+from __future__ import annotations
+
+import builtins
+import re
+from typing import NamedTuple, Optional
+
+from .trace import VARIABLE_PARTS, Trace
+
+# Quoted values that are kept in the message template
+SHARED_NAMES = {name for name in dir(builtins) if not name.startswith("_")} | {"NoneType"}
+MODULE_NAME = re.compile(r"(?:module|named) $")
+TRAILING_VALUE = re.compile(r":\s+\S+$")
+PROGRAM_NAMES = re.compile(r"\S*/\S*|\w+(?:\.\w+)+|\w+=")  # Paths, dotted names and keyword arguments
+PUNCTUATION = re.compile(r"[^\w\s]")
+MAX_WORDS = 10  # Every word has to match, long queries find nothing
+
+# Stack Overflow tags of packages whose tag differs from the import name
+LIBRARY_TAGS = {
+    "bs4": "beautifulsoup",
+    "requests": "python-requests",
+    "cv2": "opencv",
+    "PIL": "python-imaging-library",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "yaml": "pyyaml",
+    "dateutil": "python-dateutil",
+    "serial": "pyserial",
+    "telegram": "python-telegram-bot",
+    "discord": "discord.py",
+    "googleapiclient": "google-api-python-client",
+}
+
+
+class SearchQuery(NamedTuple):
+    """Parameters of a Stack Exchange advanced search."""
+
+    q: str
+    tagged: str
+
+    @property
+    def params(self) -> dict[str, str]:
+        """Query parameters of the request."""
+        return {"q": self.q, "tagged": self.tagged}
+
+
+def message_template(message: str) -> str:
+    """Remove the parts of an error message that are specific to a program.
+
+    Args:
+        message: The error message, without the error type.
+
+    Returns:
+        The words of the message that are shared by everyone hitting the error.
+    """
+    sentence = TRAILING_VALUE.sub("", re.split(r"\.\s", message, maxsplit=1)[0])
+
+    def replace(match: re.Match) -> str:
+        value = match.group()
+        name = value.strip("'\"")
+        if name in SHARED_NAMES or (value[0] in "'\"" and MODULE_NAME.search(sentence[:match.start()])):
+            return name
+        return " "
+
+    template = PUNCTUATION.sub(" ", PROGRAM_NAMES.sub(" ", VARIABLE_PARTS.sub(replace, sentence)))
+    return " ".join([word for word in template.split() if len(word) > 1][:MAX_WORDS])
+
+
+def library_tag(library: Optional[str]) -> Optional[str]:
+    """Stack Overflow tag of a package."""
+    if not library:
+        return None
+    return LIBRARY_TAGS.get(library, library.lower().replace("_", "-"))
+
+
+def build_query(trace: Trace) -> SearchQuery:
+    """Build the search for a traceback.
+
+    Args:
+        trace: The wtpython Trace object.
+
+    Returns:
+        The search query.
+    """
+    template = message_template(trace.message)
+    words = [trace.etype, *[word for word in template.split() if word != trace.etype]]
+    return SearchQuery(q=" ".join(words), tagged=library_tag(trace.library) or "python")
@@ -0,0 +1,137 @@
+"""Index for filtering questions as the user types.
+
+The title, tags, body and answers of each question are split into words.
+Each word points to the questions containing it, and the vocabulary is
+indexed by trigrams (three character substrings), so a query word only
+looks at the postings of its own trigrams instead of scanning every post.
+Questions can be added and updated one at a time, for example when their
+answers arrive.
+
+Query words match words that contain them, so typing a prefix is enough.
+Words of five or more characters also match with one typo (a missing,
+extra, changed or swapped character).
+"""
+from __future__ import annotations
+
+import html
+import re
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:
+    from .stackoverflow import StackOverflowQuestion
+
+TAG = re.compile(r"<[^>]+>")
+WORD = re.compile(r"[\w.]*\w|[^\w\s]")
+
+
+def trigrams(word: str) -> set[str]:
+    """Three character substrings of a word."""
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Whether two words differ by at most one insertion, deletion, substitution or transposition."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    substituted = a[1:] == b[1:]
+    deleted = a[1:] == b
+    inserted = a == b[1:]
+    transposed = len(a) == len(b) > 1 and a[:2] == b[1::-1] and a[2:] == b[2:]
+    return substituted or deleted or inserted or transposed
+
+
+class QuestionIndex:
+    """Word and trigram index of questions and their answers."""
+
+    fuzzy_length = 5  # Words at least this long may contain a typo
+
+    def __init__(self, questions: Iterable[StackOverflowQuestion] = ()) -> None:
+        self.words: dict[str, set[StackOverflowQuestion]] = defaultdict(set)
+        self.trigrams: dict[str, set[str]] = defaultdict(set)
+        self.question_words: dict[StackOverflowQuestion, set[str]] = {}
+        for question in questions:
+            self.add(question)
+
+    @staticmethod
+    def tokenize(question: StackOverflowQuestion) -> set[str]:
+        """Words of a question's title, tags, body and answers."""
+        parts = [
+            question.title,
+            ' '.join(question.data.get('tags', [])),
+            question.data.get('body', ''),
+            *[answer.data.get('body', '') for answer in question.answers],
+        ]
+        text = html.unescape(TAG.sub(' ', ' '.join(parts)))
+        return set(WORD.findall(text.lower()))
+
+    def add(self, question: StackOverflowQuestion) -> None:
+        """Add a question, or index it again if its answers changed."""
+        self.remove(question)
+        words = self.tokenize(question)
+        self.question_words[question] = words
+        for word in words:
+            if word not in self.words:
+                for trigram in trigrams(word):
+                    self.trigrams[trigram].add(word)
+            self.words[word].add(question)
+
+    update = add
+
+    def remove(self, question: StackOverflowQuestion) -> None:
+        """Remove a question from the index."""
+        for word in self.question_words.pop(question, ()):
+            questions = self.words[word]
+            questions.discard(question)
+            if questions:
+                continue
+            del self.words[word]
+            for trigram in trigrams(word):
+                self.trigrams[trigram].discard(word)
+                if not self.trigrams[trigram]:
+                    del self.trigrams[trigram]
+
+    def match_word(self, query: str) -> set[StackOverflowQuestion]:
+        """Questions with a word that contains the query, or is one typo away."""
+        grams = trigrams(query)
+        if not grams:
+            words = {word for word in self.words if query in word}
+        else:
+            counts = Counter(word for gram in grams for word in self.trigrams.get(gram, ()))
+            words = {word for word, count in counts.items() if count == len(grams) and query in word}
+            if len(query) >= self.fuzzy_length:
+                needed = max(1, len(grams) - 3)  # One typo changes at most three trigrams
+                words.update(
+                    word for word, count in counts.items()
+                    if count >= needed and any(
+                        within_one_edit(query, word[:length])
+                        for length in (len(query) - 1, len(query), len(query) + 1)
+                    )
+                )
+
+        matches: set[StackOverflowQuestion] = set()
+        for word in words:
+            matches.update(self.words[word])
+        return matches
+
+    def search(self, query: str) -> Optional[set[StackOverflowQuestion]]:
+        """Questions matching every word of a query.
+
+        Args:
+            query: The words to search for.
+
+        Returns:
+            The matching questions, or None if the query is empty and
+            every question matches.
+        """
+        matches: Optional[set[StackOverflowQuestion]] = None
+        for word in WORD.findall(query.lower()):
+            found = self.match_word(word)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return set()
+        return matches
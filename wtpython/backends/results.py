@@ -0,0 +1,313 @@
+"""Merge results from several knowledge backends.
+
+All backends are searched in parallel. Results are merged and ranked as
+they arrive and backends that have not answered by the deadline are
+dropped, so adding a backend never adds latency. Dropped backends and
+backends that failed, e.g. while offline, are asked for their cached or
+offline results instead.
+
+When the error was raised from or while handling other errors, every
+error of the chain is searched for in the same pass and the questions are
+grouped per error, see `Trace.chain`.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
+from typing import Callable, Optional, Sequence, cast
+
+from wtpython.settings import BACKEND_DEADLINE
+
+from .knowledge import KnowledgeBackend
+from .search_engine import SearchEngine
+from .stackoverflow import QuestionList, StackOverflowQuestion
+from .trace import Trace
+
+ResultCallback = Callable[[KnowledgeBackend, "list[StackOverflowQuestion]"], None]
+
+
+class Results(QuestionList):
+    """Questions merged from several knowledge backends.
+
+    This exposes the same display interface as `StackOverflow` so the
+    displays do not need to know where the questions came from.
+    """
+
+    def __init__(self, query: str = '') -> None:
+        """Create an empty set of results.
+
+        Args:
+            query: The query the results are for.
+
+        Returns:
+            None
+        """
+        self._query = query
+        self.index = 0
+        self.highlighted: Optional[int] = None
+        self.questions: list[StackOverflowQuestion] = []
+        self.groups: list[str] = []  # Labels of the errors of a chain, in order
+        self.errors: dict[str, Exception] = {}
+        self.timed_out: list[str] = []
+        self.fallbacks: list[str] = []
+        self._priorities: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, backend: KnowledgeBackend, questions: list[StackOverflowQuestion]) -> None:
+        """Merge questions from a backend and rank all questions again.
+
+        Questions already found by another backend are not added again but
+        keep the better priority of the two backends. Questions are ranked
+        by the group they were found for first.
+
+        Args:
+            backend: The backend the questions came from.
+            questions: The questions to add.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for question in questions:
+                if question.url in self._priorities:
+                    self._priorities[question.url] = min(self._priorities[question.url], backend.priority)
+                else:
+                    self._priorities[question.url] = backend.priority
+                    self.questions.append(question)
+                    if self._search_index is not None:
+                        self._search_index.add(question)
+
+            groups: dict[Optional[str], int] = {label: ix for ix, label in enumerate(self.groups)}
+            self.questions.sort(key=lambda q: (
+                groups.get(q.group, 0), self._priorities[q.url], -q.data.get('score', 0)
+            ))
+            for ix, question in enumerate(self.questions):
+                question.ix = ix
+
+    def pin(self, question: StackOverflowQuestion) -> None:
+        """Show a question first, e.g. the solution pinned for the error.
+
+        The question replaces one with the same URL and keeps its place
+        when more questions are added.
+
+        Args:
+            question: The pinned question.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            question.pinned = True
+            question.group = self.groups[0] if self.groups else None
+            self.questions = [question] + [q for q in self.questions if q.url != question.url]
+            self._priorities[question.url] = -1
+            self._search_index = None
+            for ix, q in enumerate(self.questions):
+                q.ix = ix
+
+    @classmethod
+    def gather(
+        cls,
+        trace: Trace,
+        backends: Sequence[KnowledgeBackend],
+        deadline: float = BACKEND_DEADLINE,
+        on_result: Optional[ResultCallback] = None,
+    ) -> Results:
+        """Search all backends in parallel until the deadline.
+
+        Backends run in daemon threads, so a backend that misses the
+        deadline does not keep wtpython from exiting. The fallback results of
+        backends that missed the deadline or failed, which don't need the
+        network, are used instead. Each backend
+        searches for all errors of the trace's chain at once. Backends are
+        told apart by name, see `create_backends`.
+
+        Args:
+            trace: The wtpython Trace object.
+            backends: The backends to search.
+            deadline: Seconds to wait for backends before giving up on them.
+            on_result: Called with each backend and its questions as they arrive.
+
+        Returns:
+            Results object.
+        """
+        results = cls(trace.error)
+        links = trace.chain
+        traces = [link.trace for link in links]
+        if len(links) > 1:
+            results.groups = [link.label for link in links]
+        queue: Queue = Queue()
+
+        def grouped(found: list[list[StackOverflowQuestion]]) -> list[StackOverflowQuestion]:
+            questions = []
+            for ix, link_questions in enumerate(found):
+                for question in link_questions:
+                    question.group = results.groups[ix] if results.groups else None
+                    questions.append(question)
+            return questions
+
+        def worker(backend: KnowledgeBackend) -> None:
+            try:
+                queue.put((backend, grouped(backend.search_many(traces)), None))
+            except Exception as e:
+                queue.put((backend, [], e))
+
+        for backend in backends:
+            threading.Thread(target=worker, args=(backend,), name=f"wtpython-{backend.name}", daemon=True).start()
+
+        pending = {backend.name for backend in backends}
+        end = time.monotonic() + deadline
+        while pending:
+            try:
+                backend, questions, error = queue.get(timeout=max(0, end - time.monotonic()))
+            except Empty:
+                break
+            pending.discard(backend.name)
+            if error is not None:
+                results.errors[backend.name] = error
+                continue
+            results.add(backend, questions)
+            if on_result is not None:
+                on_result(backend, questions)
+
+        results.timed_out = sorted(pending)
+        for backend in backends:
+            if backend.name not in pending and backend.name not in results.errors:
+                continue
+            try:
+                questions = grouped(backend.fallback_many(traces))
+            except Exception as e:
+                results.errors.setdefault(backend.name, e)
+                continue
+            if questions:
+                results.fallbacks.append(backend.name)
+                results.add(backend, questions)
+                if on_result is not None:
+                    on_result(backend, questions)
+        return results
+
+
+def gather_all(
+    traces: Sequence[Trace],
+    backends: Sequence[KnowledgeBackend],
+    deadline: float = BACKEND_DEADLINE,
+    workers: int = 8,
+) -> list[Results]:
+    """Search for several traces at once.
+
+    The searches run concurrently, so looking up many errors takes about
+    as long as looking up one.
+
+    Args:
+        traces: The traces to search for.
+        backends: The backends to search.
+        deadline: Seconds to wait for backends for each trace.
+        workers: Number of traces searched at the same time.
+
+    Returns:
+        Results for each trace, in the same order.
+    """
+    if not traces:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda trace: Results.gather(trace, backends, deadline), traces))
+
+
+class ErrorSession:
+    """An error shown by the interface, with results looked up on first use.
+
+    Creating a session costs nothing, so an interface can hold many errors
+    and only look up the ones that are shown. `prefetch` starts the lookup
+    in a daemon thread, e.g. for the error likely to be shown next.
+    """
+
+    def __init__(
+        self,
+        trace: Trace,
+        backends: Sequence[KnowledgeBackend] = (),
+        deadline: float = BACKEND_DEADLINE,
+        results: Optional[Results] = None,
+        search_engine: Optional[SearchEngine] = None,
+        title: Optional[str] = None,
+        pinned: Optional[StackOverflowQuestion] = None,
+    ) -> None:
+        """Create a session for an error.
+
+        Args:
+            trace: The wtpython Trace object.
+            backends: The backends to search when the results are needed.
+            deadline: Seconds to wait for backends.
+            results: Results found already. No lookup is done if given.
+            search_engine: The search engine links. Defaults to the error's.
+            title: Name of the session in the interface. Defaults to the error.
+            pinned: The solution pinned for the error, shown first and
+                before the lookup finishes.
+
+        Returns:
+            None
+        """
+        self.trace = trace
+        self.backends = backends
+        self.deadline = deadline
+        self.search_engine = search_engine or SearchEngine(trace)
+        self.title = title or trace.error
+        self.pinned = pinned
+        if results is not None and pinned is not None:
+            results.pin(pinned)
+        self._results = results
+        self._error: Optional[Exception] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the results were looked up."""
+        return self._results is not None or self._error is not None
+
+    def prefetch(self) -> None:
+        """Start looking up the results in the background, unless already started."""
+        with self._lock:
+            if self._results is not None or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._gather, name="wtpython-session", daemon=True)
+            self._thread.start()
+
+    def _gather(self) -> None:
+        """Look up the results."""
+        try:
+            results = Results.gather(self.trace, self.backends, self.deadline)
+            if self.pinned is not None:
+                results.pin(self.pinned)
+            self._results = results
+        except Exception as e:
+            self._error = e
+
+    @property
+    def error(self) -> Optional[Exception]:
+        """The exception raised by the lookup, if it failed."""
+        return self._error
+
+    @property
+    def preview(self) -> Results:
+        """The results if they were looked up, otherwise only the pinned solution.
+
+        Unlike `results`, this never waits nor raises the lookup's exception.
+        """
+        if self._results is not None:
+            return self._results
+        results = Results(self.trace.error)
+        if self.pinned is not None:
+            results.pin(self.pinned)
+        return results
+
+    @property
+    def results(self) -> Results:
+        """The results, waiting for the lookup if it is still running."""
+        self.prefetch()
+        if self._thread is not None:
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return cast(Results, self._results)
@@ -2,16 +2,22 @@
 from __future__ import annotations
 
 import html
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
-from typing import Optional
+from typing import Iterable, Optional, Sequence
+from urllib.parse import quote_plus
 
+from rich.markup import escape
 from rich.text import Text
 
 from wtpython.exceptions import SearchError
-from wtpython.formatters import PythonCodeConverter, rich_link
-from wtpython.settings import SO_MAX_RESULTS
+from wtpython.formatters import StreamingMarkdownConverter, rich_link
+from wtpython.metrics import SEARCH_RESULTS
+from wtpython.settings import SE_MAX_REQUESTS_PER_SECOND, SO_MAX_RESULTS
 
 from .cache import CachedResponse
+from .query import build_query
+from .question_index import QuestionIndex
 from .trace import Trace
 
 
@@ -38,7 +44,7 @@ class StackOverflowAnswer:
 
     def display(self) -> str:
         """Render information for display mode."""
-        converter = PythonCodeConverter()
+        converter = StreamingMarkdownConverter()
 
         text = '\n'.join([
             "---",
@@ -56,19 +62,24 @@ class StackOverflowQuestion:
     This handles the display of questions and associated answers.
     """
 
-    def __init__(self, ix: int, data: dict) -> None:
+    def __init__(self, ix: int, data: dict, source: str = "stackoverflow") -> None:
         """Store the json for the question.
 
         Args:
             ix: The index of the question in the list of questions.
             data: The json data for the question provided by the API.
+            source: The name of the site or backend the question came from.
 
         Returns:
             None
         """
         self.ix = ix
         self.data = data
+        self.source = source
         self.answers: list[StackOverflowAnswer] = []
+        self.markdown: Optional[list[str]] = None  # Converted posts, e.g. loaded from a bundle
+        self.group: Optional[str] = None  # The error of an exception chain the question was found for
+        self.pinned = False  # Pinned as the solution of the error, see `wtpython.history`
 
     @property
     def num_answers(self) -> str:
@@ -88,6 +99,13 @@ class StackOverflowQuestion:
         """Return url for the question."""
         return self.data['link']
 
+    @property
+    def source_label(self) -> str:
+        """Name of the source unless it is StackOverflow, or whether the question is pinned."""
+        if self.pinned:
+            return "(pinned) "
+        return "" if self.source == "stackoverflow" else f"({self.source}) "
+
     @property
     def title(self) -> str:
         """Unescaped HTML title."""
@@ -108,13 +126,15 @@ class StackOverflowQuestion:
         text = Text.assemble(
             (f"#{self.ix + 1} ", color),
             (f"Score {self.data['score']}", f"{color} bold"),
-            (f"{self.answer_accepted} - {self.title}", color),
+            (f"{self.answer_accepted} - {self.source_label}{self.title}", color),
         )
         return text
 
-    def display(self) -> str:
-        """Render information for display mode."""
-        converter = PythonCodeConverter()
+    def posts(self) -> list[str]:
+        """Render the question and each answer as separate markdown posts."""
+        if self.markdown is not None:
+            return self.markdown
+        converter = StreamingMarkdownConverter()
 
         text = '\n'.join([
             "---",
@@ -122,20 +142,121 @@ class StackOverflowQuestion:
             "---",
             converter.convert(self.data['body'])
         ])
-        for answer in self.answers:
-            text += answer.display()
+        return [text, *[answer.display() for answer in self.answers]]
 
-        return text
+    def display(self) -> str:
+        """Render information for display mode."""
+        return ''.join(self.posts())
 
     def no_display(self) -> str:
         """Render information for no-display mode."""
         return dedent(f"""
-            Score {self.data['score']} | {self.data['title']}
+            Score {self.data['score']} | {self.source_label}{self.data['title']}
             {rich_link(self.data['link'])} {self.num_answers} {self.answer_accepted}
         """).lstrip()
 
 
-class StackOverflow(CachedResponse):
+class QuestionList:
+    """Display helpers shared by collections of questions.
+
+    Subclasses provide `questions`, `index`, `highlighted` and `_query`.
+    """
+
+    sidebar_title = "Questions"
+    questions: list[StackOverflowQuestion]
+    index: int
+    highlighted: Optional[int]
+    _query: str
+    _search_index: Optional[QuestionIndex] = None
+
+    @property
+    def search_index(self) -> QuestionIndex:
+        """Index for filtering the questions, built on first use."""
+        if self._search_index is None:
+            self._search_index = QuestionIndex(self.questions)
+        return self._search_index
+
+    def __len__(self) -> int:
+        """Return the number of questions found."""
+        return len(self.questions)
+
+    def __bool__(self) -> bool:
+        """Return whether the query has results."""
+        return bool(self.questions)
+
+    @property
+    def active_url(self) -> str:
+        """Return the url for the current question."""
+        if self.questions:
+            return self.questions[self.index].url
+        return f"https://stackoverflow.com/search?q={quote_plus(self._query)}"
+
+    def sidebar(self, visible: Optional[Iterable[int]] = None) -> list[Text]:
+        """Render information for sidebar mode.
+
+        consolodate sidebar displays for all objects. ix is used to determine
+        if the item is the current one.
+
+        Args:
+            visible: The indexes of the questions to show. Defaults to all.
+        """
+        questions = self.questions if visible is None else [self.questions[ix] for ix in visible]
+        texts = []
+        group = None
+        for q in questions:
+            text = q.sidebar(self.index, self.highlighted)
+            if q.group is not None and q.group != group:
+                text = Text.assemble((f"{q.group}\n", "bold magenta"), text)
+            group = q.group
+            texts.append(text)
+        return texts
+
+    def filter(self, query: str) -> Optional[list[int]]:
+        """Indexes of the questions matching a query, in order.
+
+        Args:
+            query: Words to look for in titles, tags, questions and answers.
+
+        Returns:
+            The indexes, or None if the query is empty.
+        """
+        matches = self.search_index.search(query)
+        if matches is None:
+            return None
+        return [q.ix for q in self.questions if q in matches]
+
+    def display(self) -> str:
+        """Render information for display mode.
+
+        Get the display for the current item.
+        """
+        if self.questions:
+            return self.questions[self.index].display()
+        return "Sorry, we could not find any results."
+
+    def display_posts(self) -> list[str]:
+        """Render information for display mode split per post.
+
+        The virtualized body lays out each post separately so only the
+        visible ones have to be rendered.
+        """
+        if self.questions:
+            return self.questions[self.index].posts()
+        return [self.display()]
+
+    def no_display(self) -> str:
+        """Render information for no-display mode."""
+        lines = []
+        group = None
+        for q in self.questions:
+            if q.group is not None and q.group != group:
+                lines.append(f"[bold magenta]{escape(q.group)}[/]\n")
+            group = q.group
+            lines.append(q.no_display())
+        return "\n".join(lines)
+
+
+class StackOverflow(CachedResponse, QuestionList):
     """Manage results from StackOverflow.
 
     This class can be instantiated by passing a query to the constructor
@@ -159,14 +280,27 @@ class StackOverflow(CachedResponse):
 
     api = "https://api.stackexchange.com/2.3"
     cache_key = 'stackoverflow'
-    sidebar_title = "Questions"
+    rate_limit = SE_MAX_REQUESTS_PER_SECOND
     default_params: dict[str, str] = {
         "site": "stackoverflow",
         "filter": "!6VvPDzQ)xXOrL",
         "order": "desc",
     }
-
-    def __init__(self, query: str = '', clear_cache: bool = False) -> None:
+    # Only these fields are kept in the cache
+    question_fields = (
+        'question_id', 'title', 'link', 'score', 'answer_count', 'is_answered', 'body', 'tags', 'last_activity_date'
+    )
+    answer_fields = ('answer_id', 'question_id', 'score', 'is_accepted', 'body', 'last_activity_date')
+
+    def __init__(
+        self,
+        query: str = '',
+        clear_cache: bool = False,
+        site: str = "stackoverflow",
+        cached_only: bool = False,
+        tagged: str = "python",
+        fetch_answers: bool = True,
+    ) -> None:
         """Search StackOverflow API for the defined query.
 
         self.index is used to track the current question. Initialization
@@ -175,32 +309,91 @@ class StackOverflow(CachedResponse):
         Args:
             query: The query to search for.
             clear_cache: If True, clear the cache before searching.
+            site: The Stack Exchange site to search. Defaults to StackOverflow.
+            cached_only: If True, only use cached results, however old.
+            tagged: Only find questions with this tag.
+            fetch_answers: If False, don't get the answers, e.g. to get the
+                answers of several searches at once.
 
         Returns:
             StackOverflow object.
         """
         super().__init__(clear_cache=clear_cache)
         self._query = query
+        self.tagged = tagged
+        self.site = site
+        self.cached_only = cached_only
         self.index = 0
         self.highlighted = None
-        self.questions = [StackOverflowQuestion(ix, item) for ix, item in enumerate(self._get_questions())]
-        self._get_answers()
+        self.questions = [
+            StackOverflowQuestion(ix, item, source=site)
+            for ix, item in enumerate(self._get_questions())
+        ]
+        if fetch_answers:
+            self._get_answers(self.questions)
 
-    def __len__(self) -> int:
-        """Return the number of questions found."""
-        return len(self.questions)
+    @classmethod
+    def search(
+        cls, trace: Trace, clear_cache: bool = False, site: str = "stackoverflow", cached_only: bool = False
+    ) -> StackOverflow:
+        """Search for a traceback.
 
-    def __bool__(self) -> bool:
-        """Return whether the query has results."""
-        return bool(self.questions)
+        A single search is built from the exception type, the message
+        without the program's own names and values, and the package the
+        error came from, see `wtpython.backends.query`. The returned
+        object may have no questions.
+
+        Args:
+            trace: The wtpython Trace object.
+            clear_cache: If True, clear the cache before searching.
+            site: The Stack Exchange site to search.
+            cached_only: If True, only use cached results, however old.
+
+        Returns:
+            StackOverflow object.
+        """
+        return cls.search_many([trace], clear_cache, site=site, cached_only=cached_only)[0]
+
+    @classmethod
+    def search_many(
+        cls, traces: Sequence[Trace], clear_cache: bool = False, site: str = "stackoverflow", cached_only: bool = False
+    ) -> list[StackOverflow]:
+        """Search for several tracebacks, e.g. the errors of an exception chain.
+
+        The searches run concurrently and the answers to all questions are
+        fetched with one request, so the quota and the time used grow by
+        one search per traceback.
+
+        Args:
+            traces: The wtpython Trace objects.
+            clear_cache: If True, clear the cache before searching.
+            site: The Stack Exchange site to search.
+            cached_only: If True, only use cached results, however old.
+
+        Returns:
+            StackOverflow objects, in the same order as the traces.
+        """
+        if clear_cache:
+            cls.clear_caches()
+
+        def search(trace: Trace) -> StackOverflow:
+            query = build_query(trace)
+            instance = cls(query.q, site=site, cached_only=cached_only, tagged=query.tagged, fetch_answers=False)
+            if not cached_only:
+                SEARCH_RESULTS.observe(len(instance), site=site, query="library" if trace.library else "python")
+            return instance
+
+        with ThreadPoolExecutor(max_workers=max(1, len(traces))) as pool:
+            instances = list(pool.map(search, traces))
+        if instances:
+            instances[0]._get_answers([q for instance in instances for q in instance.questions])
+        return instances
 
     @classmethod
     def from_trace(cls, trace: Trace, clear_cache: bool = False) -> StackOverflow:
         """Initialize from traceback.
 
-        Will search for questions based on the full error message. If no results,
-        this will fall back on just the error type. If no results, this will raise
-        a SearchError.
+        Same as `search` but this will raise a SearchError if there are no results.
 
         Args:
             trace: The wtpython Trace object.
@@ -209,80 +402,84 @@ class StackOverflow(CachedResponse):
         Returns:
             StackOverflow object.
         """
-        for query in [trace.error, trace.etype]:
-            instance = cls(query, clear_cache)
-            if instance:
-                return instance
-
-        raise SearchError(f"No StackOverflow results for {trace.error}")
+        instance = cls.search(trace, clear_cache)
+        if not instance:
+            raise SearchError(f"No StackOverflow results for {trace.error}")
+        return instance
 
-    def _get_questions(self) -> dict:
+    def _get_questions(self) -> list[dict]:
         """Get StackOverflow questions.
 
         https://api.stackexchange.com/docs/advanced-search
-        defaults is a list of items to include with every request.
+        Expired results are refreshed with the questions that had activity
+        since they were fetched, see `CachedResponse.get_items`.
         """
         endpoint = f"{StackOverflow.api}/search/advanced"
-        defaults = ['python']
         params = {
-            "q": ' '.join([*defaults, self._query]),
+            "q": self._query,
+            "tagged": self.tagged,
             "answers": 1,
             "pagesize": SO_MAX_RESULTS,
             **StackOverflow.default_params,
+            "site": self.site,
         }
-        response = self.session.get(endpoint, params=params)
-        return response.json()['items']
+        return self.get_items(
+            endpoint,
+            params,
+            fields=self.question_fields,
+            cached_only=self.cached_only,
+            incremental='question_id',
+            posts=f"{self.site}-questions",
+        )
 
-    def _get_answers(self) -> None:
-        """Get answers for this question.
+    def _get_answers(self, questions: list[StackOverflowQuestion]) -> None:
+        """Get answers for questions.
 
         https://api.stackexchange.com/docs/answers-on-questions
-        The answers for all questions are fetched with one api call. Answers
-        are assigned to the questions based on the asssociated question id.
+        The answers of each question are kept in the post store together
+        with the question's activity date. New answers and edits count as
+        activity on the question, so only the answers of questions that are
+        not stored or had activity since are requested, with one api call
+        per page of answers. Answers are assigned to the questions based on
+        the asssociated question id. Answers are only stored when all the
+        answers of their question were received.
         """
-        question_ids = ";".join([
-            str(q.data['question_id'])
-            for q in self.questions
-        ])
-        endpoint = f"{StackOverflow.api}/questions/{question_ids}/answers"
-        params = {
-            "sort": "activity",
-            **StackOverflow.default_params,
+        if not questions:
+            return
+
+        kind = f"{self.site}-answers"
+        activity = {q.data['question_id']: q.data.get('last_activity_date', 0) for q in questions}
+        answer_count = {q.data['question_id']: q.data.get('answer_count', 0) for q in questions}
+        stored = {
+            question_id: post
+            for question_id, post in self.posts.get_posts(kind, activity).items()
+            if post['last_activity_date'] >= activity[question_id]
         }
-        response = self.session.get(endpoint, params=params)
-        answers = response.json()['items']
-
-        for question in self.questions:
-            question.answers = [
-                StackOverflowAnswer(answer)
-                for answer in answers
-                if answer['question_id'] == question.data['question_id']
-            ]
-
-    @property
-    def active_url(self) -> str:
-        """Return the url for the current question."""
-        if self.questions:
-            return self.questions[self.index].url
-        return "https://stackoverflow.com/search?q={self._query}"
-
-    def sidebar(self) -> list[Text]:
-        """Render information for sidebar mode.
-
-        consolodate sidebar displays for all objects. ix is used to determine
-        if the item is the current one.
-        """
-        return [q.sidebar(self.index, self.highlighted) for q in self.questions]
-
-    def display(self) -> str:
-        """Render information for display mode.
-
-        Get the display for the current item.
-        """
-        if self.questions:
-            return self.questions[self.index].display()
-        return "Sorry, we could not find any results."
-
-    def no_display(self) -> str:
-        """Render information for no-display mode."""
-        return "\n".join([q.no_display() for q in self.questions])
+        missing = sorted(question_id for question_id in activity if question_id not in stored)
+        if missing and not self.cached_only:
+            endpoint = f"{StackOverflow.api}/questions/{';'.join(map(str, missing))}/answers"
+            params = {
+                "sort": "activity",
+                "pagesize": 100,
+                **StackOverflow.default_params,
+                "site": self.site,
+            }
+            answers = self.fetch_items(endpoint, params, fields=self.answer_fields, all_pages=True)
+            fetched = {
+                question_id: {
+                    "question_id": question_id,
+                    "last_activity_date": activity[question_id],
+                    "answers": [answer for answer in answers if answer['question_id'] == question_id],
+                }
+                for question_id in missing
+            }
+            self.posts.put_posts(kind, {
+                question_id: post
+                for question_id, post in fetched.items()
+                if len(post['answers']) >= answer_count[question_id]
+            })
+            stored.update(fetched)
+
+        for question in questions:
+            post = stored.get(question.data['question_id'])
+            question.answers = [StackOverflowAnswer(answer) for answer in post['answers']] if post else []
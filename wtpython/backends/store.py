@@ -0,0 +1,400 @@
+"""Compact on-disk storage for items returned by APIs.
+
+Instead of whole pickled responses, only the decoded and trimmed items of
+a response are stored. Each entry is a small header followed by the
+encoded items:
+
+    magic (4 bytes) | version (1) | codec (1) | padding (2) | expires (8, float)
+
+Entries are read through a memory map and decoded straight from it, so a
+cache hit skips unpickling and JSON parsing of the full response. msgpack
+and zstd are used when installed (`pip install wtpython[fast]`), otherwise
+entries are zlib compressed JSON. Entries written with a codec that is not
+available, or with another format version, are treated as missing.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from wtpython.metrics import CACHE_LOOKUPS
+
+try:
+    import msgpack
+except ImportError:  # Optional, see the `fast` extra
+    msgpack = None  # type: ignore
+
+try:
+    import zstandard
+except ImportError:  # Optional, see the `fast` extra
+    zstandard = None  # type: ignore
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes stay atomic but requests are not coalesced
+    fcntl = None  # type: ignore
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive lock on a file.
+
+    The lock is shared between processes and between threads of one
+    process, since every call opens the file separately.
+
+    Args:
+        path: The lock file. It is created if needed.
+
+    Yields:
+        None
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Write a file so readers see either the old or the new contents.
+
+    Args:
+        path: The file to write.
+        data: The new contents.
+
+    Returns:
+        None
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def trim(items: Iterable[dict], fields: Optional[Iterable[str]]) -> list[dict]:
+    """Keep only the given fields of each item.
+
+    Args:
+        items: The items returned by an API.
+        fields: The fields to keep. None keeps all fields.
+
+    Returns:
+        The trimmed items.
+    """
+    if fields is None:
+        return list(items)
+    fields = tuple(fields)
+    return [{field: item[field] for field in fields if field in item} for item in items]
+
+
+class Codec(NamedTuple):
+    """Functions to encode items and decode them from a buffer."""
+
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[memoryview], Any]
+
+
+JSON_ZLIB = 0
+MSGPACK = 1
+MSGPACK_ZSTD = 2
+
+CODECS: dict[int, Codec] = {
+    JSON_ZLIB: Codec(
+        dumps=lambda items: zlib.compress(json.dumps(items, separators=(',', ':')).encode()),
+        loads=lambda buffer: json.loads(zlib.decompress(buffer)),
+    ),
+}
+if msgpack is not None:
+    CODECS[MSGPACK] = Codec(dumps=msgpack.packb, loads=msgpack.unpackb)
+if msgpack is not None and zstandard is not None:
+    CODECS[MSGPACK_ZSTD] = Codec(
+        dumps=lambda items: zstandard.ZstdCompressor().compress(msgpack.packb(items)),
+        loads=lambda buffer: msgpack.unpackb(zstandard.ZstdDecompressor().decompress(buffer)),
+    )
+
+DEFAULT_CODEC = max(CODECS)
+DECODE_ERRORS: tuple[type[Exception], ...] = (ValueError, zlib.error)
+if zstandard is not None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+
+class Entry(NamedTuple):
+    """Items read from the store and when they expire."""
+
+    items: list[dict]
+    expires: float
+
+    @property
+    def expired(self) -> bool:
+        """Whether the entry is older than the store's `expire_after`."""
+        return self.expires < time.time()
+
+
+class ItemStore:
+    """Directory of compact, expiring entries of API items.
+
+    Files are written atomically, so several processes can share a store.
+    `lock` serializes fetching the same entry.
+    """
+
+    MAGIC = b"WTPI"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBBxxd")
+    suffix = '.bin'
+
+    def __init__(self, directory: Path, expire_after: float, codec: int = DEFAULT_CODEC) -> None:
+        """Create a store in a directory.
+
+        Args:
+            directory: Where entries are stored. Created on the first write.
+            expire_after: Seconds after which entries are treated as missing.
+            codec: The codec used to write entries.
+
+        Returns:
+            None
+        """
+        self.directory = Path(directory)
+        self.expire_after = expire_after
+        self.codec = codec
+        self._revalidating: set[str] = set()
+        self._revalidating_lock = threading.Lock()
+
+    @staticmethod
+    def key(url: str, params: dict) -> str:
+        """Key for a request."""
+        request = json.dumps([url, params], sort_keys=True, default=str)
+        return hashlib.sha256(request.encode()).hexdigest()[:32]
+
+    def path(self, key: str) -> Path:
+        """File of an entry."""
+        return self.directory / f"{key}{self.suffix}"
+
+    def read(self, key: str) -> Optional[Entry]:
+        """Read an entry whether or not it has expired.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The entry, or None if it is missing or was written in a format
+            that can't be read.
+        """
+        try:
+            f = self.path(key).open('rb')
+        except FileNotFoundError:
+            return None
+
+        with f:
+            if os.fstat(f.fileno()).st_size < self.HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                magic, version, codec, expires = self.HEADER.unpack_from(view)
+                if magic != self.MAGIC or version != self.VERSION or codec not in CODECS:
+                    return None
+                with memoryview(view)[self.HEADER.size:] as payload:
+                    try:
+                        return Entry(CODECS[codec].loads(payload), expires)
+                    except DECODE_ERRORS:  # Damaged entry
+                        return None
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        """Read an entry that has not expired.
+
+        Args:
+            key: The key of the entry.
+
+        Returns:
+            The stored items, or None if the entry is missing, expired or
+            can't be read.
+        """
+        entry = self.read(key)
+        if entry is None or entry.expired:
+            return None
+        return entry.items
+
+    def put(self, key: str, items: list[dict]) -> None:
+        """Write an entry.
+
+        Args:
+            key: The key of the entry.
+            items: The items to store.
+
+        Returns:
+            None
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, self.codec, time.time() + self.expire_after)
+        atomic_write(self.path(key), header + CODECS[self.codec].dumps(items))
+
+    def lock(self, key: str) -> Any:
+        """Context manager holding the lock for an entry."""
+        return file_lock(self.directory / 'locks' / f'{key}.lock')
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], list[dict]], stale_for: float = 0) -> list[dict]:
+        """Read an entry, fetching and storing it if needed.
+
+        Only one process or thread fetches a missing entry; the others wait
+        for it and read the stored items. Entries that expired less than
+        `stale_for` seconds ago are returned right away and fetched again
+        in the background ("stale while revalidate").
+
+        Args:
+            key: The key of the entry.
+            fetch: Returns the items when the entry is missing.
+            stale_for: Seconds after expiry that an entry may still be used.
+
+        Returns:
+            The items.
+        """
+        entry = self.read(key)
+        if entry is not None and not entry.expired:
+            CACHE_LOOKUPS.inc(store=self.directory.name, result="hit")
+            return entry.items
+        if entry is not None and time.time() - entry.expires < stale_for:
+            CACHE_LOOKUPS.inc(store=self.directory.name, result="stale")
+            self.revalidate(key, fetch)
+            return entry.items
+
+        result = "hit"  # Another process may have fetched it while we waited
+        with self.lock(key):
+            items = self.get(key)
+            if items is None:
+                result = "miss"
+                items = fetch()
+                self.put(key, items)
+        CACHE_LOOKUPS.inc(store=self.directory.name, result=result)
+        return items
+
+    def revalidate(self, key: str, fetch: Callable[[], list[dict]]) -> None:
+        """Fetch an entry again in a background thread.
+
+        The stale entry is kept if fetching fails. The thread is a daemon
+        thread, so a revalidation still running when wtpython exits is
+        dropped; atomic writes make sure this never damages the entry.
+
+        Args:
+            key: The key of the entry.
+            fetch: Returns the items of the entry.
+
+        Returns:
+            None
+        """
+        with self._revalidating_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def refresh() -> None:
+            try:
+                with self.lock(key):
+                    if self.get(key) is None:
+                        self.put(key, fetch())
+            except Exception:  # noqa: S110 - the stale entry stays usable
+                pass
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=refresh, name=f"wtpython-revalidate-{key}", daemon=True).start()
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        if self.directory.is_dir():
+            for path in self.directory.glob(f"*{self.suffix}"):
+                path.unlink()
+
+    def prune(self, max_entries: int) -> None:
+        """Remove expired entries, then the oldest ones beyond `max_entries`.
+
+        Entries are dated by their files, so pruning decodes none of them.
+
+        Args:
+            max_entries: The number of entries to keep.
+
+        Returns:
+            None
+        """
+        written = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            with suppress(FileNotFoundError):  # Removed by another process
+                written.append((path.stat().st_mtime, path))
+        written.sort(reverse=True)
+        expired = time.time() - self.expire_after
+        for ix, (mtime, path) in enumerate(written):
+            if ix >= max_entries or mtime < expired:
+                with suppress(FileNotFoundError):
+                    path.unlink()
+
+
+class PostStore(ItemStore):
+    """Posts stored once by ID, whichever requests returned them.
+
+    Popular posts are returned by many different requests. Storing each
+    post on its own lets the entries of those requests keep only the IDs,
+    so a post is downloaded and stored once. Posts are grouped by `kind`,
+    e.g. the questions of a site, and don't expire: the lists referring to
+    them tell from activity dates whether a post changed.
+    """
+
+    def __init__(self, directory: Path, codec: int = DEFAULT_CODEC) -> None:
+        """Create a post store in a directory.
+
+        Args:
+            directory: Where posts are stored. Created on the first write.
+            codec: The codec used to write posts.
+
+        Returns:
+            None
+        """
+        super().__init__(directory, expire_after=float('inf'), codec=codec)
+
+    def get_posts(self, kind: str, ids: Iterable[Any]) -> dict[Any, dict]:
+        """Read stored posts.
+
+        Args:
+            kind: The kind of posts, e.g. `stackoverflow-questions`.
+            ids: The IDs of the posts.
+
+        Returns:
+            The posts that are stored, by ID.
+        """
+        posts = {}
+        ids = list(ids)
+        for post_id in ids:
+            entry = self.read(f"{kind}-{post_id}")
+            if entry is not None and entry.items:
+                posts[post_id] = entry.items[0]
+        CACHE_LOOKUPS.inc(len(posts), store="posts", result="hit")
+        CACHE_LOOKUPS.inc(len(ids) - len(posts), store="posts", result="miss")
+        return posts
+
+    def put_posts(self, kind: str, posts: dict[Any, dict]) -> None:
+        """Write posts, replacing stored ones with the same IDs.
+
+        Args:
+            kind: The kind of posts, e.g. `stackoverflow-questions`.
+            posts: The posts by ID.
+
+        Returns:
+            None
+        """
+        for post_id, post in posts.items():
+            self.put(f"{kind}-{post_id}", [post])
@@ -1,11 +1,49 @@
 """Manages information related to the traceback object."""
+from __future__ import annotations
+
+import builtins
+import re
+import sysconfig
 import traceback
 from pathlib import Path
 from types import TracebackType
-from typing import Optional
+from typing import NamedTuple, Optional, Type, TypeVar
 
+from rich.traceback import Trace as RichTrace
 from rich.traceback import Traceback
 
+from wtpython.settings import MAX_CHAIN_LINKS
+
+# Quoted values, numbers and addresses vary between otherwise identical errors
+VARIABLE_PARTS = re.compile(r"'[^']*'|\"[^\"]*\"|\b0x[0-9a-fA-F]+\b|\b\d+(?:\.\d+)?\b")
+
+STDLIB_PATHS = tuple({sysconfig.get_paths()["stdlib"], sysconfig.get_paths()["platstdlib"]})
+PACKAGE_DIRS = {"site-packages", "dist-packages"}
+# Packages whose frames surround the user's code rather than cause the error
+RUNNER_PACKAGES = {"wtpython", "_pytest", "pytest", "pluggy", "xdist", "execnet"}
+
+# How an error in a chain relates to the one before it
+RELATIONS = {
+    "raised": "Raised",
+    "cause": "Caused by",
+    "context": "While handling",
+    "group": "In group",
+}
+
+T = TypeVar("T", bound="Trace")
+
+
+class ChainLink(NamedTuple):
+    """An error of an exception chain and how it relates to the previous one."""
+
+    relation: str  # One of RELATIONS
+    trace: Trace
+
+    @property
+    def label(self) -> str:
+        """Relation and error, e.g. `Caused by KeyError: 'id'`."""
+        return f"{RELATIONS[self.relation]} {self.trace.error}"
+
 
 class Trace:
     """Class for handling the formatting and display of tracebacks."""
@@ -19,6 +57,60 @@ class Trace:
         self._etype = type(exc)
         self._value = exc
         self._tb = Trace.trim_exception_traceback(exc.__traceback__)
+        self.library = Trace.find_library(exc.__traceback__)
+        self._chain: Optional[list[ChainLink]] = None
+
+    @classmethod
+    def from_error(cls, error: str) -> Trace:
+        """Create a trace without traceback from an error message.
+
+        The error type is looked up in builtins so the trace behaves like one
+        of a real exception. Other error types are created on the fly.
+
+        Args:
+            error: Error type and value, e.g. `NameError: name 'x' is not defined`.
+
+        Returns:
+            Trace object.
+        """
+        etype, _, message = error.strip().partition(": ")
+        return cls(cls._exception(etype, message, [etype]))
+
+    @classmethod
+    def from_snapshot(cls: Type[T], snapshot: dict) -> T:
+        """Recreate a trace without traceback from `Trace.snapshot`.
+
+        The error type inherits from the first builtin exception in the
+        snapshot's hierarchy, so lookups fall back the same way as for the
+        original error.
+
+        Args:
+            snapshot: The snapshot of a trace.
+
+        Returns:
+            Trace object.
+        """
+        trace = cls(cls._exception(snapshot["etype"], snapshot["message"], snapshot["etypes"]))
+        trace.library = snapshot.get("library")
+        return trace
+
+    @staticmethod
+    def _exception(etype: str, message: str, etypes: list[str]) -> Exception:
+        """Create an exception of a type named `etype` with a fixed message."""
+        for name in etypes:
+            base = getattr(builtins, name, None)
+            if isinstance(base, type) and issubclass(base, BaseException):
+                break
+        else:
+            base = Exception
+        exc_class = type(etype, (base,), {
+            "__module__": "builtins",
+            "__str__": lambda self: message,
+        })
+        try:
+            return exc_class(message)
+        except TypeError:  # e.g. UnicodeDecodeError takes five arguments
+            return BaseException.__new__(exc_class)
 
     @staticmethod
     def trim_exception_traceback(tb: Optional[TracebackType]) -> Optional[TracebackType]:
@@ -48,11 +140,90 @@ class Trace:
 
         return tb
 
+    @staticmethod
+    def find_library(tb: Optional[TracebackType]) -> Optional[str]:
+        """Find the third party package the user's code called into.
+
+        This is the package of the first installed (site-packages) frame
+        after the last frame of the user's own code, e.g. `pandas` when a
+        script calls pandas which fails inside numpy. Frames of the
+        standard library and of test runners are skipped.
+
+        Args:
+            tb: The traceback, including the frames of the runner.
+
+        Returns:
+            The top level package name, or None if the error was raised
+            outside of third party code.
+        """
+        library = None
+        for frame in traceback.extract_tb(tb):
+            parts = Path(frame.filename).parts
+            installed = [i for i, part in enumerate(parts) if part in PACKAGE_DIRS]
+            if installed:
+                package = Path(parts[installed[-1] + 1]).stem if len(parts) > installed[-1] + 1 else None
+                if library is None and package not in RUNNER_PACKAGES:
+                    library = package
+            elif not frame.filename.startswith(("<", *STDLIB_PATHS)):  # The user's code
+                library = None
+        return library
+
+    @property
+    def chain(self) -> list[ChainLink]:
+        """The error and the errors it was raised from, while handling or with.
+
+        The chain follows `raise ... from` causes, the errors being handled
+        when an error was raised, unless suppressed with `from None`, and
+        the members of exception groups, outermost first. Errors with the
+        same signature as an earlier one are skipped and at most
+        MAX_CHAIN_LINKS errors are kept, since each one is searched for.
+        """
+        if self._chain is None:
+            self._chain = [ChainLink("raised", self)]
+            signatures = {self.signature}
+            seen = {id(self._value)}
+            pending: list[tuple[str, BaseException]] = list(self.linked_errors(self._value))
+            while pending and len(self._chain) < MAX_CHAIN_LINKS:
+                relation, exc = pending.pop(0)
+                if id(exc) in seen:
+                    continue
+                seen.add(id(exc))
+                pending.extend(self.linked_errors(exc))
+                trace = Trace(exc)  # type: ignore
+                if trace.signature not in signatures:
+                    signatures.add(trace.signature)
+                    self._chain.append(ChainLink(relation, trace))
+        return self._chain
+
+    @staticmethod
+    def linked_errors(exc: BaseException) -> list[tuple[str, BaseException]]:
+        """Errors directly linked to an error, with their relation."""
+        linked: list[tuple[str, BaseException]] = []
+        group = getattr(builtins, "BaseExceptionGroup", None)  # Python 3.11+
+        if group is not None and isinstance(exc, group):
+            linked.extend(("group", member) for member in exc.exceptions)
+        if exc.__cause__ is not None:
+            linked.append(("cause", exc.__cause__))
+        elif exc.__context__ is not None and not exc.__suppress_context__:
+            linked.append(("context", exc.__context__))
+        return linked
+
     @property
     def etype(self) -> str:
         """Error Type."""
         return self._etype.__name__
 
+    @property
+    def etype_hierarchy(self) -> list[str]:
+        """Names of the error type and its base classes, most specific first."""
+        names = [cls.__name__ for cls in self._etype.__mro__ if cls is not object]
+        return list(dict.fromkeys(names))  # Recreated types share the name of their base
+
+    @property
+    def message(self) -> str:
+        """Error value without the error type."""
+        return str(self._value)
+
     @property
     def error(self) -> str:
         """Error type and value."""
@@ -62,6 +233,22 @@ class Trace:
             _error = error_lines[-1]
         return _error
 
+    @property
+    def signature(self) -> str:
+        """Error with its variable parts replaced, used to group similar errors."""
+        return f"{self.etype}: {VARIABLE_PARTS.sub('{}', self.message)}"
+
+    def snapshot(self) -> dict:
+        """Picklable and JSON serializable summary of the error, see `from_snapshot`."""
+        return {
+            "etype": self.etype,
+            "etypes": self.etype_hierarchy,
+            "message": self.message,
+            "error": self.error,
+            "signature": self.signature,
+            "library": self.library,
+        }
+
     @property
     def traceback(self) -> str:
         """Full traceback."""
@@ -71,3 +258,41 @@ class Trace:
     def rich_traceback(self) -> Traceback:
         """Rich formatted traceback."""
         return Traceback.from_exception(self._etype, self._value, self._tb)
+
+
+class DetachedTrace(Trace):
+    """Trace of an error raised elsewhere, e.g. in another process.
+
+    It is recreated from `Trace.snapshot` and keeps the formatted traceback
+    of the original error, since the traceback object itself is gone.
+    """
+
+    traceback_text = ""
+    rich_trace: Optional[RichTrace] = None
+
+    @classmethod
+    def from_parts(cls, snapshot: dict, traceback: str, rich_trace: Optional[RichTrace]) -> DetachedTrace:
+        """Recreate a trace.
+
+        Args:
+            snapshot: The snapshot of the original trace.
+            traceback: The full traceback text.
+            rich_trace: The frames of the traceback as extracted by rich.
+
+        Returns:
+            DetachedTrace object.
+        """
+        trace = cls.from_snapshot(snapshot)
+        trace.traceback_text = traceback
+        trace.rich_trace = rich_trace
+        return trace
+
+    @property
+    def traceback(self) -> str:
+        """Full traceback."""
+        return self.traceback_text
+
+    @property
+    def rich_traceback(self) -> Traceback:
+        """Rich formatted traceback."""
+        return Traceback(trace=self.rich_trace)
@@ -0,0 +1,94 @@
+"""Fill the request cache ahead of time.
+
+Warming the cache for common errors, for example while building a CI
+image, means the first failures of the day are answered from disk.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+from requests import RequestException
+
+from wtpython.settings import COMMON_ERRORS_LOCATION
+
+from .cache import cache_size
+from .stackoverflow import StackOverflow
+from .trace import Trace
+
+
+def load_signatures(path: Optional[Path] = None) -> list[str]:
+    """Read error signatures, one per line, ignoring blank lines and comments.
+
+    Args:
+        path: File with signatures. Defaults to the built-in list.
+
+    Returns:
+        The signatures without duplicates, in file order.
+    """
+    lines = (path or COMMON_ERRORS_LOCATION).read_text(encoding='utf-8').splitlines()
+    signatures = [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+    return list(dict.fromkeys(signatures))
+
+
+class WarmReport:
+    """Summary of a cache warming run."""
+
+    def __init__(self, results: dict[str, Optional[int]], bytes_stored: int) -> None:
+        """Store the number of questions found per signature.
+
+        Args:
+            results: Number of questions per signature, None if the lookup failed.
+            bytes_stored: Growth of the cache in bytes.
+
+        Returns:
+            None
+        """
+        self.results = results
+        self.bytes_stored = bytes_stored
+
+    @property
+    def covered(self) -> list[str]:
+        """Signatures with at least one question."""
+        return [signature for signature, count in self.results.items() if count]
+
+    @property
+    def failed(self) -> list[str]:
+        """Signatures whose lookup raised an error."""
+        return [signature for signature, count in self.results.items() if count is None]
+
+    @property
+    def coverage(self) -> float:
+        """Fraction of signatures with at least one question."""
+        return len(self.covered) / len(self.results) if self.results else 0.0
+
+
+def _warm_one(signature: str, site: str) -> Optional[int]:
+    """Search for one signature the same way a failing script would."""
+    try:
+        return len(StackOverflow.search(Trace.from_error(signature), site=site))
+    except (RequestException, KeyError, ValueError):
+        return None
+
+
+def warm_cache(signatures: Iterable[str], workers: int = 8, site: str = 'stackoverflow') -> WarmReport:
+    """Fetch questions and answers for every signature into the cache.
+
+    Lookups run in parallel; the rate limit of `StackOverflow` keeps them
+    within the limits of the API.
+
+    Args:
+        signatures: Errors to look up, e.g. `IndexError: list index out of range`.
+        workers: Number of lookups to run at the same time.
+        site: The Stack Exchange site to search.
+
+    Returns:
+        WarmReport object.
+    """
+    signatures = list(signatures)
+    before = cache_size()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(lambda signature: _warm_one(signature, site), signatures)
+        results = dict(zip(signatures, counts))
+    return WarmReport(results, cache_size() - before)
@@ -0,0 +1,359 @@
+"""Group near-duplicate tracebacks from logs.
+
+`wtpython cluster app.log` reads every traceback in the logs and groups
+the ones caused by the same bug, even when their messages contain other
+values or their stacks differ by a frame or two, so each group needs to be
+looked up only once.
+
+Each traceback is reduced to a set of shingles: its error type, pairs of
+words of its signature (see `Trace.signature`) and its innermost
+MAX_FRAMES frames, where tracebacks of different bugs differ; the outer
+frames of a web framework or task runner are shared by all of them. The
+frame that raised the error and its caller are added again, since many
+messages, e.g. of KeyError, have no words left once values are removed.
+Tracebacks with the same shingles are sketched once. The sets are sketched
+with MinHash, CLUSTER_PERMUTATIONS hash functions at a time over batches of
+tracebacks with NumPy, and sketches that agree on a whole band of
+CLUSTER_BANDS bands become candidates (locality sensitive hashing).
+Candidates whose sketches agree on at least CLUSTER_SIMILARITY of the hash
+functions, an estimate of the Jaccard similarity of their shingles, are
+put in the same group.
+
+NumPy is an optional dependency: `pip install wtpython[cluster]`. Reading
+the logs and sketching can be split across processes with `workers`.
+"""
+from __future__ import annotations
+
+import re
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Any, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+)
+
+from requests import RequestException
+
+from wtpython.backends.stackoverflow import (
+    StackOverflow, StackOverflowQuestion
+)
+from wtpython.backends.trace import PACKAGE_DIRS, VARIABLE_PARTS, Trace
+from wtpython.settings import (
+    CLUSTER_BANDS, CLUSTER_BATCH, CLUSTER_PERMUTATIONS, CLUSTER_SIMILARITY
+)
+
+try:
+    import numpy as np
+except ImportError:  # Optional, see the `cluster` extra
+    np = None  # type: ignore
+
+TRACEBACK_START = "Traceback (most recent call last):"
+FRAME = re.compile(r'\s*File "(?P<file>[^"]+)", line \d+, in (?P<function>\S+)')
+CHAINED = ("During handling of the above exception", "The above exception was the direct cause")
+WORD = re.compile(r"\w+|\{\}")
+SEED = 0x77747079  # Sketches of separate runs can be compared
+MAX_FRAMES = 8
+
+Frames = Tuple[str, ...]
+
+
+class LoggedError(NamedTuple):
+    """A traceback read from a log."""
+
+    error: str
+    frames: Frames
+
+    @property
+    def signature(self) -> str:
+        """Error with its variable parts replaced, see `Trace.signature`."""
+        etype, _, message = self.error.partition(": ")
+        return f"{etype}: {VARIABLE_PARTS.sub('{}', message)}"
+
+
+class Cluster(NamedTuple):
+    """Near-duplicate tracebacks."""
+
+    error: str  # The most common error of the group
+    frames: Frames
+    size: int  # Number of tracebacks
+    variants: int  # Number of distinct errors and stacks
+
+
+def frame_name(filename: str, function: str) -> str:
+    """Name of a frame that does not depend on where the code is installed."""
+    parts = re.split(r"[\\/]", filename)
+    for ix in range(len(parts) - 1, -1, -1):
+        if parts[ix] in PACKAGE_DIRS:
+            return f"{'/'.join(parts[ix + 1:])}:{function}"
+    return f"{'/'.join(parts[-2:])}:{function}"
+
+
+def read_tracebacks(lines: Iterable[str]) -> Iterator[LoggedError]:
+    """Find the tracebacks in the lines of a log.
+
+    Text before `Traceback (most recent call last):`, e.g. a container name,
+    is also removed from the lines that follow when they start with it. Of
+    chained exceptions only the last one, which ended the program or was
+    logged, is kept.
+
+    Args:
+        lines: The lines of the log.
+
+    Yields:
+        The tracebacks.
+    """
+    frames: Optional[list[str]] = None
+    prefix = ""
+    pending: Optional[LoggedError] = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        start = line.find(TRACEBACK_START)
+        if start != -1:
+            frames, prefix = [], line[:start]
+            continue
+        if prefix and line.startswith(prefix.rstrip()):  # Blank lines may lack the trailing space
+            line = line[len(prefix):]
+        if frames is None:
+            if pending is not None and not line.startswith(CHAINED) and line.strip():
+                yield pending
+                pending = None
+            continue
+
+        match = FRAME.match(line)
+        if match:
+            frames.append(frame_name(match["file"], match["function"]))
+        elif line and not line[0].isspace():  # The error ends the traceback
+            pending = LoggedError(line.strip(), tuple(frames))
+            frames = None
+    if pending is not None:
+        yield pending
+
+
+def count_file(path: Path) -> Counter:
+    """Count the tracebacks of a log file."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return Counter(read_tracebacks(f))
+
+
+def count_tracebacks(paths: Sequence[Path], workers: int = 1) -> Counter:
+    """Count the tracebacks of log files, reading files in parallel.
+
+    Args:
+        paths: The log files.
+        workers: Number of processes reading files.
+
+    Returns:
+        The number of times each traceback was logged.
+    """
+    counts: Counter = Counter()
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for found in pool.map(count_file, paths):
+                counts.update(found)
+    else:
+        for path in paths:
+            counts.update(count_file(path))
+    return counts
+
+
+def shingles(signature: str, frames: Frames) -> list[int]:
+    """Hashes of the parts of a traceback compared by clustering.
+
+    Args:
+        signature: The error with its variable parts replaced.
+        frames: Names of the frames, outermost first.
+
+    Returns:
+        The distinct 32 bit hashes; never empty.
+    """
+    etype, _, message = signature.partition(": ")
+    words = WORD.findall(message)
+    parts = {f"e:{etype}"}
+    parts.update(f"w:{a} {b}" for a, b in zip(words, words[1:]))
+    parts.update(f"w:{word}" for word in words[:1])
+    parts.update(f"f:{frame}" for frame in frames[-MAX_FRAMES:])
+    parts.update(f"r:{frame}" for frame in frames[-1:])  # Where it was raised counts twice
+    parts.update(f"c:{a}>{b}" for a, b in zip(frames[-2:-1], frames[-1:]))  # And where that was called
+    return [zlib.crc32(part.encode()) for part in parts]
+
+
+def hash_functions(count: int) -> tuple[Any, Any]:
+    """Multipliers and increments of the MinHash functions."""
+    rng = np.random.default_rng(SEED)
+    a = rng.integers(1, 2 ** 63, size=count, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=count, dtype=np.uint64)
+    return a, b
+
+
+def sketch(documents: Sequence[list[int]], permutations: int = CLUSTER_PERMUTATIONS) -> Any:
+    """Compute the MinHash sketches of shingle sets.
+
+    Every shingle is hashed by each function `(a * x + b) mod 2**64 >> 32`
+    at once and the minimum per document is taken with `reduceat`.
+
+    Args:
+        documents: The shingle hashes of each document.
+        permutations: Number of hash functions.
+
+    Returns:
+        Array of shape (documents, permutations).
+    """
+    a, b = hash_functions(permutations)
+    signatures = np.empty((len(documents), permutations), dtype=np.uint32)
+    for start in range(0, len(documents), CLUSTER_BATCH):
+        batch = documents[start:start + CLUSTER_BATCH]
+        lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+        offsets = np.zeros(len(batch), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        values = np.fromiter((x for doc in batch for x in doc), dtype=np.uint64, count=int(lengths.sum()))
+        hashed = (a[:, None] * values[None, :] + b[:, None]) >> np.uint64(32)
+        signatures[start:start + len(batch)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return signatures
+
+
+def sketch_tracebacks(tracebacks: Sequence[tuple[str, Frames]]) -> Any:
+    """Sketch the shingles of tracebacks given by signature and frames."""
+    return sketch([shingles(signature, frames) for signature, frames in tracebacks])
+
+
+def sketch_parallel(tracebacks: Sequence[tuple[str, Frames]], workers: int = 1) -> Any:
+    """Sketch tracebacks, split in shards across processes.
+
+    Args:
+        tracebacks: The signature and frames of each traceback.
+        workers: Number of processes.
+
+    Returns:
+        The same array as `sketch`.
+    """
+    if workers <= 1 or len(tracebacks) <= CLUSTER_BATCH:
+        return sketch_tracebacks(tracebacks)
+    size = -(-len(tracebacks) // workers)
+    shards = [tracebacks[start:start + size] for start in range(0, len(tracebacks), size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return np.concatenate(list(pool.map(sketch_tracebacks, shards)))
+
+
+def components(count: int, left: Any, right: Any) -> Any:
+    """Find the connected components of a graph given as arrays of edges.
+
+    Args:
+        count: Number of nodes.
+        left: One end of each edge.
+        right: The other end of each edge.
+
+    Returns:
+        The smallest node of its component for every node.
+    """
+    labels = np.arange(count)
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def similar_pairs(
+    signatures: Any, bands: int = CLUSTER_BANDS, similarity: float = CLUSTER_SIMILARITY
+) -> tuple[Any, Any]:
+    """Find pairs of sketches that share a band and are similar enough.
+
+    Within a bucket every sketch is compared with the first one, which is
+    enough to connect the bucket once the components are taken.
+
+    Args:
+        signatures: The sketches.
+        bands: Number of bands the sketches are split in.
+        similarity: Minimum fraction of equal hashes.
+
+    Returns:
+        Arrays with the two ends of each pair.
+    """
+    count, permutations = signatures.shape
+    rows = permutations // bands
+    mixers = np.random.default_rng(SEED + 1).integers(1, 2 ** 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    left, right = [], []
+    for band in range(bands):
+        block = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (block * mixers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        starts = np.concatenate(([True], keys[order][1:] != keys[order][:-1]))
+        first = order[np.maximum.accumulate(np.where(starts, np.arange(count), 0))]
+        candidates = order != first
+        members, heads = order[candidates], first[candidates]
+        for start in range(0, len(members), CLUSTER_BATCH):
+            a, b = members[start:start + CLUSTER_BATCH], heads[start:start + CLUSTER_BATCH]
+            close = (signatures[a] == signatures[b]).mean(axis=1) >= similarity
+            left.append(a[close])
+            right.append(b[close])
+    empty = np.empty(0, dtype=np.int64)
+    return np.concatenate([empty, *left]), np.concatenate([empty, *right])
+
+
+def cluster_tracebacks(counts: Counter, workers: int = 1) -> list[Cluster]:
+    """Group near-duplicate tracebacks.
+
+    Args:
+        counts: The number of times each traceback was logged, e.g. from
+            `count_tracebacks`.
+        workers: Number of processes computing sketches.
+
+    Returns:
+        The groups, largest first.
+
+    Raises:
+        ImportError: If NumPy is not installed.
+    """
+    if np is None:
+        raise ImportError("Clustering needs NumPy: pip install wtpython[cluster]")
+    if not counts:
+        return []
+
+    # Tracebacks with the same signature and frames have the same shingles
+    documents: dict[tuple[str, Frames], int] = {}
+    members: list[int] = []
+    for logged in counts:
+        members.append(documents.setdefault((logged.signature, logged.frames), len(documents)))
+    signatures = sketch_parallel(list(documents), workers)
+    labels = components(len(documents), *similar_pairs(signatures))
+
+    groups: dict[int, list[LoggedError]] = {}
+    for logged, document in zip(counts, members):
+        groups.setdefault(int(labels[document]), []).append(logged)
+    clusters = []
+    for group in groups.values():
+        top = max(group, key=counts.__getitem__)
+        clusters.append(Cluster(top.error, top.frames, sum(counts[logged] for logged in group), len(group)))
+    return sorted(clusters, key=lambda cluster: cluster.size, reverse=True)
+
+
+def _top_question(error: str, site: str) -> Optional[StackOverflowQuestion]:
+    """Search for an error the same way a failing script would."""
+    try:
+        so = StackOverflow.search(Trace.from_error(error), site=site)
+    except (RequestException, KeyError, ValueError):
+        return None
+    return so.questions[0] if so.questions else None
+
+
+def lookup_clusters(
+    clusters: Sequence[Cluster], workers: int = 8, site: str = "stackoverflow"
+) -> list[Optional[StackOverflowQuestion]]:
+    """Look up the error of each group once.
+
+    Args:
+        clusters: The groups to look up.
+        workers: Number of lookups to run at the same time.
+        site: The Stack Exchange site to search.
+
+    Returns:
+        The best question for each group, None if there is none or the
+        lookup failed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda cluster: _top_question(cluster.error, site), clusters))
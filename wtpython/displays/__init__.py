@@ -1,3 +1,4 @@
 """Modes for displaying information to the user."""
+from .ndjson import stream_events  # noqa: F401
 from .no_display import dump_info  # noqa: F401
 from .textual_display import TextualDisplay  # noqa: F401
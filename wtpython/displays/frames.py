@@ -0,0 +1,112 @@
+"""Coalesce expensive TUI updates into frames.
+
+Key repeats and terminal resizes arrive much faster than the body and the
+sidebar can be laid out. Instead of updating on every event, handlers
+request named updates from a `FrameScheduler`; requests for the same name
+within one frame replace each other, so only the final state is rendered.
+A request made while no frame ran for an `interval` is rendered right
+away, so single key presses are not delayed.
+
+`FrameStats` measures the time from the first input of a frame until the
+frame is painted, and how long the updates of the frame took.
+"""
+from __future__ import annotations
+
+import time
+from typing import Awaitable, Callable, Optional
+
+from wtpython.metrics import INPUT_TO_PAINT, RENDER_TIME
+from wtpython.settings import FRAME_RATE
+
+UpdateCallback = Callable[[], Awaitable[None]]
+
+
+class FrameStats:
+    """Input-to-paint latency and update times of frames."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.latencies: list[float] = []
+        self.work: list[float] = []
+
+    @property
+    def frames(self) -> int:
+        """Number of frames rendered."""
+        return len(self.work)
+
+    @staticmethod
+    def percentile(samples: list[float], percent: float) -> float:
+        """Value below which `percent` of the samples are, 0 without samples."""
+        if not samples:
+            return 0.0
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def summary(self) -> str:
+        """Human readable summary of the measurements."""
+        latency = [self.percentile(self.latencies, p) * 1000 for p in (50, 95)]
+        work = self.percentile(self.work, 95) * 1000
+        return (
+            f"{self.requests} updates in {self.frames} frames, "
+            f"input-to-paint p50 {latency[0]:.1f} ms, p95 {latency[1]:.1f} ms, "
+            f"update p95 {work:.1f} ms"
+        )
+
+
+class FrameScheduler:
+    """Collect update requests and run them once per frame."""
+
+    def __init__(self, interval: float = 1 / FRAME_RATE, stats: Optional[FrameStats] = None) -> None:
+        self.interval = interval
+        self.stats = stats or FrameStats()
+        self._pending: dict[str, UpdateCallback] = {}
+        self._last_frame = float('-inf')
+        self._input_time: Optional[float] = None
+        self._unpainted: Optional[float] = None
+
+    def request(self, name: str, update: UpdateCallback) -> Optional[float]:
+        """Request an update for the next frame.
+
+        Args:
+            name: What is updated. A later request with the same name
+                replaces this one.
+            update: Coroutine function doing the update.
+
+        Returns:
+            None if a frame is already scheduled. Otherwise the caller has
+            to schedule `flush` after the returned number of seconds: 0 if
+            no frame ran within the last `interval`, else the rest of it.
+        """
+        self.stats.requests += 1
+        first = not self._pending
+        self._pending[name] = update
+        now = time.monotonic()
+        if self._input_time is None:
+            self._input_time = now
+        if not first:
+            return None
+        return max(0.0, self._last_frame + self.interval - now)
+
+    async def flush(self) -> None:
+        """Run the updates requested for this frame."""
+        pending, self._pending = self._pending, {}
+        input_time, self._input_time = self._input_time, None
+        if not pending:
+            return
+
+        start = self._last_frame = time.monotonic()
+        for update in pending.values():
+            await update()
+        work = time.monotonic() - start
+        self.stats.work.append(work)
+        RENDER_TIME.observe(work, display="textual")
+        if self._unpainted is None:
+            self._unpainted = input_time
+
+    def painted(self) -> None:
+        """Record that the screen was painted after the last frame."""
+        if self._unpainted is not None:
+            latency = time.monotonic() - self._unpainted
+            self.stats.latencies.append(latency)
+            INPUT_TO_PAINT.observe(latency)
+            self._unpainted = None
@@ -0,0 +1,155 @@
+"""Cache of highlighted code blocks.
+
+Pygments lexes every fenced code block each time a post is rendered, and
+the same snippets (the traceback, idioms quoted across answers) show up in
+many posts and sessions. Highlighted code blocks are kept in an LRU in
+memory and in a store next to the response cache. They are keyed by a hash
+of the code, lexer, theme and width, so showing or scrolling a post again
+never lexes its code. Since every width a post is shown at adds entries,
+stored blocks expire and the oldest are removed once the store is full.
+"""
+from __future__ import annotations
+
+import hashlib
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, ClassVar, Dict, List, Optional, Type
+
+import pygments  # type: ignore
+from rich.console import Console, ConsoleOptions, RenderResult
+from rich.markdown import CodeBlock, Markdown, MarkdownElement
+from rich.segment import Segment
+from rich.style import Style
+
+from wtpython.backends.store import ItemStore
+from wtpython.metrics import CACHE_LOOKUPS
+from wtpython.settings import (
+    HIGHLIGHT_CACHE_BLOCKS, HIGHLIGHT_CACHE_DURATION, HIGHLIGHT_CACHE_LOCATION,
+    HIGHLIGHT_CACHE_STORED_BLOCKS
+)
+
+if sys.version_info >= (3, 8):
+    from importlib.metadata import version
+else:
+    from importlib_metadata import version
+
+RENDERER = f"rich {version('rich')}, pygments {pygments.__version__}"
+
+Lines = List[List[Segment]]
+
+
+class HighlightCache:
+    """LRU of highlighted code blocks, backed by an optional store.
+
+    The key covers everything the highlighted lines depend on, including
+    the versions of rich and Pygments. Stored blocks expire only to bound
+    the size of the store, which is pruned once per process.
+    """
+
+    def __init__(
+        self,
+        max_cached: int = HIGHLIGHT_CACHE_BLOCKS,
+        directory: Optional[Path] = HIGHLIGHT_CACHE_LOCATION,
+        max_stored: int = HIGHLIGHT_CACHE_STORED_BLOCKS,
+    ) -> None:
+        """Create a cache.
+
+        Args:
+            max_cached: The number of code blocks kept in memory.
+            directory: Where code blocks are stored, or None to keep them
+                in memory only.
+            max_stored: The number of code blocks kept in the store.
+
+        Returns:
+            None
+        """
+        self.max_cached = max_cached
+        self.max_stored = max_stored
+        self.store = None if directory is None else ItemStore(directory, expire_after=HIGHLIGHT_CACHE_DURATION)
+        self._cache: OrderedDict[str, Lines] = OrderedDict()
+        self._pruned = False
+
+    @staticmethod
+    def key(code: str, lexer: str, theme: str, width: int) -> str:
+        """Key for a code block."""
+        block = "\0".join([RENDERER, lexer, theme, str(width), code])
+        return hashlib.sha256(block.encode()).hexdigest()[:32]
+
+    def get_or_render(self, code: str, lexer: str, theme: str, width: int, render: Callable[[], Lines]) -> Lines:
+        """Read highlighted lines, rendering and storing them if needed.
+
+        Args:
+            code: The code of the block.
+            lexer: The name of the Pygments lexer.
+            theme: The name of the Pygments theme.
+            width: The width the block is rendered at.
+            render: Returns the highlighted lines when they are not cached.
+
+        Returns:
+            The lines of the block.
+        """
+        key = self.key(code, lexer, theme, width)
+        lines = self._cache.get(key)
+        if lines is not None:
+            self._cache.move_to_end(key)
+            CACHE_LOOKUPS.inc(store="highlight", result="hit")
+            return lines
+
+        items = self.store.get(key) if self.store is not None else None
+        if items is not None:
+            CACHE_LOOKUPS.inc(store="highlight", result="hit")
+            lines = [
+                [Segment(text, Style.parse(style) if style is not None else None) for text, style in item["segments"]]
+                for item in items
+            ]
+        else:
+            CACHE_LOOKUPS.inc(store="highlight", result="miss")
+            lines = render()
+            if self.store is not None:
+                if not self._pruned:
+                    self._pruned = True
+                    self.store.prune(self.max_stored)
+                self.store.put(key, [
+                    {"segments": [[segment.text, None if segment.style is None else str(segment.style)]
+                                  for segment in line]}
+                    for line in lines
+                ])
+
+        self._cache[key] = lines
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return lines
+
+    def clear(self) -> None:
+        """Remove all highlighted code blocks, in memory and stored."""
+        self._cache.clear()
+        if self.store is not None:
+            self.store.clear()
+
+
+HIGHLIGHT_CACHE = HighlightCache()
+
+
+class CachedCodeBlock(CodeBlock):
+    """Code block highlighted through `HIGHLIGHT_CACHE`."""
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        """Yield the cached lines of the block."""
+        def render() -> Lines:
+            lines: Lines = []
+            for renderable in super(CachedCodeBlock, self).__rich_console__(console, options):
+                lines.extend(console.render_lines(renderable, options))  # type: ignore
+            return lines
+
+        code = str(self.text).rstrip()
+        new_line = Segment.line()
+        for line in HIGHLIGHT_CACHE.get_or_render(code, self.lexer_name, self.theme, options.max_width, render):
+            yield from line
+            yield new_line
+
+
+class HighlightedMarkdown(Markdown):
+    """Markdown with code blocks highlighted through `HIGHLIGHT_CACHE`."""
+
+    elements: ClassVar[Dict[str, Type[MarkdownElement]]] = {**Markdown.elements, "code_block": CachedCodeBlock}
@@ -0,0 +1,112 @@
+"""
+This module streams the information for the no-display option as NDJSON.
+
+Every event is written as one JSON object per line as soon as it is
+available, and the stream is flushed after each line, so tools reading
+the output can act on the first results while slower sources are still
+being searched. Every record has an `event` field:
+
+    trace       the error, its type hierarchy, the traceback and the errors
+                of its exception chain
+    search_url  the url for searching the error with a search engine
+    question    a question found by a knowledge source, with the error of
+                the chain it was found for when there are several
+    answers     the answers of a question, right after the question
+    timing      seconds each source took, sources that missed the deadline,
+                those of them that answered from the cache and sources that
+                failed; always the last record
+"""
+from __future__ import annotations
+
+import json
+import sys
+import time
+from typing import Any, Optional, Sequence, TextIO
+
+from wtpython.backends import KnowledgeBackend, Results, SearchEngine, Trace
+from wtpython.backends.stackoverflow import StackOverflowQuestion
+from wtpython.settings import BACKEND_DEADLINE
+
+
+class NDJSONWriter:
+    """Write events as newline delimited JSON."""
+
+    def __init__(self, stream: Optional[TextIO] = None) -> None:
+        self.stream = stream or sys.stdout
+
+    def write(self, event: str, **fields: Any) -> None:
+        """Write one event and flush it immediately."""
+        self.stream.write(json.dumps({"event": event, **fields}, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+def _question(question: StackOverflowQuestion, source: str) -> dict:
+    """Fields of a question record."""
+    return {
+        "source": source,
+        "title": question.title,
+        "link": question.url,
+        "score": question.data.get('score', 0),
+        "answer_count": question.data.get('answer_count', 0),
+        "is_answered": question.data.get('is_answered', False),
+        "tags": question.data.get('tags', []),
+        "body": question.data.get('body', ''),
+        "group": question.group,
+    }
+
+
+def stream_events(
+    trace: Trace,
+    backends: Sequence[KnowledgeBackend],
+    search_engine: SearchEngine,
+    deadline: float = BACKEND_DEADLINE,
+    stream: Optional[TextIO] = None,
+) -> Results:
+    """Search for the error and stream every result as it arrives.
+
+    Args:
+        trace: The wtpython Trace object.
+        backends: The backends to search.
+        search_engine: SearchEngine object.
+        deadline: Seconds to wait for backends before giving up on them.
+        stream: Where to write the events. Defaults to stdout.
+
+    Returns:
+        The merged results of all backends.
+    """
+    writer = NDJSONWriter(stream)
+    start = time.monotonic()
+    elapsed: dict[str, float] = {}
+
+    writer.write(
+        "trace",
+        **trace.snapshot(),
+        traceback=trace.traceback,
+        chain=[{"relation": link.relation, "error": link.trace.error} for link in trace.chain],
+    )
+    writer.write("search_url", engine=search_engine.engine, url=search_engine.url)
+
+    def on_result(backend: KnowledgeBackend, questions: list[StackOverflowQuestion]) -> None:
+        elapsed[backend.name] = round(time.monotonic() - start, 3)
+        for question in questions:
+            writer.write("question", **_question(question, backend.name))
+            if question.answers:
+                writer.write("answers", link=question.url, answers=[
+                    {
+                        "score": answer.data['score'],
+                        "is_accepted": answer.data['is_accepted'],
+                        "body": answer.data['body'],
+                    }
+                    for answer in question.answers
+                ])
+
+    results = Results.gather(trace, backends, deadline=deadline, on_result=on_result)
+    writer.write(
+        "timing",
+        total=round(time.monotonic() - start, 3),
+        sources=elapsed,
+        timed_out=results.timed_out,
+        fallbacks=results.fallbacks,
+        errors={name: str(error) for name, error in results.errors.items()},
+    )
+    return results
@@ -4,10 +4,13 @@ This module works to dump the information for the no-display option.
 Each data source should have its own function while `dump_info` will
 control the order in which they are displayed.
 """
+import time
+
 from rich import print
 from rich.markdown import HorizontalRule
 
-from wtpython.backends import SearchEngine, StackOverflow
+from wtpython.backends import Results, SearchEngine
+from wtpython.metrics import RENDER_TIME
 from wtpython.settings import SEARCH_ENGINE
 
 
@@ -24,17 +27,23 @@ def _header(txt: str) -> str:
     return f"[yellow]{txt}:[/]\n"
 
 
-def _stackoverflow(so: StackOverflow) -> None:
-    """Dump Stackoverflow questions list.
+def _results(results: Results) -> None:
+    """Dump merged questions list.
 
     Args:
-        so: Stackoverflow object.
+        results: Results object.
 
     Returns:
         None
     """
-    print(_header("Stack Overflow Results"))
-    print(so.no_display())
+    print(_header("Search Results"))
+    print(results.no_display())
+    if results.timed_out:
+        print(f"[grey]Sources that missed the deadline: {', '.join(results.timed_out)}[/]")
+    if results.errors:
+        print(f"[grey]Sources that failed: {', '.join(sorted(results.errors))}[/]")
+    if results.fallbacks:
+        print(f"[grey]Showing cached results for: {', '.join(results.fallbacks)}[/]")
 
 
 def _searchengine(search_engine: SearchEngine) -> None:
@@ -50,18 +59,20 @@ def _searchengine(search_engine: SearchEngine) -> None:
     print(search_engine.url)
 
 
-def dump_info(so_results: StackOverflow, search_engine: SearchEngine) -> None:
+def dump_info(so_results: Results, search_engine: SearchEngine) -> None:
     """Dump information for no-display mode.
 
     The traceback message is dumped before display vs. no-display is evaluated.
 
     Args:
-        so_results: Stackoverflow object.
+        so_results: Results object.
         search_engine: SearchEngine object.
 
     Returns:
         None
     """
-    _stackoverflow(so_results)
+    start = time.monotonic()
+    _results(so_results)
     _searchengine(search_engine)
     print()
+    RENDER_TIME.observe(time.monotonic() - start, display="no_display")
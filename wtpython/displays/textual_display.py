@@ -1,11 +1,13 @@
 """TUI using Textual."""
 from __future__ import annotations
 
+import asyncio
 import webbrowser
-from typing import Optional
+from contextlib import suppress
+from typing import TYPE_CHECKING, Optional, Sequence
 
 from rich.console import Console, RenderableType
-from rich.markdown import Markdown
+from rich.markup import escape
 from rich.panel import Panel
 from rich.text import Text
 from textual import events
@@ -13,31 +15,71 @@ from textual.app import App
 from textual.geometry import Size
 from textual.views import DockView
 from textual.widget import Reactive, Widget
-from textual.widgets import Footer, Header, ScrollView
+from textual.widgets import Footer, Header
 
-from wtpython.backends import SearchEngine, StackOverflow, Trace
-from wtpython.settings import APP_NAME, GH_ISSUES
+from wtpython.backends import ErrorSession, Results, Trace
+from wtpython.settings import APP_NAME, GH_ISSUES, TUI_PREFETCH, WATCH_INTERVAL
 
-TRACE: Trace = Trace(Exception())
-SO_RESULTS: StackOverflow = StackOverflow("python")
-SEARCH: SearchEngine = SearchEngine(Trace(Exception()))
+from .frames import FrameScheduler, FrameStats, UpdateCallback
+from .virtual_body import VirtualBody
 
+if TYPE_CHECKING:
+    from wtpython.history import History
+    from wtpython.watch import WatchSession, WatchUpdate
 
-def store_results_in_module(
-    trace: Trace, so_results: StackOverflow, search_engine: SearchEngine
-) -> None:
-    """Error with passing values to display; this is our temporary solution.
+TAB_WIDTH = 32  # Characters of an error shown in its tab
 
-    Display inherits App and somewhere in the App.__init__ flow values are
-    overwritten. These global variables are used in lieu of passing to
-    display for now.
 
-    These values are used in `Display.on_startup`
+class Tabs(Widget):
+    """Line of tabs for switching between errors.
+
+    Only the tabs around the active one that fit on the line are rendered,
+    so the line stays cheap with hundreds of errors. Errors that were not
+    looked up yet are dimmed.
     """
-    global SO_RESULTS, TRACE, SEARCH
-    SO_RESULTS = so_results
-    TRACE = trace
-    SEARCH = search_engine
+
+    active: Reactive[int] = Reactive(0)
+
+    def __init__(self, name: Optional[str], sessions: Sequence[ErrorSession]) -> None:
+        self.sessions = sessions
+        super().__init__(name=name)
+
+    def label(self, ix: int) -> Text:
+        """Render the tab of an error."""
+        session = self.sessions[ix]
+        title = session.title if len(session.title) <= TAB_WIDTH else session.title[:TAB_WIDTH - 1] + "…"
+        if ix == self.active:
+            style = "bold black on yellow"
+        else:
+            style = "white" if session.loaded else "#7f7f7f"
+        return Text(f" {ix + 1} {title} ", style=style, end="")
+
+    def render(self) -> RenderableType:
+        """Render the tabs that fit around the active one."""
+        shown = {self.active: self.label(self.active)}
+        width = len(shown[self.active])
+        first = last = self.active
+        while True:
+            added = False
+            for ix in (last + 1, first - 1):
+                if ix in shown or not 0 <= ix < len(self.sessions):
+                    continue
+                label = self.label(ix)
+                if width + len(label) + 1 > self.size.width:
+                    continue
+                shown[ix] = label
+                width += len(label) + 1
+                first, last = min(first, ix), max(last, ix)
+                added = True
+            if not added:
+                break
+
+        text = Text(end="")
+        for ix in range(first, last + 1):
+            shown[ix].apply_meta({"@click": f"app.set_tab({ix})"})
+            text.append_text(shown[ix])
+            text.append(" ")
+        return text
 
 
 class Sidebar(Widget):
@@ -50,13 +92,17 @@ class Sidebar(Widget):
     def __init__(
         self,
         name: Optional[str],
-        so: StackOverflow,
+        so: Results,
     ) -> None:
-        self.so: StackOverflow = so
+        self.so: Results = so
         super().__init__(name=name)
         self._text: Optional[Panel] = None
         self.pages: Optional[list[Text]] = None
         self.pages_index: dict[int, int] = {}
+        self.query = ""
+        self.matches: Optional[list[int]] = None
+        self.loading = False
+        self.error: Optional[Exception] = None  # Raised while looking up the questions
 
     @staticmethod
     def check_overflow(contents: list[Text], console: Console, size: Size) -> bool:
@@ -125,7 +171,24 @@ class Sidebar(Widget):
         """If index changes, regenerates the text."""
         self._text = None
         self.so.index = self.index
-        self.page = self.pages_index[self.index]
+        self.page = self.pages_index.get(self.index, 0)
+
+    def set_filter(self, query: str, visible: Optional[list[int]]) -> None:
+        """Show only some questions.
+
+        Args:
+            query: The filter, shown in the title.
+            visible: The indexes of the questions to show, None for all.
+
+        Returns:
+            None
+        """
+        self.query = query
+        self.matches = visible
+        self.pages_index = {}
+        self.page = 0
+        self._text = None
+        self.refresh()
 
     async def watch_highlighted(self, value: Optional[int]) -> None:
         """If highlight key changes we need to regenerate the text."""
@@ -141,8 +204,17 @@ class Sidebar(Widget):
         self.highlighted = None
 
     async def on_resize(self, event: events.Resize) -> None:
-        """Update the pages on resize."""
+        """Update the pages once per frame while the terminal is resized."""
+        self.app.request_update("sidebar_pages", self.update_size)
+
+    async def update_size(self) -> None:
+        """Paginate the questions again for the new size."""
+        self.redraw()
+
+    def redraw(self) -> None:
+        """Render the questions again, e.g. after one was pinned."""
         self._text = None
+        self.refresh()
 
     def update_pages(self) -> None:
         """Update the pages and the pages index."""
@@ -152,9 +224,9 @@ class Sidebar(Widget):
         pages_index: dict[int, int] = {}
         pages: list[Text] = []
         on_next = None
-        length = 0
+        ixs = range(len(self.so)) if self.matches is None else self.matches
 
-        for i, item_text in enumerate(self.so.sidebar()):
+        for i, item_text in zip(ixs, self.so.sidebar(self.matches)):
             if on_next is not None:
                 current_page_contents.append(on_next[0])
                 current_page_container.append(on_next[1])
@@ -172,12 +244,10 @@ class Sidebar(Widget):
                 page = Text(end="")
                 on_next = (current_page_contents.pop(), current_page_container.pop())
 
-                for index, i in enumerate(current_page_contents):
-                    index += length
+                for index, i in zip(current_page_container, current_page_contents):
                     i.apply_meta({"@click": f"app.set_index({index})", "index": index})  # type: ignore
                     page.append_text(i)
                     page.append_text(Text("\n\n"))
-                length += len(current_page_contents)
                 for i in current_page_container:
                     pages_index[i] = len(pages)
                 pages.append(page)
@@ -190,14 +260,19 @@ class Sidebar(Widget):
             current_page_container.append(on_next[1])
         if len(current_page_contents) != 0:
             page = Text(end="")
-            for index, i in enumerate(current_page_contents):
-                index += length
+            for index, i in zip(current_page_container, current_page_contents):
                 i.apply_meta({"@click": f"app.set_index({index})", "index": index})  # type: ignore
                 page.append_text(i)
                 page.append_text(Text("\n\n"))
             for i in current_page_container:
                 pages_index[i] = len(pages)
             pages.append(page)
+        if not pages and self.loading:
+            pages.append(Text("Searching..."))
+        elif not pages and self.error is not None:
+            pages.append(Text(f"The search failed: {self.error}", style="red"))
+        elif not pages:
+            pages.append(Text("No results found." if self.matches is None else "No questions match the filter."))
 
         self.pages_index = pages_index
         self.pages = pages
@@ -262,13 +337,84 @@ class Sidebar(Widget):
                         }
                     )
                 )
-            self._text = Panel(page, title=self.so.sidebar_title)
+            title = self.so.sidebar_title
+            if self.query:
+                title += f" /{self.query}"
+            subtitle = None
+            if self.so.errors:
+                subtitle = Text(f"Failed: {', '.join(sorted(self.so.errors))}", style="grey50")
+            self._text = Panel(page, title=escape(title), subtitle=subtitle)
 
         return self._text
 
 
+FILTER_ACCEPT_KEYS = {"enter", "ctrl+m", "ctrl+j"}
+FILTER_CANCEL_KEYS = {"escape"}
+FILTER_DELETE_KEYS = {"backspace", "ctrl+h"}
+
+
 class TextualDisplay(App):
-    """wtpython application."""
+    """wtpython application.
+
+    The errors to show are passed as `sessions`, e.g.
+    `TextualDisplay.run(sessions=[ErrorSession(trace, results=results)])`.
+    With several errors a line of tabs switches between them. The results
+    of an error are looked up when its tab is first shown, while the next
+    TUI_PREFETCH errors are looked up in the background.
+
+    Updates triggered by key repeats and resizes go through a
+    `FrameScheduler`, so only the final state of each frame is rendered.
+
+    With a `history`, the questions opened in the browser are recorded and
+    `p` pins the current question as the solution of the error.
+    """
+
+    def __init__(
+        self,
+        *args,
+        sessions: Sequence[ErrorSession] = (),
+        frame_stats: Optional[FrameStats] = None,
+        history: Optional[History] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.history = history
+        self.frames = FrameScheduler(stats=frame_stats)
+        self.filtering = False
+        self.filter_query = ""
+        self.sessions = list(sessions) or [ErrorSession(Trace(Exception()), results=Results())]
+        self.tab = 0
+        self.results = Results()  # Results of the shown error, empty while they are looked up
+
+    @property
+    def error_session(self) -> ErrorSession:
+        """The error that is shown."""
+        return self.sessions[self.tab]
+
+    def request_update(self, name: str, update: UpdateCallback) -> None:
+        """Run an update right away, or with the next frame while updates keep coming.
+
+        Args:
+            name: What is updated. Later requests with the same name in the
+                same frame replace this one.
+            update: Coroutine function doing the update.
+
+        Returns:
+            None
+        """
+        delay = self.frames.request(name, update)
+        if delay is not None:
+            self.set_timer(delay, self.frames.flush)
+
+    def display(self, renderable: RenderableType) -> None:
+        """Paint a widget update and measure the latency of the frame."""
+        super().display(renderable)
+        self.frames.painted()
+
+    def refresh(self, repaint: bool = True, layout: bool = False) -> None:
+        """Paint the screen and measure the latency of the frame."""
+        super().refresh(repaint, layout)
+        self.frames.painted()
 
     async def on_load(self, event: events.Load) -> None:
         """Key bindings."""
@@ -279,11 +425,17 @@ class TextualDisplay(App):
 
         await self.bind("left", "prev_question", description="Prev", key_display="←")
         await self.bind("right", "next_question", description="Next", key_display="→")
+        if len(self.sessions) > 1:
+            await self.bind("[", "prev_error", description="Prev Error")
+            await self.bind("]", "next_error", description="Next Error")
 
         await self.bind("s", "view.toggle('sidebar')", description="Sidebar")
         await self.bind("t", "show_traceback", description="Toggle Traceback")
 
+        await self.bind("/", "start_filter", description="Filter", key_display="/")
         await self.bind("d", "open_browser", description="Open Browser")
+        if self.history is not None:
+            await self.bind("p", "pin", description="Pin")
         await self.bind("f", "open_search_engine", description="Search Engine")
         await self.bind("i", "report_issue", description="Report Issue")
 
@@ -291,46 +443,92 @@ class TextualDisplay(App):
         await self.bind("k", "prev_question", show=False)
         await self.bind("j", "next_question", show=False)
 
-    def create_body_text(self) -> RenderableType:
-        """Generate the text to display in the scroll view."""
+    def create_body_text(self) -> Sequence[RenderableType]:
+        """Generate the posts to display in the body."""
         if self.viewing_traceback:
-            return TRACE.rich_traceback
+            return [self.error_session.trace.rich_traceback]
+        if not self.error_session.loaded and not self.results:
+            return [Text(f"Searching for {self.error_session.trace.error}...", style="grey")]
+        if self.error_session.error is not None and not self.results:
+            error = self.error_session.error
+            return [Text(f"Searching for {self.error_session.trace.error} failed: {error!r}", style="red")]
 
-        SO_RESULTS.index = self.index
-        output = Markdown(SO_RESULTS.display(), inline_code_lexer="python")
-        return output
+        self.results.index = self.index
+        return self.results.display_posts()
 
     async def update_body(self) -> None:
-        """Update the scroll view body."""
+        """Update the body and scroll back to the top."""
         await self.body.update(self.create_body_text())
-        self.body.y = 0
-        self.body.target_y = 0
+
+    async def show_question(self) -> None:
+        """Show the current question in the sidebar and the body."""
+        self.results.index = self.index
+        self.sidebar.index = self.index
+        await self.update_body()
 
     async def action_set_index(self, index: int) -> None:
         """Set question index."""
-        self.sidebar.index = index
-        SO_RESULTS.index = index
         self.index = index
+        self.request_update("question", self.show_question)
 
-        await self.update_body()
+    @property
+    def visible(self) -> list[int]:
+        """Indexes of the questions that match the filter."""
+        if self.sidebar.matches is None:
+            return list(range(len(self.results)))
+        return self.sidebar.matches
 
     async def action_next_question(self) -> None:
         """Go to the next question."""
-        if self.index + 1 < len(SO_RESULTS):
+        following = [ix for ix in self.visible if ix > self.index]
+        if following:
             self.viewing_traceback: bool = False
-            self.index += 1
-            await self.update_body()
-            self.sidebar.index = self.index
-            SO_RESULTS.index = self.index
+            self.index = following[0]
+            self.request_update("question", self.show_question)
 
     async def action_prev_question(self) -> None:
         """Go to the previous question."""
-        if self.index:
+        preceding = [ix for ix in self.visible if ix < self.index]
+        if preceding:
+            self.viewing_traceback = False
+            self.index = preceding[-1]
+            self.request_update("question", self.show_question)
+
+    async def action_start_filter(self) -> None:
+        """Start typing a filter for the questions."""
+        self.filtering = True
+        self.request_update("filter", self.apply_filter)
+
+    async def apply_filter(self) -> None:
+        """Show the questions matching the filter and select the first one."""
+        visible = self.results.filter(self.filter_query)
+        self.sidebar.set_filter(self.filter_query + ("_" if self.filtering else ""), visible)
+        if visible and self.index not in visible:
+            self.index = visible[0]
             self.viewing_traceback = False
-            self.index -= 1
-            await self.update_body()
-            self.sidebar.index = self.index
-            SO_RESULTS.index = self.index
+            await self.show_question()
+
+    async def press(self, key: str) -> bool:
+        """Handle a key press, sending keys to the filter while it is typed.
+
+        Enter keeps the filter and escape clears it.
+        """
+        if not self.filtering or key == "ctrl+c":
+            return await super().press(key)
+
+        if key in FILTER_ACCEPT_KEYS:
+            self.filtering = False
+        elif key in FILTER_CANCEL_KEYS:
+            self.filtering = False
+            self.filter_query = ""
+        elif key in FILTER_DELETE_KEYS:
+            self.filter_query = self.filter_query[:-1]
+        elif len(key) == 1 and key.isprintable():
+            self.filter_query += key
+        else:
+            return True
+        self.request_update("filter", self.apply_filter)
+        return True
 
     async def action_next_page(self) -> None:
         """Go to the next page."""
@@ -342,7 +540,31 @@ class TextualDisplay(App):
 
     async def action_open_browser(self) -> None:
         """Open the question in the browser."""
-        webbrowser.open(SO_RESULTS.active_url)
+        webbrowser.open(self.results.active_url)
+        if self.history is not None and self.results:
+            try:
+                self.history.record_opened(
+                    self.error_session.trace.signature, self.results.questions[self.results.index]
+                )
+            except OSError:  # Carry on without the history when it can't be written
+                self.history = None
+
+    async def action_pin(self) -> None:
+        """Pin the question as the solution of the error, or unpin it."""
+        if self.history is None or not self.results:
+            return
+        question = self.results.questions[self.results.index]
+        pinned = not question.pinned
+        try:
+            self.history.pin(self.error_session.trace.signature, question if pinned else None)
+        except OSError:  # Carry on without the history when it can't be written
+            self.history = None
+            return
+        for other in self.results.questions:
+            other.pinned = False
+        question.pinned = pinned
+        self.error_session.pinned = question if pinned else None
+        self.sidebar.redraw()
 
     async def action_report_issue(self) -> None:
         """Take user to submit new issue on Github."""
@@ -350,26 +572,153 @@ class TextualDisplay(App):
 
     async def action_open_search_engine(self) -> None:
         """Open the browser with search engine results."""
-        webbrowser.open(SEARCH.url)
+        webbrowser.open(self.error_session.search_engine.url)
 
     async def action_show_traceback(self) -> None:
         """Show the traceback."""
         self.viewing_traceback = not self.viewing_traceback
+        self.request_update("question", self.show_question)
+
+    async def action_set_tab(self, tab: int) -> None:
+        """Show the error of a tab."""
+        if tab == self.tab or not 0 <= tab < len(self.sessions):
+            return
+        self.tab = tab
+        self.viewing_traceback = False
+        self.filtering = False
+        self.filter_query = ""
+        self.request_update("session", self.show_session)
+
+    async def action_next_error(self) -> None:
+        """Go to the next error."""
+        await self.action_set_tab(self.tab + 1)
+
+    async def action_prev_error(self) -> None:
+        """Go to the previous error."""
+        await self.action_set_tab(self.tab - 1)
+
+    async def show_session(self) -> None:
+        """Show the error of the current tab, looking it up first if needed."""
+        session = self.error_session
+        self.title = f"{APP_NAME} | {session.trace.error}"
+        if len(self.sessions) > 1:
+            self.title += f" ({self.tab + 1}/{len(self.sessions)})"
+            self.tabs.active = self.tab
+            self.tabs.refresh()
+
+        self.results = session.preview
+        self.index = self.results.index
+        self.sidebar.so = self.results
+        self.sidebar.loading = not session.loaded
+        self.sidebar.error = session.error
+        self.sidebar.index = self.index
+        self.sidebar.set_filter(self.filter_query, self.results.filter(self.filter_query))
         await self.update_body()
 
+        for ix in range(self.tab + 1, min(len(self.sessions), self.tab + 1 + TUI_PREFETCH)):
+            self.sessions[ix].prefetch()
+        if not session.loaded:
+            self.load_session(self.tab)
+
+    def load_session(self, tab: int) -> None:
+        """Look up the error of a tab without blocking and show it if it is still active.
+
+        A failed lookup is shown in the tab, see `ErrorSession.error`.
+        """
+        session = self.sessions[tab]
+
+        async def load() -> None:
+            with suppress(Exception):  # Shown in the tab by `show_session`
+                await asyncio.get_event_loop().run_in_executor(None, lambda: session.results)
+            if self.tab == tab:
+                self.request_update("session", self.show_session)
+
+        asyncio.ensure_future(load())
+
     async def on_mount(self, event: events.Mount) -> None:
         """Execute main program."""
-        self.title = f"{APP_NAME} | {TRACE.error}"
-
         view = await self.push_view(DockView())
         self.index = 0
         self.viewing_traceback = False
         header = Header()
         footer = Footer()
-        self.sidebar: Sidebar = Sidebar("sidebar", SO_RESULTS)
-        self.body: ScrollView = ScrollView(self.create_body_text())
+        self.sidebar: Sidebar = Sidebar("sidebar", self.results)
+        self.body: VirtualBody = VirtualBody(self.create_body_text(), name="body")
 
         await view.dock(header, edge="top")
+        if len(self.sessions) > 1:
+            self.tabs: Tabs = Tabs("tabs", self.sessions)
+            await view.dock(self.tabs, edge="top", size=1)
         await view.dock(footer, edge="bottom")
         await view.dock(self.sidebar, edge="left", size=35)
         await view.dock(self.body, edge="right")
+        await self.show_session()
+
+
+class WatchDisplay(TextualDisplay):
+    """wtpython application that follows the runs of a `WatchSession`.
+
+    Runs happen in a worker thread while the interface stays responsive.
+    Runs that raise the same error as before don't change the interface.
+    """
+
+    def __init__(self, *args, session: WatchSession, update: Optional[WatchUpdate] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.session = session
+        self.initial_update = update
+        self.exit_update: Optional[WatchUpdate] = None  # The last run, if it raised no error
+        self.running = False
+
+    async def on_mount(self, event: events.Mount) -> None:
+        """Show the first run and start watching the files."""
+        event.prevent_default()  # Handlers of base classes run too, mount only once
+        await super().on_mount(event)
+        if self.initial_update is not None:
+            await self.show_update(self.initial_update)
+        self.set_interval(WATCH_INTERVAL, self.check_files)
+
+    def create_body_text(self) -> Sequence[RenderableType]:
+        """Generate the posts, or the output of the script if it raised no error."""
+        update = self.exit_update
+        if update is None:
+            return super().create_body_text()
+        if update.fixed:
+            status = [("Fixed! ", "bold green"), ("The script ran without errors.", "green")]
+        else:
+            status = [("Failed! ", "bold red"), (f"The script exited with {update.exit_status}.", "red")]
+        return [Text.assemble(*status, (" Watching for changes...\n\n", status[1][1]), update.output)]
+
+    async def check_files(self) -> None:
+        """Run the script again if its files changed."""
+        if self.running or not self.session.changed():
+            return
+        self.running = True
+        try:
+            update = await asyncio.get_event_loop().run_in_executor(None, self.session.rerun)
+        finally:
+            self.running = False
+        if update is not None:
+            await self.show_update(update)
+
+    async def show_update(self, update: WatchUpdate) -> None:
+        """Show the outcome of a run."""
+        if update.trace is None:
+            self.exit_update = update
+            previous = self.error_session
+            session = ErrorSession(previous.trace, results=update.results, search_engine=previous.search_engine)
+        else:
+            self.exit_update = None
+            session = ErrorSession(
+                update.trace, results=update.results, search_engine=update.search_engine
+            )
+
+        self.sessions = [session]
+        self.tab = 0
+        self.viewing_traceback = False
+        self.filtering = False
+        self.filter_query = ""
+        await self.show_session()
+        if update.fixed:
+            self.title = f"{APP_NAME} | Fixed"
+        elif update.trace is None:
+            self.title = f"{APP_NAME} | Failed with {update.exit_status}"
@@ -0,0 +1,343 @@
+"""Virtualized body view for long documents.
+
+Posts are split into markdown blocks which are measured lazily and only
+rendered when they are in or near the viewport. Rendered blocks are kept
+in a bounded LRU so scrolling back and forth does not render them again.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from itertools import count
+from typing import Hashable, List, Sequence, Tuple
+
+from rich.console import Console, ConsoleOptions, RenderableType, RenderResult
+from rich.segment import Segment
+from textual import events
+from textual.geometry import Offset
+from textual.scrollbar import ScrollBarRender
+from textual.widget import Widget
+
+from wtpython.formatters import split_markdown_blocks
+from wtpython.settings import BODY_CACHE_BLOCKS
+
+from .highlight import HighlightedMarkdown
+
+Lines = List[List[Segment]]
+BlockKey = Tuple[Hashable, int]
+
+
+class BlockLayout:
+    """Lazily measure and render a sequence of blocks.
+
+    Markdown strings are split into blocks and rendered on demand. Any other
+    renderable is kept as a single block. Heights of blocks that have not
+    been rendered yet are estimated from their text. Heights are only kept
+    for the current blocks at the current width, rendered lines in the LRU.
+    """
+
+    _ids = count()
+
+    def __init__(self, max_cached: int = BODY_CACHE_BLOCKS) -> None:
+        self.max_cached = max_cached
+        self.blocks: list[RenderableType] = []
+        self._keys: list[Hashable] = []
+        self._width: int | None = None
+        self._heights: dict[BlockKey, int] = {}
+        self._estimates: dict[BlockKey, int] = {}
+        self._cache: OrderedDict[BlockKey, Lines] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of blocks."""
+        return len(self.blocks)
+
+    def update(self, posts: Sequence[RenderableType]) -> None:
+        """Replace the blocks with the contents of new posts.
+
+        Markdown blocks are keyed by their text so rendered blocks are
+        reused when the same post is shown again.
+
+        Args:
+            posts: Markdown strings or rich renderables.
+
+        Returns:
+            None
+        """
+        self.blocks = []
+        self._keys = []
+        for post in posts:
+            if isinstance(post, str):
+                for block in split_markdown_blocks(post):
+                    self.blocks.append(block)
+                    self._keys.append(block)
+            else:
+                self.blocks.append(post)
+                self._keys.append(("renderable", next(self._ids)))
+        keys = set(self._keys)
+        self._heights = {key: height for key, height in self._heights.items() if key[0] in keys}
+        self._estimates = {key: height for key, height in self._estimates.items() if key[0] in keys}
+
+    def _resize(self, width: int) -> None:
+        """Forget the heights measured at another width."""
+        if width != self._width:
+            self._width = width
+            self._heights.clear()
+            self._estimates.clear()
+
+    def height(self, index: int, width: int, console: Console) -> int:
+        """Height of a block, measured if it was rendered and estimated otherwise.
+
+        Args:
+            index: The index of the block.
+            width: The width the block is rendered at.
+            console: Console used to render blocks that cannot be estimated.
+
+        Returns:
+            The number of lines of the block including its separator.
+        """
+        self._resize(width)
+        key = (self._keys[index], width)
+        if key in self._heights:
+            return self._heights[key]
+        if key in self._cache:
+            self._heights[key] = len(self._cache[key])
+            return self._heights[key]
+
+        block = self.blocks[index]
+        if not isinstance(block, str):
+            return len(self.render_block(index, width, console))
+
+        if key not in self._estimates:
+            self._estimates[key] = 1 + sum(
+                max(1, -(-len(line) // max(width, 1)))
+                for line in block.splitlines()
+            )
+        return self._estimates[key]
+
+    def render_block(self, index: int, width: int, console: Console) -> Lines:
+        """Render a block to lines, using the LRU cache when possible.
+
+        Args:
+            index: The index of the block.
+            width: The width to render at.
+            console: The console to render with.
+
+        Returns:
+            The rendered lines followed by a blank separator line.
+        """
+        self._resize(width)
+        key = (self._keys[index], width)
+        lines = self._cache.get(key)
+        if lines is not None:
+            self._cache.move_to_end(key)
+            return lines
+
+        block = self.blocks[index]
+        renderable = HighlightedMarkdown(block, inline_code_lexer="python") if isinstance(block, str) else block
+        options = console.options.update(width=width, height=None)
+        lines = console.render_lines(renderable, options)
+        lines.append([Segment(" " * width)])
+
+        self._cache[key] = lines
+        self._heights[key] = len(lines)
+        self._estimates.pop(key, None)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return lines
+
+    def window(
+        self, y: int, height: int, width: int, console: Console, overscan: int = 0
+    ) -> tuple[Lines, int, int]:
+        """Render the lines visible in a window.
+
+        Blocks overlapping the window (extended by `overscan` lines on either
+        side) are rendered first. When blocks above `y` turn out to have a
+        different height than estimated, `y` is shifted so the content in view
+        stays in place.
+
+        Args:
+            y: The first line of the window.
+            height: The number of lines in the window.
+            width: The width to render at.
+            console: The console to render with.
+            overscan: Extra lines to render above and below the window.
+
+        Returns:
+            The visible lines, the total height and the adjusted `y`.
+        """
+        top = 0
+        shift = 0
+        for index in range(len(self.blocks)):
+            estimated = self.height(index, width, console)
+            bottom = top + estimated
+            if bottom > y - overscan and top < y + height + overscan:
+                measured = len(self.render_block(index, width, console))
+                if bottom <= y:
+                    shift += measured - estimated
+            elif top >= y + height + overscan:
+                break
+            top = bottom
+        y = max(0, y + shift)
+
+        lines: Lines = []
+        top = 0
+        for index in range(len(self.blocks)):
+            block_height = self.height(index, width, console)
+            if top + block_height > y and top < y + height:
+                block_lines = self.render_block(index, width, console)
+                start = max(0, y - top)
+                lines.extend(block_lines[start:start + height - len(lines)])
+                block_height = len(block_lines)
+            top += block_height
+        return lines, top, y
+
+
+class _Viewport:
+    """Renderable for pre-rendered lines next to a scroll bar."""
+
+    def __init__(self, lines: Lines, scrollbar: Lines) -> None:
+        self.lines = lines
+        self.scrollbar = scrollbar
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        new_line = Segment.line()
+        for line, bar in zip(self.lines, self.scrollbar):
+            yield from line
+            yield from bar
+            yield new_line
+
+
+class VirtualBody(Widget):
+    """Scrollable body that only renders the blocks in or near the viewport.
+
+    This replaces `ScrollView` for the main window. `ScrollView` renders
+    the whole document up front and again on every resize. Like the
+    scrollbar of `ScrollView`, the scrollbar pages when clicked and scrolls
+    when its thumb is dragged.
+    """
+
+    def __init__(self, posts: Sequence[RenderableType] = (), name: str | None = None) -> None:
+        super().__init__(name=name)
+        self.blocks = BlockLayout()
+        self.blocks.update(posts)
+        self.y = 0
+        self.virtual_height = 0
+        self.grabbed: Offset | None = None  # Where the scrollbar thumb was grabbed
+        self.grabbed_y = 0
+
+    async def update(self, posts: Sequence[RenderableType]) -> None:
+        """Replace the contents and scroll back to the top.
+
+        Args:
+            posts: Markdown strings or rich renderables.
+
+        Returns:
+            None
+        """
+        self.blocks.update(posts)
+        self.home()
+
+    @property
+    def max_scroll_y(self) -> int:
+        """Largest valid scroll position based on the known height."""
+        return max(0, self.virtual_height - self.size.height)
+
+    def scroll_to(self, y: int) -> None:
+        """Scroll to a line and repaint."""
+        self.y = max(0, min(y, self.max_scroll_y))
+        self.refresh()
+
+    def home(self) -> None:
+        """Scroll to the top."""
+        self.scroll_to(0)
+
+    async def on_mouse_scroll_up(self, event: events.MouseScrollUp) -> None:
+        """Scroll with the mouse wheel."""
+        self.scroll_to(self.y + 2)
+
+    async def on_mouse_scroll_down(self, event: events.MouseScrollDown) -> None:
+        """Scroll with the mouse wheel."""
+        self.scroll_to(self.y - 2)
+
+    async def action_scroll_up(self) -> None:
+        """Scroll up a page when the scrollbar is clicked above the thumb."""
+        self.scroll_to(self.y - self.size.height)
+
+    async def action_scroll_down(self) -> None:
+        """Scroll down a page when the scrollbar is clicked below the thumb."""
+        self.scroll_to(self.y + self.size.height)
+
+    async def action_grab(self) -> None:
+        """Start dragging the scrollbar thumb."""
+        await self.capture_mouse()
+
+    async def action_release(self) -> None:
+        """Stop dragging the scrollbar thumb."""
+        await self.release_mouse()
+
+    async def on_mouse_capture(self, event: events.MouseCapture) -> None:
+        """Remember where the thumb was grabbed."""
+        self.grabbed = event.mouse_position
+        self.grabbed_y = self.y
+
+    async def on_mouse_release(self, event: events.MouseRelease) -> None:
+        """Forget the grabbed thumb."""
+        self.grabbed = None
+
+    async def on_mouse_move(self, event: events.MouseMove) -> None:
+        """Scroll along with the dragged thumb."""
+        if self.grabbed is not None and self.size.height:
+            ratio = max(self.virtual_height, self.size.height) / self.size.height
+            self.scroll_to(round(self.grabbed_y + (event.screen_y - self.grabbed.y) * ratio))
+
+    async def on_key(self, event: events.Key) -> None:
+        """Dispatch keys to the `key_` methods when focused."""
+        await self.dispatch_key(event)
+
+    async def key_down(self) -> None:
+        """Scroll down."""
+        self.scroll_to(self.y + 2)
+
+    async def key_up(self) -> None:
+        """Scroll up."""
+        self.scroll_to(self.y - 2)
+
+    async def key_pagedown(self) -> None:
+        """Scroll down a page."""
+        self.scroll_to(self.y + self.size.height)
+
+    async def key_pageup(self) -> None:
+        """Scroll up a page."""
+        self.scroll_to(self.y - self.size.height)
+
+    async def key_home(self) -> None:
+        """Scroll to the top."""
+        self.home()
+
+    async def key_end(self) -> None:
+        """Scroll to the bottom."""
+        self.scroll_to(self.max_scroll_y)
+
+    def render(self) -> RenderableType:
+        """Render the visible slice of the blocks."""
+        width, height = self.size
+        content_width = max(1, width - 1)
+
+        lines, self.virtual_height, y = self.blocks.window(
+            self.y, height, content_width, self.console, overscan=height
+        )
+        self.y = min(y, self.max_scroll_y)
+        if self.y != y:
+            lines, self.virtual_height, self.y = self.blocks.window(
+                self.y, height, content_width, self.console
+            )
+        lines += [[Segment(" " * content_width)]] * (height - len(lines))
+
+        scrollbar = ScrollBarRender(
+            virtual_size=max(self.virtual_height, height),
+            window_size=height,
+            position=self.y,
+        )
+        bar_lines = self.console.render_lines(
+            scrollbar, self.console.options.update_dimensions(1, height)
+        )
+        return _Viewport(lines, bar_lines)
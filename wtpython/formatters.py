@@ -1,7 +1,23 @@
-"""Utility classes for formatting text."""
-from typing import Any, Optional
+"""Utility classes for formatting text.
 
-from markdownify import MarkdownConverter
+Question and answer bodies are converted to Markdown by
+`StreamingMarkdownConverter`. It reads the HTML subset used by Stack
+Overflow in a single pass over its tags, keeping only the currently open
+elements instead of a BeautifulSoup tree. It follows the tree building
+rules of BeautifulSoup and the conversion of markdownify, so the output is
+the same as `PythonCodeConverter`'s, which is still used for anything
+outside that subset (tables, comments, declarations and stray "<").
+"""
+from __future__ import annotations
+
+import re
+from html import unescape
+from html.entities import html5
+from typing import Any, NamedTuple, Optional
+
+from markdownify import (
+    MarkdownConverter, chomp, escape, line_beginning_re, whitespace_re
+)
 
 
 def rich_link(url: str, text: Optional[str] = None) -> str:
@@ -37,3 +53,368 @@ class PythonCodeConverter(MarkdownConverter):
         if not text:
             return ""
         return "\n```py\n%s\n```\n" % text
+
+
+class UnsupportedMarkup(Exception):
+    """HTML that is left to `PythonCodeConverter`."""
+
+
+INLINE_MARKUP = {'b': '**', 'strong': '**', 'em': '*', 'i': '*', 'del': '~~', 's': '~~', 'sub': '', 'sup': ''}
+CODE_TAGS = {'code', 'kbd', 'samp'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+LIST_TAGS = {'ul', 'ol'}
+NESTED_TAGS = {'ul', 'ol', 'li'}  # Whitespace between these is dropped
+VOID_TAGS = frozenset({
+    'br', 'hr', 'img', 'input', 'meta', 'link', 'area', 'base', 'col', 'embed', 'source', 'track', 'wbr',
+})
+# Obsolete void elements, whose handling differs between BeautifulSoup versions
+LEGACY_VOID_TAGS = {
+    'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex', 'keygen', 'menuitem', 'nextid', 'param', 'spacer',
+}
+UNSUPPORTED_TAGS = {'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th', 'script', 'style', *LEGACY_VOID_TAGS}
+HEADING_PREFIX = re.compile(r'h\d')  # markdownify converts every tag named like this as a heading
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+
+# Tags and references as written by Stack Overflow. Other markup, like a "<"
+# that starts no tag, is left to markdownify.
+ATTRIBUTE_PATTERN = r'''([a-zA-Z_:][-\w:.]*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+))?'''
+TAG = re.compile(
+    rf'<(?P<closing>/?)(?P<name>[a-zA-Z][a-zA-Z0-9]*)(?P<attrs>(?:\s+{ATTRIBUTE_PATTERN})*)\s*(?P<end>/?)>'
+)
+ATTRIBUTE = re.compile(ATTRIBUTE_PATTERN)
+REFERENCE = re.compile(r'&(?:#([0-9]+)|#[xX]([0-9a-fA-F]+)|([a-zA-Z][-.a-zA-Z0-9]*));')
+# Named references that BeautifulSoup resolves, and the whitespace and root
+# element name it uses
+ENTITIES = {name[:-1]: character for name, character in html5.items() if name.endswith(';')}
+ASCII_SPACES = ' \n\t\x0c\r'
+ROOT = '[document]'
+
+
+class Node(NamedTuple):
+    """A converted child of an element, or a text before it is converted.
+
+    `info` is the depth of nested bulleted lists for list items, and for
+    lists whether a newline is added when a paragraph follows.
+    """
+
+    name: Optional[str]  # None for text
+    text: str
+    info: Any = None
+
+
+class Element:
+    """An open element and its converted children."""
+
+    __slots__ = ('name', 'attrs', 'parent_name', 'inline', 'children_inline', 'depth', 'children')
+
+    def __init__(self, name: str, attrs: dict[str, str], parent: Optional[Element], depth: int = 0) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.parent_name = parent.name if parent is not None else None
+        self.inline: bool = parent is not None and parent.children_inline
+        self.children_inline: bool = self.inline or name in HEADING_TAGS
+        self.depth = depth
+        self.children: list[Node] = []
+
+
+class StreamingMarkdownConverter:
+    """Convert Stack Overflow bodies to Markdown in a single pass.
+
+    Elements are converted when they are closed. Only the parts of the
+    conversion that depend on the following siblings, like the bullets of
+    list items, wait for the parent element to close. Use `convert`, which
+    falls back on `PythonCodeConverter` for unsupported markup.
+    """
+
+    def convert(self, html: str) -> str:
+        """Convert HTML to Markdown.
+
+        Args:
+            html: The body of a question or answer.
+
+        Returns:
+            The same Markdown as `PythonCodeConverter().convert(html)`.
+        """
+        try:
+            return self.build(html)
+        except UnsupportedMarkup:
+            return PythonCodeConverter().convert(html)
+
+    def build(self, html: str) -> str:
+        """Convert HTML in the supported subset.
+
+        Raises:
+            UnsupportedMarkup: If the HTML uses unsupported markup.
+        """
+        self.stack = [Element(ROOT, {}, None)]
+        self.data: list[str] = []
+        self.open_tags: dict[str, int] = {}
+        self.already_closed: list[str] = []
+        self.preserved: list[Element] = []
+
+        position = 0
+        for match in TAG.finditer(html):
+            if match.start() > position:
+                self.handle_data(html[position:match.start()])
+            position = match.end()
+            closing, name, attrs, self_closing = match.group('closing', 'name', 'attrs', 'end')
+            name = name.lower()
+            if closing:
+                if attrs or self_closing:
+                    raise UnsupportedMarkup(match.group())
+                self.handle_endtag(name)
+            elif self_closing:
+                if name in self.already_closed:
+                    # Older BeautifulSoup versions take this end tag for the one of the earlier element
+                    raise UnsupportedMarkup(match.group())
+                self.start(name, attrs)
+                self.handle_endtag(name)
+            else:
+                self.start(name, attrs)
+                if name in VOID_TAGS:
+                    self.end(name)
+                    self.already_closed.append(name)
+        if position < len(html):
+            self.handle_data(html[position:])
+
+        self.end_data()
+        while len(self.stack) > 1:
+            self.pop()
+        return self.render(self.stack[0])
+
+    def handle_endtag(self, name: str) -> None:
+        """Close an element, ignoring end tags of void elements already closed."""
+        if name in self.already_closed:
+            self.already_closed.remove(name)
+        else:
+            self.end(name)
+
+    def handle_data(self, data: str) -> None:
+        """Collect text until the next tag, resolving character references."""
+        if '<' in data:
+            raise UnsupportedMarkup(data)  # Comments, declarations or a stray "<"
+        if '&' in data:
+            references = data.count('&')
+            data, count = REFERENCE.subn(self.reference, data)
+            if count != references:
+                raise UnsupportedMarkup(data)  # References without a semicolon
+        self.data.append(data)
+
+    @staticmethod
+    def reference(match: re.Match) -> str:
+        """Resolve a character reference like BeautifulSoup does.
+
+        Numbers below 256 are read as Windows-1252 and unknown names are
+        kept as text without the semicolon.
+        """
+        decimal, hexadecimal, name = match.groups()
+        if name is not None:
+            character = ENTITIES.get(name)
+            return f"&{name}" if character is None else character
+        number = int(decimal) if decimal is not None else int(hexadecimal, 16)
+        if number < 256:
+            try:
+                data = bytes([number]).decode('windows-1252')
+                if data:
+                    return data
+            except UnicodeDecodeError:
+                pass
+        try:
+            return chr(number)
+        except (ValueError, OverflowError):
+            return "\N{REPLACEMENT CHARACTER}"
+
+    def start(self, name: str, attrs: str) -> None:
+        """Open an element inside the current one."""
+        if name in UNSUPPORTED_TAGS or (name not in HEADING_TAGS and HEADING_PREFIX.match(name)):
+            raise UnsupportedMarkup(name)
+        self.end_data()
+        element = Element(
+            name,
+            {
+                key.lower(): unescape(value[1:-1] if value[:1] in '\'"' else value)
+                for key, value in ATTRIBUTE.findall(attrs)
+            },
+            self.stack[-1],
+            depth=self.open_tags.get('ul', 0) - 1,
+        )
+        self.stack.append(element)
+        self.open_tags[name] = self.open_tags.get(name, 0) + 1
+        if name in PRESERVE_WHITESPACE_TAGS:
+            self.preserved.append(element)
+
+    def end(self, name: str) -> None:
+        """Close the most recent element with a name and the elements inside it."""
+        self.end_data()
+        while self.open_tags.get(name):
+            if self.pop().name == name:
+                break
+
+    def end_data(self) -> None:
+        """Add the collected text to the current element.
+
+        Text of whitespace only is replaced by a space or a newline, except
+        in preformatted elements.
+        """
+        if not self.data:
+            return
+        text = ''.join(self.data)
+        self.data = []
+        if not self.preserved and not text.strip(ASCII_SPACES):
+            text = '\n' if '\n' in text else ' '
+        self.stack[-1].children.append(Node(None, text))
+
+    def pop(self) -> Element:
+        """Close the current element and add its conversion to its parent."""
+        element = self.stack.pop()
+        self.open_tags[element.name] -= 1
+        if self.preserved and self.preserved[-1] is element:
+            self.preserved.pop()
+        self.stack[-1].children.append(self.convert_element(element, self.render(element)))
+        return element
+
+    def render(self, element: Element) -> str:
+        """Join the children of an element, finishing their conversion."""
+        children = element.children
+        if element.name in NESTED_TAGS:
+            ix = 0
+            while ix < len(children):
+                previous = children[ix - 1].name if ix > 0 else None
+                following = children[ix + 1].name if ix + 1 < len(children) else None
+                can_extract = ix == 0 or ix + 1 == len(children) or previous in NESTED_TAGS or following in NESTED_TAGS
+                if children[ix].name is None and not children[ix].text.strip() and can_extract:
+                    del children[ix]  # markdownify removes while iterating, which skips the next child
+                ix += 1
+
+        parts = []
+        for ix, (name, text, info) in enumerate(children):
+            last = ix + 1 == len(children)
+            following = None if last else children[ix + 1].name
+            if name is None:
+                text = self.convert_text(element, text, last or following in LIST_TAGS)
+            elif name == 'li':
+                if element.name == 'ol':
+                    start = element.attrs.get('start')
+                    bullet = f"{(int(start) if start else 1) + ix}."
+                else:
+                    bullet = MarkdownConverter.DefaultOptions.bullets[info % 3]
+                text = f"{bullet} {text}\n"
+            elif name in LIST_TAGS and info and not last and following not in LIST_TAGS:
+                text += '\n'
+            parts.append(text)
+        return ''.join(parts)
+
+    @staticmethod
+    def convert_text(parent: Element, text: str, strip_end: bool) -> str:
+        """Convert a text, collapsing whitespace and escaping underscores outside code."""
+        if not (parent.name == 'pre' or (parent.name == 'code' and parent.parent_name == 'pre')):
+            text = whitespace_re.sub(' ', text)
+        if parent.name != 'code':
+            text = escape(text)
+        if parent.name == 'li' and strip_end:
+            text = text.rstrip()
+        return text
+
+    def convert_element(self, element: Element, text: str) -> Node:
+        """Convert an element with the text of its children."""
+        name = element.name
+        if name in INLINE_MARKUP:
+            return Node(name, self.inline_markup(text, INLINE_MARKUP[name]))
+        if name in CODE_TAGS:
+            return Node(name, text if element.parent_name == 'pre' else self.inline_markup(text, '`'))
+        if name == 'a':
+            return Node(name, self.convert_a(element, text))
+        if name == 'img':
+            alt = element.attrs.get('alt') or ''
+            if element.inline:
+                return Node(name, alt)
+            title = element.attrs.get('title') or ''
+            title_part = ' "%s"' % title.replace('"', r'\"') if title else ''
+            return Node(name, '![%s](%s%s)' % (alt, element.attrs.get('src') or '', title_part))
+        if name == 'br':
+            return Node(name, '' if element.inline else '  \n')
+        if name == 'hr':
+            return Node(name, '\n\n---\n\n')
+        if name == 'p':
+            return Node(name, text if element.inline else ('%s\n\n' % text if text else ''))
+        if name == 'pre':
+            return Node(name, "\n```py\n%s\n```\n" % text if text else '')
+        if name == 'blockquote':
+            if element.inline or not text:
+                return Node(name, text)
+            return Node(name, '\n' + line_beginning_re.sub('> ', text) + '\n\n')
+        if name in HEADING_TAGS:
+            return Node(name, text if element.inline else self.convert_heading(int(name[1]), text))
+        if name == 'li':
+            return Node(name, text.strip(), element.depth)
+        if name in LIST_TAGS:
+            if any(parent.name == 'li' for parent in self.stack):
+                return Node(name, '\n' + (line_beginning_re.sub('\t', text) if text else '').rstrip())
+            return Node(name, text, True)
+        return Node(name, text)
+
+    @staticmethod
+    def inline_markup(text: str, markup: str) -> str:
+        """Wrap text in markup, keeping surrounding spaces outside."""
+        prefix, suffix, text = chomp(text)
+        return f"{prefix}{markup}{text}{markup}{suffix}" if text else ''
+
+    @staticmethod
+    def convert_a(element: Element, text: str) -> str:
+        """Convert a link, using the short form when the text is the URL."""
+        prefix, suffix, text = chomp(text)
+        if not text:
+            return ''
+        href = element.attrs.get('href')
+        title = element.attrs.get('title')
+        if text.replace(r'\_', '_') == href and not title:
+            return '<%s>' % href
+        title_part = ' "%s"' % title.replace('"', r'\"') if title else ''
+        return '%s[%s](%s%s)%s' % (prefix, text, href, title_part, suffix) if href else text
+
+    @staticmethod
+    def convert_heading(level: int, text: str) -> str:
+        """Convert a heading, underlined for the first two levels."""
+        text = text.rstrip()
+        if level <= 2:
+            return '%s\n%s\n\n' % (text, ('=' if level == 1 else '-') * len(text)) if text else ''
+        return '%s %s\n\n' % ('#' * level, text)
+
+
+def split_markdown_blocks(text: str) -> list[str]:
+    """Split a markdown document into independently renderable blocks.
+
+    Blocks are separated by blank lines. Fenced code blocks are never split
+    and a blank line followed by indented text is kept with the previous
+    block so list item continuations do not turn into code blocks.
+
+    Args:
+        text: The markdown document.
+
+    Returns:
+        A list of markdown blocks without surrounding blank lines.
+    """
+    blocks: list[str] = []
+    current: list[str] = []
+    in_fence = False
+    pending_blank = False
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence and not line.strip():
+            pending_blank = bool(current)
+            continue
+
+        if pending_blank:
+            if line[:1].isspace():
+                current.append("")
+            else:
+                blocks.append("\n".join(current))
+                current = []
+            pending_blank = False
+        current.append(line)
+
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
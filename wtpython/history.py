@@ -0,0 +1,154 @@
+"""History of the errors seen and their solutions.
+
+Every error wtpython looks up is recorded by its signature (see
+`Trace.signature`): when it was first and last seen and how often. The
+questions opened in the browser are counted too, and one question can be
+pinned as the solution of the error. When the error comes back, the pinned
+solution is shown from the history right away, before the lookup finishes.
+
+The history is an `ItemStore` with one entry per signature. Entries are
+updated under a file lock and written atomically, so a team can share one
+history by pointing `$WTPYTHON_HISTORY` to the same directory.
+`wtpython history` reports the errors that come back most often.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from wtpython.backends.bundle import dump_question, load_question
+from wtpython.backends.stackoverflow import StackOverflowQuestion
+from wtpython.backends.store import ItemStore
+from wtpython.backends.trace import Trace
+from wtpython.settings import HISTORY_LOCATION
+
+
+class ErrorRecord(NamedTuple):
+    """What the history knows about an error signature."""
+
+    signature: str
+    occurrences: int = 0
+    first_seen: float = 0
+    last_seen: float = 0
+    opened: Optional[dict] = None  # Times each question was opened by URL, with its title: {url: [title, count]}
+    pinned: Optional[dict] = None  # The pinned question, see `dump_question`
+
+    @property
+    def solution(self) -> Optional[tuple[str, str]]:
+        """Title and URL of the pinned question, or of the question opened most often."""
+        if self.pinned is not None:
+            question = load_question(0, self.pinned)
+            return question.title, question.url
+        if self.opened:
+            url, (title, _) = max(self.opened.items(), key=lambda item: item[1][1])
+            return title, url
+        return None
+
+
+class History:
+    """Errors seen and the questions opened or pinned for them."""
+
+    def __init__(self, directory: Path = HISTORY_LOCATION) -> None:
+        """Open the history in a directory.
+
+        Args:
+            directory: Where the history is stored. Created on the first write.
+
+        Returns:
+            None
+        """
+        self.store = ItemStore(directory, expire_after=float('inf'))
+
+    @staticmethod
+    def key(signature: str) -> str:
+        """Key for an error signature."""
+        return hashlib.sha256(signature.encode()).hexdigest()[:32]
+
+    def get(self, signature: str) -> Optional[ErrorRecord]:
+        """Read the record of an error signature, if it was seen before."""
+        items = self.store.get(self.key(signature))
+        return ErrorRecord(**items[0]) if items else None
+
+    def update(self, signature: str, change: Callable[[ErrorRecord], ErrorRecord]) -> ErrorRecord:
+        """Change the record of an error signature.
+
+        The record is read and written under the lock of its entry, so
+        updates from several processes are not lost.
+
+        Args:
+            signature: The error signature.
+            change: Returns the changed record.
+
+        Returns:
+            The new record.
+        """
+        key = self.key(signature)
+        with self.store.lock(key):
+            record = change(self.get(signature) or ErrorRecord(signature, opened={}))
+            self.store.put(key, [record._asdict()])
+        return record
+
+    def record_error(self, trace: Trace) -> ErrorRecord:
+        """Count an occurrence of an error.
+
+        Args:
+            trace: The wtpython Trace object.
+
+        Returns:
+            The record of the error's signature.
+        """
+        now = time.time()
+        return self.update(trace.signature, lambda record: record._replace(
+            occurrences=record.occurrences + 1,
+            first_seen=record.first_seen or now,
+            last_seen=now,
+        ))
+
+    def record_opened(self, signature: str, question: StackOverflowQuestion) -> ErrorRecord:
+        """Count that a question was opened for an error.
+
+        Args:
+            signature: The error signature.
+            question: The question opened in the browser.
+
+        Returns:
+            The record of the signature.
+        """
+        def change(record: ErrorRecord) -> ErrorRecord:
+            opened = record.opened or {}
+            _, count = opened.get(question.url, (None, 0))
+            return record._replace(opened={**opened, question.url: [question.title, count + 1]})
+
+        return self.update(signature, change)
+
+    def pin(self, signature: str, question: Optional[StackOverflowQuestion]) -> ErrorRecord:
+        """Pin a question as the solution of an error.
+
+        Args:
+            signature: The error signature.
+            question: The question to pin, or None to unpin.
+
+        Returns:
+            The record of the signature.
+        """
+        pinned = None if question is None else {**dump_question(question), "group": None}
+        return self.update(signature, lambda record: record._replace(pinned=pinned))
+
+    def pinned(self, signature: str) -> Optional[StackOverflowQuestion]:
+        """Read the question pinned for an error, ready to show without any lookup."""
+        record = self.get(signature)
+        if record is None or record.pinned is None:
+            return None
+        return load_question(0, record.pinned)
+
+    def records(self) -> list[ErrorRecord]:
+        """All records, the errors seen most often first."""
+        records = []
+        if self.store.directory.is_dir():
+            for path in self.store.directory.glob(f"*{self.store.suffix}"):
+                items = self.store.get(path.stem)
+                if items:
+                    records.append(ErrorRecord(**items[0]))
+        return sorted(records, key=lambda record: (-record.occurrences, -record.last_seen))
@@ -0,0 +1,296 @@
+"""Counters and histograms describing what wtpython did.
+
+Cache lookups, Stack Exchange requests and rendering record metrics in the
+module level `METRICS` registry. Nothing is exported unless `configure` is
+called (`--metrics-file`, `--statsd` or the WTPYTHON_METRICS_FILE and
+WTPYTHON_STATSD environment variables):
+
+- the OpenMetrics text format is written to a file when wtpython exits,
+  ready for the node exporter's textfile collector;
+- every value is also sent to a statsd daemon over UDP as it is recorded.
+  Labels are appended to the name, e.g. `wtpython_cache_lookups.stackoverflow.hit`.
+"""
+from __future__ import annotations
+
+import atexit
+import math
+import socket
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Optional, Sequence, Tuple, Type, TypeVar, Union
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+LabelValues = Tuple[str, ...]
+M = TypeVar('M', bound='Metric')
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value or bucket bound."""
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric(ABC):
+    """A named family of samples, one per combination of label values."""
+
+    kind = "unknown"
+    statsd_type = "g"
+
+    def __init__(self, registry: Registry, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        """Label values in the order of the metric's label names."""
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.labels) or 'none'}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels(self, key: LabelValues, extra: str = "") -> str:
+        """Label set of a sample in the exposition format."""
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _push(self, key: LabelValues, value: float) -> None:
+        """Send a value to statsd if it is configured."""
+        if self.registry.statsd is not None:
+            self.registry.statsd.send(".".join((self.name, *key)), value, self.statsd_type)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Lines of the samples in the exposition format."""
+
+    def exposition(self) -> list[str]:
+        """Lines of the metric family in the exposition format."""
+        return [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help}", *self.samples()]
+
+
+class Counter(Metric):
+    """Total that only goes up, e.g. the number of cache hits."""
+
+    kind = "counter"
+    statsd_type = "c"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Add to the total of a label combination."""
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self._push(key, amount)
+
+    def samples(self) -> list[str]:
+        """Lines of the samples in the exposition format."""
+        return [
+            f"{self.name}_total{self._labels(key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. the remaining API quota."""
+
+    kind = "gauge"
+    statsd_type = "g"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the value of a label combination."""
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+        self._push(key, value)
+
+    def samples(self) -> list[str]:
+        """Lines of the samples in the exposition format."""
+        return [
+            f"{self.name}{self._labels(key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. response times.
+
+    Histograms of seconds are sent to statsd as timers in milliseconds,
+    others, like sizes and counts, as statsd histograms.
+    """
+
+    kind = "histogram"
+    statsd_type = "h"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.timer = self.name.endswith("_seconds")
+        if self.timer:
+            self.statsd_type = "ms"
+        self.buckets = (*sorted(buckets), math.inf)
+        self.counts: dict[LabelValues, list[int]] = {}
+        self.sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record a value for a label combination."""
+        key = self._key(labels)
+        with self.registry.lock:
+            counts = self.counts.setdefault(key, [0] * len(self.buckets))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.sums[key] = self.sums.get(key, 0) + value
+        self._push(key, value * 1000 if self.timer else value)
+
+    def samples(self) -> list[str]:
+        """Lines of the samples in the exposition format."""
+        lines = []
+        for key, counts in sorted(self.counts.items()):
+            total = 0
+            for bound, count in zip(self.buckets, counts):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {total}")
+            lines.append(f"{self.name}_count{self._labels(key)} {total}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(self.sums[key])}")
+        return lines
+
+
+class StatsdClient:
+    """Send values to a statsd daemon over UDP, ignoring any errors."""
+
+    def __init__(self, address: str, prefix: str = "") -> None:
+        """Create a client.
+
+        Args:
+            address: host:port of the daemon, e.g. 127.0.0.1:8125.
+            prefix: Prepended to every metric name.
+
+        Returns:
+            None
+        """
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid statsd address {address!r}, expected HOST:PORT")
+        self.address = (host, int(port))
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def send(self, name: str, value: float, kind: str) -> None:
+        """Send one value; dropped if the daemon is not listening."""
+        try:
+            self.socket.sendto(f"{self.prefix}{name}:{_format_value(value)}|{kind}".encode(), self.address)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Close the socket."""
+        self.socket.close()
+
+
+class Registry:
+    """Collection of metrics."""
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.statsd: Optional[StatsdClient] = None
+
+    def _register(self, cls: Type[M], name: str, help: str, labels: Sequence[str], **kwargs: Any) -> M:
+        """Return the metric with a name, creating it if needed."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, help, labels, **kwargs)
+        if not isinstance(metric, cls) or metric.labels != tuple(labels):
+            raise ValueError(f"{name} is already registered as a different metric")
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """Get or create a counter."""
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        """Get or create a gauge."""
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Get or create a histogram."""
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def openmetrics(self) -> str:
+        """All metrics in the OpenMetrics text format."""
+        with self.lock:
+            lines = [line for metric in self.metrics.values() for line in metric.exposition()]
+        return "\n".join([*lines, "# EOF"]) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Write all metrics to a file in the OpenMetrics text format."""
+        from wtpython.backends.store import atomic_write
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, self.openmetrics().encode())
+
+
+METRICS = Registry()
+
+CACHE_LOOKUPS = METRICS.counter(
+    "wtpython_cache_lookups",
+    "Cache lookups by result: hit, stale or miss, and unchanged or refreshed when revalidating",
+    ["store", "result"],
+)
+API_REQUESTS = METRICS.histogram(
+    "wtpython_api_request_seconds", "Time to fetch items from an API, including hedged requests", ["api"]
+)
+API_RESPONSE_SIZE = METRICS.histogram(
+    "wtpython_api_response_bytes", "Size of API response bodies", ["api"], buckets=SIZE_BUCKETS
+)
+API_QUOTA = METRICS.gauge(
+    "wtpython_api_quota_remaining", "Requests left in the Stack Exchange daily quota", ["api"]
+)
+SEARCH_RESULTS = METRICS.histogram(
+    "wtpython_search_questions", "Questions returned per Stack Exchange search, compare with SO_MAX_RESULTS",
+    ["site", "query"], buckets=COUNT_BUCKETS,
+)
+RENDER_TIME = METRICS.histogram(
+    "wtpython_render_seconds", "Time spent rendering results", ["display"]
+)
+INPUT_TO_PAINT = METRICS.histogram(
+    "wtpython_input_to_paint_seconds", "Time from user input until the interface is painted"
+)
+
+
+def configure(path: Union[str, Path, None] = None, statsd: Optional[str] = None) -> None:
+    """Export the metrics of this process.
+
+    Args:
+        path: Write the metrics to this file when wtpython exits.
+        statsd: host:port of a statsd daemon to send every value to.
+
+    Returns:
+        None
+    """
+    if statsd:
+        METRICS.statsd = StatsdClient(statsd)
+    if path:
+        atexit.register(METRICS.write, Path(path))
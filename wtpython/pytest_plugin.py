@@ -0,0 +1,140 @@
+"""pytest plugin that looks up the errors of failing tests.
+
+Enable it with `pytest --wtpython`. While tests run, the plugin only
+records a small snapshot of each failure's exception on the test report.
+When the session finishes, failures are grouped by their signature and all
+groups are looked up at once, so tests don't get any slower.
+
+With pytest-xdist the snapshots travel with the reports to the controller,
+which does the lookup for all workers.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Generator, Optional
+
+import pytest
+
+SNAPSHOT_ATTRIBUTE = "wtpython_trace"
+MAX_RESULTS = 3  # Questions shown per error in the terminal summary
+
+
+def pytest_addoption(parser: Any) -> None:
+    """Add the wtpython options."""
+    group = parser.getgroup("wtpython", "look up the errors of failing tests")
+    group.addoption(
+        "--wtpython",
+        action="store_true",
+        default=False,
+        help="Search for solutions to the errors of failing tests",
+    )
+    group.addoption(
+        "--wtpython-source",
+        action="append",
+        metavar="NAME[:ARG]",
+        help="Knowledge source to search, can be repeated (default: the wtpython defaults)",
+    )
+    group.addoption(
+        "--wtpython-deadline",
+        type=float,
+        default=None,
+        help="Seconds to wait for knowledge sources",
+    )
+    group.addoption(
+        "--wtpython-tui",
+        action="store_true",
+        default=False,
+        help="Open the wtpython TUI for the errors after the tests, most common first",
+    )
+
+
+def pytest_configure(config: Any) -> None:
+    """Register the collector of failures when the plugin is enabled."""
+    if config.getoption("wtpython"):
+        from wtpython.metrics import configure
+        from wtpython.settings import METRICS_FILE, STATSD_ADDRESS
+        configure(METRICS_FILE, STATSD_ADDRESS)
+        config.pluginmanager.register(FailureCollector(config), "wtpython-collector")
+
+
+class FailureCollector:
+    """Record failures during the session and look them up at the end."""
+
+    def __init__(self, config: Any) -> None:
+        self.config = config
+        self.failures: dict[str, list[tuple[str, dict]]] = defaultdict(list)
+
+    @property
+    def is_worker(self) -> bool:
+        """Whether this is a pytest-xdist worker, which leaves the lookup to the controller."""
+        return hasattr(self.config, "workerinput")
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_makereport(self, item: Any, call: Any) -> Generator[None, Any, None]:
+        """Attach a snapshot of the exception to reports of failures."""
+        outcome = yield
+        report = outcome.get_result()
+        if not report.failed or call.excinfo is None or not isinstance(call.excinfo.value, Exception):
+            return
+
+        from wtpython.backends.trace import Trace
+        setattr(report, SNAPSHOT_ATTRIBUTE, Trace(call.excinfo.value).snapshot())
+
+    def pytest_runtest_logreport(self, report: Any) -> None:
+        """Collect snapshots, including those of reports sent by xdist workers."""
+        snapshot: Optional[dict] = getattr(report, SNAPSHOT_ATTRIBUTE, None)
+        if snapshot is not None and not self.is_worker:
+            self.failures[snapshot["signature"]].append((report.nodeid, snapshot))
+
+    def pytest_terminal_summary(self, terminalreporter: Any) -> None:
+        """Look up every distinct error and show the results."""
+        if self.is_worker or not self.failures:
+            return
+
+        from wtpython.backends import Trace, create_backends
+        from wtpython.backends.results import gather_all
+        from wtpython.settings import BACKEND_DEADLINE, BACKENDS
+
+        specs = self.config.getoption("wtpython_source") or BACKENDS
+        deadline = self.config.getoption("wtpython_deadline") or BACKEND_DEADLINE
+        try:
+            backends = create_backends(specs)
+        except ValueError as e:
+            raise pytest.UsageError(str(e))
+
+        groups = sorted(self.failures.values(), key=len, reverse=True)
+        traces = [Trace.from_snapshot(failures[0][1]) for failures in groups]
+        all_results = gather_all(traces, backends, deadline=deadline)
+
+        terminalreporter.write_sep("=", "wtpython")
+        for failures, trace, results in zip(groups, traces, all_results):
+            tests = "1 test" if len(failures) == 1 else f"{len(failures)} tests"
+            terminalreporter.write_line("")
+            terminalreporter.write_line(f"{trace.error} ({tests})", bold=True, red=True)
+            for nodeid, _ in failures:
+                terminalreporter.write_line(f"  {nodeid}")
+            if not results:
+                terminalreporter.write_line(f"  No results, search: {results.active_url}")
+            for question in results.questions[:MAX_RESULTS]:
+                terminalreporter.write_line(f"  #{question.ix + 1} {question.source_label}{question.title}")
+                terminalreporter.write_line(f"     {question.url}")
+            if results.timed_out:
+                terminalreporter.write_line(f"  Sources that missed the deadline: {', '.join(results.timed_out)}")
+            if results.errors:
+                terminalreporter.write_line(f"  Sources that failed: {', '.join(sorted(results.errors))}")
+
+        if self.config.getoption("wtpython_tui"):
+            self.open_tui(groups, traces, all_results)
+
+    def open_tui(self, groups: list, traces: list, all_results: list) -> None:
+        """Show the results for all errors in the TUI, one tab per error."""
+        from wtpython.backends import ErrorSession
+        from wtpython.displays import TextualDisplay
+
+        sessions = [
+            ErrorSession(trace, results=results, title=f"{trace.error} ({len(failures)})")
+            for failures, trace, results in zip(groups, traces, all_results)
+        ]
+        capture = self.config.pluginmanager.getplugin("capturemanager")
+        with capture.global_and_fixture_disabled():
+            TextualDisplay.run(sessions=sessions)
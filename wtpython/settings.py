@@ -1,4 +1,5 @@
 """Default settings for wtpython."""
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -8,5 +9,40 @@ GH_ISSUES = "https://github.com/what-the-python/wtpython/issues"
 SO_MAX_RESULTS = 10
 SEARCH_ENGINE = 'Google'
 
+# Knowledge backends searched in parallel, see `wtpython.backends.knowledge`
+BACKENDS = ['docs', 'stackoverflow']
+BACKEND_DEADLINE = 5.0  # Seconds to wait for backends before dropping them
+MAX_CHAIN_LINKS = 4  # Errors of an exception chain searched for, see `Trace.chain`
+OFFLINE_INDEX_LOCATION = Path.home() / Path(".wtpython_index.json")
+KNOWLEDGE_BASE_URL = "http://127.0.0.1:8765/search"
+EXCEPTION_INDEX_LOCATION = BASE_DIR / "data" / "exception_index.json"  # Built by build.py
+COMMON_ERRORS_LOCATION = BASE_DIR / "data" / "common_errors.txt"  # Used by `wtpython cache warm`
+
 REQUEST_CACHE_LOCATION = Path.home() / Path(".wtpython_cache")
 REQUEST_CACHE_DURATION = 60 * 60 * 24   # One day (in seconds)
+# Expired results are shown while they are refreshed, 0 waits for fresh results instead
+REQUEST_CACHE_STALE_DURATION = float(os.environ.get("WTPYTHON_CACHE_STALE_DURATION") or 60 * 60 * 24 * 30)
+REQUEST_HEDGE_DELAY = 1.5  # Seconds before a slow request is sent again, until response times are known
+SE_MAX_REQUESTS_PER_SECOND = 25  # Stack Exchange throttles clients above 30
+
+BODY_CACHE_BLOCKS = 256  # Rendered markdown blocks kept by the body view
+HIGHLIGHT_CACHE_BLOCKS = 512  # Highlighted code blocks kept in memory, see `wtpython.displays.highlight`
+HIGHLIGHT_CACHE_LOCATION = REQUEST_CACHE_LOCATION / "highlight"  # None keeps them in memory only
+HIGHLIGHT_CACHE_DURATION = 60 * 60 * 24 * 30  # Stored code blocks are highlighted again after a month
+HIGHLIGHT_CACHE_STORED_BLOCKS = 4096  # Highlighted code blocks kept in the store, the oldest are removed
+FRAME_RATE = 60  # Maximum number of TUI updates per second, faster input is coalesced
+WATCH_INTERVAL = 0.5  # Seconds between checks for changed files in watch mode
+TUI_PREFETCH = 1  # Errors after the shown one looked up in the background when the TUI shows several
+
+# Metrics export, see `wtpython.metrics`
+METRICS_FILE = os.environ.get("WTPYTHON_METRICS_FILE")  # OpenMetrics text file written on exit
+STATSD_ADDRESS = os.environ.get("WTPYTHON_STATSD")  # host:port of a statsd daemon
+
+# Clustering of tracebacks from logs, see `wtpython.cluster`
+CLUSTER_PERMUTATIONS = 64  # MinHash functions per sketch
+CLUSTER_BANDS = 16  # LSH bands; with 4 rows each, sketches ~50% similar become candidates
+CLUSTER_SIMILARITY = 0.6  # Estimated Jaccard similarity for tracebacks to be grouped
+CLUSTER_BATCH = 4096  # Tracebacks sketched at a time, bounds memory use
+
+# History of errors and their solutions, see `wtpython.history`
+HISTORY_LOCATION = Path(os.environ.get("WTPYTHON_HISTORY") or Path.home() / ".wtpython_history")  # Can be shared
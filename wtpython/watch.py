@@ -0,0 +1,244 @@
+"""Run a script again whenever it or its local modules change.
+
+`wtpython --watch script.py` keeps wtpython and its interface running.
+Every run happens in a fresh child process, so changed modules are always
+imported again, and the child reports which local modules the script
+imported so they are watched too. Files are polled for changes every
+WATCH_INTERVAL seconds.
+
+When a run raises the same error as the previous run, judged by
+`Trace.signature`, the lookup is skipped and the interface is left as it
+is. A run without errors is shown right away, since there is nothing to
+look up. A run that exits with a non-zero status without raising an
+error, e.g. `sys.exit(1)` or a crash of the interpreter, is a failure.
+"""
+from __future__ import annotations
+
+import io
+import multiprocessing
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Optional, Sequence
+
+from rich.traceback import Trace as RichTrace
+
+from wtpython.backends import KnowledgeBackend, Results, SearchEngine, Trace
+from wtpython.backends.trace import PACKAGE_DIRS, DetachedTrace
+from wtpython.settings import BACKEND_DEADLINE
+
+MAX_OUTPUT = 64 * 1024  # Characters of the script's output kept per run
+
+
+class RunResult(NamedTuple):
+    """What a run in the child process sends back."""
+
+    snapshot: Optional[dict]
+    traceback: str
+    rich_trace: Optional[RichTrace]
+    files: list[str]
+    output: str
+    exit_code: int = 0
+
+
+class WatchUpdate(NamedTuple):
+    """A run whose outcome differs from the previous one."""
+
+    trace: Optional[Trace]
+    results: Results
+    search_engine: Optional[SearchEngine]
+    output: str
+    exit_code: int = 0
+
+    @property
+    def fixed(self) -> bool:
+        """Whether the script ran without errors."""
+        return self.trace is None and self.exit_code == 0
+
+    @property
+    def exit_status(self) -> str:
+        """How the script exited, e.g. `exit status 1` or `signal 9`."""
+        if self.exit_code < 0:
+            return f"signal {-self.exit_code}"
+        return f"exit status {self.exit_code}"
+
+
+def local_files(root: Path) -> list[str]:
+    """Files of the imported modules that belong to the user's project.
+
+    Args:
+        root: The directory of the script.
+
+    Returns:
+        The paths of modules inside `root` that are not installed packages.
+    """
+    files = []
+    for module in list(sys.modules.values()):
+        filename = getattr(module, "__file__", None)
+        if not filename:
+            continue
+        path = Path(filename).resolve()
+        if root in path.parents and not PACKAGE_DIRS & set(path.parts):
+            files.append(str(path))
+    return files
+
+
+class _Output(io.StringIO):
+    """Output of the script, keeping only the last MAX_OUTPUT characters."""
+
+    def getvalue(self) -> str:
+        """Return the end of the output."""
+        return super().getvalue()[-MAX_OUTPUT:]
+
+
+def _child(args: list[str], connection: Any) -> None:
+    """Run the script and send a `RunResult` back."""
+    from wtpython.__main__ import run
+
+    script = Path(args[0]).resolve()
+    sys.path.insert(0, str(script.parent))  # As `python script.py` does
+    output = _Output()
+    trace = None
+    exit_code = 0
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            trace = run(args)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:  # Printed like the interpreter does
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+
+    files = [str(script), *local_files(script.parent)]
+    if trace is None:
+        connection.send(RunResult(None, "", None, files, output.getvalue(), exit_code))
+    else:
+        connection.send(RunResult(
+            trace.snapshot(), trace.traceback, trace.rich_traceback.trace, files, output.getvalue()
+        ))
+    connection.close()
+
+
+def run_in_child(args: list[str]) -> RunResult:
+    """Run a script in a fresh Python process.
+
+    Args:
+        args: The script and its arguments.
+
+    Returns:
+        The error raised by the script, if any, the local files it imported,
+        its output and its exit status, negative if it was killed by a signal.
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(args, sender), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        result: Optional[RunResult] = receiver.recv()
+    except EOFError:  # The child died without reporting, e.g. os._exit() or a segfault
+        result = None
+    finally:
+        receiver.close()
+        process.join()
+    if result is None:
+        exit_code = 1 if process.exitcode is None else process.exitcode
+        result = RunResult(None, "", None, [str(Path(args[0]).resolve())], "", exit_code)
+    return result
+
+
+class FileWatcher:
+    """Detect changes to files by polling their modification times."""
+
+    def __init__(self, paths: Iterable[str]) -> None:
+        self.mtimes = self.scan(paths)
+
+    @staticmethod
+    def scan(paths: Iterable[str]) -> dict[str, Optional[int]]:
+        """Modification times of files, None for missing files."""
+        mtimes: dict[str, Optional[int]] = {}
+        for path in paths:
+            try:
+                mtimes[path] = Path(path).stat().st_mtime_ns
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    def watch(self, paths: Iterable[str], baseline: dict[str, Optional[int]]) -> None:
+        """Watch other files.
+
+        Args:
+            paths: The files to watch.
+            baseline: Modification times taken before the files were last
+                used. Files missing from it are compared with their current
+                modification time.
+
+        Returns:
+            None
+        """
+        paths = list(paths)
+        self.mtimes = {**self.scan(paths), **{path: baseline[path] for path in paths if path in baseline}}
+
+    def changed(self) -> bool:
+        """Whether any file changed since the last call."""
+        mtimes = self.scan(self.mtimes)
+        if mtimes == self.mtimes:
+            return False
+        self.mtimes = mtimes
+        return True
+
+
+class WatchSession:
+    """Runs of a script and the results for their errors."""
+
+    def __init__(
+        self, args: list[str], backends: Sequence[KnowledgeBackend], deadline: float = BACKEND_DEADLINE
+    ) -> None:
+        """Prepare to watch a script.
+
+        Args:
+            args: The script and its arguments.
+            backends: The backends to search for errors.
+            deadline: Seconds to wait for backends.
+
+        Returns:
+            None
+        """
+        self.args = args
+        self.backends = backends
+        self.deadline = deadline
+        self.watcher = FileWatcher([str(Path(args[0]).resolve())])
+        self.signature: Optional[str] = None  # "" after a run without errors, "exit N" after a failed exit
+        self.runs = 0
+
+    def changed(self) -> bool:
+        """Whether the script or one of its local modules changed."""
+        return self.watcher.changed()
+
+    def rerun(self) -> Optional[WatchUpdate]:
+        """Run the script and look up its error if it is a new one.
+
+        Returns:
+            The outcome of the run, or None if it raised the same error as
+            the previous run, again exited with the same status or again ran
+            without errors.
+        """
+        baseline = self.watcher.scan(self.watcher.mtimes)
+        result = run_in_child(self.args)
+        self.watcher.watch(result.files, baseline)
+        self.runs += 1
+
+        if result.snapshot is not None:
+            signature = result.snapshot["signature"]
+        else:
+            signature = f"exit {result.exit_code}" if result.exit_code else ""
+        if signature == self.signature:
+            return None
+        self.signature = signature
+
+        if result.snapshot is None:
+            return WatchUpdate(None, Results(), None, result.output, result.exit_code)
+        trace = DetachedTrace.from_parts(result.snapshot, result.traceback, result.rich_trace)
+        results = Results.gather(trace, self.backends, deadline=self.deadline)
+        return WatchUpdate(trace, results, SearchEngine(trace), result.output)